@@ -0,0 +1,72 @@
+"""
+Benchmark of the first query after restart: parsing the configuration vs. loading the saved index.
+Run from the root of the repo: python benchmarks/bench_index_restart.py
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config_handler import XpathConstructor  # noqa: E402
+from xml_parser_cache import ConfigCache  # noqa: E402
+
+CARD_COUNT: int = 50
+PORTS_PER_CARD: int = 1000
+TEST_QUERY: list = [{'name': 'card', 'filters': [{'filter_path': 'slot-number', 'regexp': ''}]},
+                    {'name': 'port', 'filters': [{'filter_path': 'port-id', 'regexp': ''},
+                                                 {'filter_path': 'description', 'regexp': 'uplink'}]}]
+
+
+def write_config(config_file: Path) -> None:
+    """
+    Write configuration with cards and ports
+    :param config_file: Path to the configuration file
+    """
+    with config_file.open("w") as config:
+        config.write('<configure xmlns="urn:nokia.com:sros:ns:yang:sr:conf">\n')
+        for card in range(1, CARD_COUNT + 1):
+            config.write(f"    <card>\n        <slot-number>{card}</slot-number>\n")
+            for port in range(1, PORTS_PER_CARD + 1):
+                config.write(f"        <port>\n            <port-id>{card}/1/{port}</port-id>\n"
+                             f"            <admin-state>enable</admin-state>\n"
+                             f"            <description>{'uplink' if port % 100 == 0 else 'access'} port</description>\n"
+                             f"            <ethernet>\n                <mtu>9212</mtu>\n            </ethernet>\n"
+                             f"        </port>\n")
+            config.write("    </card>\n")
+        config.write("</configure>\n")
+
+
+def run_first_query(cache: ConfigCache, config_file: Path, parsed_xpath: list) -> tuple[float, list, str]:
+    """
+    Load the configuration into an empty cache and run the query
+    :return: Tuple (elapsed time, results, name of the query engine)
+    """
+    start: float = time.perf_counter()
+    config_handler = cache.get_config_handler(config_file)
+    results: list = config_handler.process_query_pipeline(parsed_xpath)
+    return time.perf_counter() - start, results, type(config_handler).__name__
+
+
+def run_benchmark() -> None:
+    with tempfile.TemporaryDirectory() as work_dir:
+        config_file: Path = Path(work_dir) / "big_config.xml"
+        index_dir: Path = Path(work_dir) / "index"
+        write_config(config_file)
+        parsed_xpath: list = XpathConstructor(TEST_QUERY).convert_xpath_to_dataclass()
+        print(f"Configuration size: {config_file.stat().st_size / 1024 / 1024:.1f} MB")
+
+        elapsed, expected_results, engine = run_first_query(ConfigCache(1, 0, 1), config_file, parsed_xpath)
+        print(f"{'no index':>22}: {elapsed:.3f} s ({engine})")
+        elapsed, results, engine = run_first_query(ConfigCache(1, 0, 1, index_dir), config_file, parsed_xpath)
+        assert results == expected_results
+        index_size: int = sum(index_file.stat().st_size for index_file in index_dir.iterdir())
+        print(f"{'parse and save index':>22}: {elapsed:.3f} s ({engine}), index {index_size / 1024 / 1024:.1f} MB")
+        # New cache emulates restart of the service
+        elapsed, results, engine = run_first_query(ConfigCache(1, 0, 1, index_dir), config_file, parsed_xpath)
+        assert results == expected_results
+        print(f"{'restart with index':>22}: {elapsed:.3f} s ({engine}), {len(results)} matches")
+
+
+if __name__ == "__main__":
+    run_benchmark()
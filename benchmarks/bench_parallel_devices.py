@@ -0,0 +1,87 @@
+"""
+Benchmark of the multi-device query: single worker vs. pools of threads and processes (cold configuration cache).
+Run from the root of the repo: python benchmarks/bench_parallel_devices.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config_handler import XpathConstructor  # noqa: E402
+from main import run_query_to_device  # noqa: E402
+from xml_parser_cache import config_cache  # noqa: E402
+from xml_parser_executor import BoundedExecutor, DeviceQueryLimiter  # noqa: E402
+
+DEVICE_COUNT: int = 120
+CARD_COUNT: int = 8
+PORTS_PER_CARD: int = 60
+WORKERS: int = os.cpu_count() or 1
+TEST_QUERY: list = [{'name': 'card', 'filters': [{'filter_path': 'slot-number', 'regexp': ''}]},
+                    {'name': 'port', 'filters': [{'filter_path': 'port-id', 'regexp': ''},
+                                                 {'filter_path': 'description', 'regexp': 'uplink'}]}]
+
+
+def write_config(config_file: Path, device_id: int) -> None:
+    """
+    Write configuration with cards and ports of a single device
+    :param config_file: Path to the configuration file
+    :param device_id: Number of the device
+    """
+    cards: str = "".join(
+        f"<card><slot-number>{card}</slot-number>" +
+        "".join(f"<port><port-id>{card}/1/{port}</port-id><admin-state>enable</admin-state>"
+                f"<description>{'uplink' if port % 10 == 0 else 'access'} port of r{device_id}</description></port>"
+                for port in range(1, PORTS_PER_CARD + 1)) +
+        "</card>" for card in range(1, CARD_COUNT + 1))
+    config_file.write_text(f'<configure xmlns="urn:nokia.com:sros:ns:yang:sr:conf">{cards}</configure>')
+
+
+async def run_device_queries(executor: BoundedExecutor, device_list: list, parsed_xpath: list) -> list:
+    """
+    Run the query to every device in the pool
+    :param executor: Pool of threads or processes
+    :param device_list: List of devices
+    :param parsed_xpath: Parsed representation of the query
+    :return: List of tuples (device name, result of the query)
+    """
+    async def query_device(device_name: str) -> list:
+        return await executor.run(run_query_to_device, parsed_xpath, device_name)
+
+    limiter: DeviceQueryLimiter = DeviceQueryLimiter(max_concurrency=executor.max_workers)
+    return [device_result async for device_result in limiter.run_device_queries(query_device, device_list)]
+
+
+def run_benchmark() -> None:
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        Path("configurations").mkdir()
+        device_list: list = [f"r{device_id}.xml" for device_id in range(DEVICE_COUNT)]
+        for device_id, device_name in enumerate(device_list):
+            write_config(Path("configurations") / device_name, device_id)
+
+        executors: dict = {
+            "single worker": BoundedExecutor(max_workers=1),
+            f"threads x{WORKERS}": BoundedExecutor(max_workers=WORKERS),
+            f"processes x{WORKERS}": BoundedExecutor(max_workers=WORKERS, use_processes=True),
+        }
+        print(f"{DEVICE_COUNT} devices, {CARD_COUNT * PORTS_PER_CARD} ports per device, {os.cpu_count()} CPUs")
+        parsed_xpath: list = XpathConstructor(TEST_QUERY).convert_xpath_to_dataclass()
+        serial_time: float = 0
+        serial_results: list = list()
+        for executor_name, executor in executors.items():
+            config_cache.clear()
+            start: float = time.perf_counter()
+            results: list = asyncio.run(run_device_queries(executor, device_list, parsed_xpath))
+            elapsed: float = time.perf_counter() - start
+            executor.shutdown()
+            serial_time = serial_time or elapsed
+            serial_results = serial_results or results
+            assert results == serial_results
+            print(f"{executor_name:>16}: {elapsed:.3f} s, speedup {serial_time / elapsed:.1f}x")
+
+
+if __name__ == "__main__":
+    run_benchmark()
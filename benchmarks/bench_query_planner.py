@@ -0,0 +1,68 @@
+"""
+Benchmark of the XPath query: a re:match predicate per filter vs. the planned query (native XPath predicates,
+no-op filters dropped, predicates ordered by static strategy cost), on the test queries of the benchmark suite.
+Run from the root of the repo: python benchmarks/bench_query_planner.py
+"""
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import lxml.etree as ET
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bench_suite import PARSE_SHAPES, QUERY_SHAPE, TEST_QUERIES  # noqa: E402
+from config_generator import write_config  # noqa: E402
+from config_handler import XMLRoot, ConfigHandler, XpathConstructor  # noqa: E402
+
+REPEATS: int = 7
+
+
+def legacy_xpath(config: ConfigHandler, parsed_xpath: list) -> str:
+    """
+    Implementation of convert_xpath_to_string before the query planner
+    """
+    xpath_steps: list[str] = list()
+    for elem in parsed_xpath:
+        xpath_step: str = config.namespace_prefix + elem.name
+        for fltr in elem.filters:
+            filter_path: str = config.prepend_namespace(fltr.filter_path) if fltr.is_a_path else fltr.filter_path
+            xpath_step += f'[re:match({filter_path}, "{fltr.regexp}")]'
+        xpath_steps.append(xpath_step)
+    return "/".join(xpath_steps)
+
+
+def measure(query: ET.XPath, xml_root: ET._ElementTree) -> float:
+    """
+    Get median time of the query in milliseconds
+    """
+    timings: list[float] = list()
+    for _ in range(REPEATS):
+        start: float = time.perf_counter()
+        query(xml_root)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def run_benchmark() -> None:
+    with tempfile.TemporaryDirectory() as work_dir:
+        config_file: Path = Path(work_dir) / "config.xml"
+        write_config(config_file, PARSE_SHAPES[QUERY_SHAPE])
+        config: ConfigHandler = ConfigHandler(XMLRoot(config_file).xml_root)
+    for query_name, query in TEST_QUERIES.items():
+        parsed_xpath: list = XpathConstructor(query).convert_xpath_to_dataclass()
+        legacy_query: ET.XPath = ET.XPath(legacy_xpath(config, parsed_xpath), namespaces=config.namespace_map)
+        planned_query: ET.XPath = ET.XPath(config.convert_xpath_to_string(parsed_xpath),
+                                           namespaces=config.namespace_map)
+        matches: list = planned_query(config.xml_root)
+        assert legacy_query(config.xml_root) == matches
+        query_plan = config.explain_query(parsed_xpath)
+        print(f"{query_name:>18}: re:match {measure(legacy_query, config.xml_root):.2f} ms, "
+              f"planned {measure(planned_query, config.xml_root):.2f} ms, {len(matches)} matches, "
+              f"estimated cost {query_plan.estimated_cost:.0f}")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,86 @@
+"""
+Benchmark of ConfigHandler.process_query_pipeline: indexed queries from the root (the pipeline before the relative
+queries) vs. queries relative to result nodes.
+Run from the root of the repo: python benchmarks/bench_relative_queries.py
+"""
+import sys
+import time
+from pathlib import Path
+
+import lxml.etree as ET
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config_handler import ConfigHandler, XpathConstructor  # noqa: E402
+import xml_parser_dc as dc  # noqa: E402
+
+CARD_COUNT: int = 10
+PORTS_PER_CARD: list[int] = [50, 100, 200, 400]
+TEST_QUERY: list = [{'name': 'card', 'filters': [{'filter_path': 'slot-number', 'regexp': ''}]},
+                    {'name': 'port', 'filters': [{'filter_path': 'port-id', 'regexp': ''},
+                                                 {'filter_path': 'admin-state', 'regexp': ''},
+                                                 {'filter_path': 'description', 'regexp': 'port'}]}]
+
+
+def build_config(ports_per_card: int) -> ET._ElementTree:
+    """
+    Build configuration with cards and ports
+    :param ports_per_card: Number of <port> elements in every card
+    :return: Parsed configuration
+    """
+    cards: str = "".join(
+        f"<card><slot-number>{card}</slot-number>" +
+        "".join(f"<port><port-id>{card}/1/{port}</port-id><admin-state>enable</admin-state>"
+                f"<description>port {port}</description></port>" for port in range(1, ports_per_card + 1)) +
+        "</card>" for card in range(1, CARD_COUNT + 1))
+    return ET.ElementTree(ET.fromstring(f'<configure xmlns="urn:nokia.com:sros:ns:yang:sr:conf">{cards}</configure>'))
+
+
+
+def legacy_query_pipeline(config: ConfigHandler, parsed_xpath: list) -> list:
+    """
+    Implementation of process_query_pipeline before the relative queries: positions of the ancestors among their
+    siblings are indexed, then every value is read with an explicit indexed query from the root of the document
+    """
+    sibling_positions: dict = dict()
+    result_list: list = list()
+    for node in config.run_xpath_query(config.convert_xpath_to_string(parsed_xpath)):
+        result_items: list = list()
+        root_path: str = ""
+        idx_root_path: str = ""
+        for path_element, ancestor in zip(parsed_xpath, [node, *node.iterancestors()][-2::-1]):
+            if ancestor not in sibling_positions:
+                sibling_positions.update({child: idx for idx, child in
+                                          enumerate(ancestor.getparent().iterchildren(ancestor.tag), 1)})
+            root_path += f"{path_element.name}/"
+            idx_root_path += f"{path_element.name}[{sibling_positions[ancestor]}]/"
+            for fltr in path_element.filters:
+                values: list = config.run_xpath_query(config.prepend_namespace(
+                    idx_root_path + fltr.filter_path if fltr.is_a_path else idx_root_path), use_cache=False)
+                if len(values) == 1:
+                    result_items.append(dc.ResultItem(
+                        path_attribute=root_path + fltr.filter_path if fltr.is_a_path else root_path,
+                        value=values[0].text))
+        result_list.append(result_items)
+    return result_list
+
+def run_benchmark() -> None:
+    parsed_xpath: list = XpathConstructor(TEST_QUERY).convert_xpath_to_dataclass()
+    print(f"{'matches':>10} {'indexed, s':>12} {'relative, s':>12} {'speedup':>10}")
+    for ports_per_card in PORTS_PER_CARD:
+        xml_root: ET._ElementTree = build_config(ports_per_card)
+
+        start: float = time.perf_counter()
+        indexed_results: list = legacy_query_pipeline(ConfigHandler(xml_root), parsed_xpath)
+        indexed_time: float = time.perf_counter() - start
+
+        start = time.perf_counter()
+        relative_results: list = ConfigHandler(xml_root).process_query_pipeline(parsed_xpath)
+        relative_time: float = time.perf_counter() - start
+
+        assert indexed_results == relative_results
+        print(f"{len(relative_results):>10} {indexed_time:>12.4f} {relative_time:>12.4f} "
+              f"{indexed_time / relative_time:>9.1f}x")
+
+
+if __name__ == "__main__":
+    run_benchmark()
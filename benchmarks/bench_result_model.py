@@ -0,0 +1,113 @@
+"""
+Benchmark of the per-match structures of the query pipeline: pydantic models (previous implementation)
+vs. slotted dataclasses. For 10k matches the script reproduces the work done per match by the pipeline
+(copy of the path with sibling indexes, copy of the filters with indexed queries, result items)
+and reports time and memory blocks allocated for the results.
+Run from the root of the repo: python benchmarks/bench_result_model.py
+"""
+import sys
+import time
+import tracemalloc
+from dataclasses import replace
+from pathlib import Path
+from typing import Any, Callable
+
+from pydantic import BaseModel
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import xml_parser_dc as dc  # noqa: E402
+from config_handler import XpathConstructor  # noqa: E402
+
+MATCH_COUNT: int = 10000
+TEST_QUERY: list = [{'name': 'card', 'filters': [{'filter_path': 'slot-number', 'regexp': ''}]},
+                    {'name': 'mda', 'filters': [{'filter_path': 'mda-slot', 'regexp': ''}]},
+                    {'name': 'port', 'filters': [{'filter_path': 'port-id', 'regexp': ''},
+                                                 {'filter_path': 'description', 'regexp': 'uplink'}]}]
+
+
+class LegacyFilterElement(BaseModel):
+    filter_path: str
+    regexp: str
+    is_a_path: bool = True
+    indexed_query: str | None
+    unindexed_path: str | None
+
+
+class LegacyPathElement(BaseModel):
+    name: str
+    sibling_id: int | None
+    filters: list[LegacyFilterElement] = list()
+    indexed_path: str | None
+
+
+class LegacyResultItem(BaseModel):
+    path_attribute: str = ""
+    value: Any = None
+
+
+def run_pydantic(parsed_xpath: list) -> list:
+    """
+    Per-match work of the pipeline with pydantic models
+    :param parsed_xpath: Parsed query as a list of LegacyPathElement
+    :return: Results of all matches
+    """
+    results: list = list()
+    for match_id in range(MATCH_COUNT):
+        indexed_path: list = [path_element.copy(update={"sibling_id": match_id + 1}) for path_element in parsed_xpath]
+        queries: list = [fltr.copy(update={"indexed_query": f"{path_element.name}[{path_element.sibling_id}]",
+                                           "unindexed_path": path_element.name})
+                         for path_element in indexed_path for fltr in path_element.filters]
+        results.append([LegacyResultItem(path_attribute=query.unindexed_path, value=str(match_id))
+                        for query in queries])
+    return results
+
+
+def run_dataclasses(parsed_xpath: list) -> list:
+    """
+    Per-match work of the pipeline with slotted dataclasses
+    :param parsed_xpath: Parsed query as a list of PathElement
+    :return: Results of all matches
+    """
+    results: list = list()
+    for match_id in range(MATCH_COUNT):
+        indexed_path: list = [replace(path_element, sibling_id=match_id + 1) for path_element in parsed_xpath]
+        queries: list = [replace(fltr, indexed_query=f"{path_element.name}[{path_element.sibling_id}]",
+                                 unindexed_path=path_element.name)
+                         for path_element in indexed_path for fltr in path_element.filters]
+        results.append([dc.ResultItem(path_attribute=query.unindexed_path, value=str(match_id))
+                        for query in queries])
+    return results
+
+
+def measure(name: str, run: Callable[[list], list], parsed_xpath: list) -> None:
+    """
+    Print time and memory blocks held by the results
+    :param name: Name of the implementation
+    :param run: Function doing the per-match work
+    :param parsed_xpath: Parsed query
+    """
+    start: float = time.perf_counter()
+    run(parsed_xpath)
+    elapsed: float = time.perf_counter() - start
+    tracemalloc.start()
+    results: list = run(parsed_xpath)
+    snapshot: tracemalloc.Snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks: int = sum(stat.count for stat in snapshot.statistics("filename"))
+    size: int = sum(stat.size for stat in snapshot.statistics("filename"))
+    print(f"{name:>12}: {elapsed * 1000:.1f} ms, {blocks} memory blocks ({size / 1024 / 1024:.1f} MB) "
+          f"held by {len(results)} results")
+
+
+def run_benchmark() -> None:
+    parsed_xpath: list = XpathConstructor(TEST_QUERY).convert_xpath_to_dataclass()
+    legacy_xpath: list = [LegacyPathElement(name=path_element.name, filters=[
+        LegacyFilterElement(filter_path=fltr.filter_path, regexp=fltr.regexp) for fltr in path_element.filters])
+        for path_element in parsed_xpath]
+    print(f"{MATCH_COUNT} matches, {sum(len(path_element.filters) for path_element in parsed_xpath)} values per match")
+    measure("pydantic", run_pydantic, legacy_xpath)
+    measure("dataclasses", run_dataclasses, parsed_xpath)
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,96 @@
+"""
+Benchmark of peak memory and time: parsed tree (ConfigHandler) vs. streaming engine (StreamingConfigHandler).
+Two layouts: flat (100k ports at the top level) and nested (SR OS-style, all services under one <service> element,
+the query selects cards). Every engine runs in a separate process, peak resident memory of the process is reported
+(Linux only).
+Run from the root of the repo: python benchmarks/bench_streaming_memory.py
+"""
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config_generator import ConfigShape, write_config as write_nested_config  # noqa: E402
+from config_handler import XMLRoot, ConfigHandler, XpathConstructor  # noqa: E402
+from streaming_handler import StreamingConfigHandler  # noqa: E402
+
+CARD_COUNT: int = 100
+PORTS_PER_CARD: int = 1000
+NESTED_SHAPE: ConfigShape = ConfigShape(cards=16, mdas=4, ports=8, services=8000, saps=8, profiles=10, fanout=20)
+FLAT_QUERY: list = [{'name': 'card', 'filters': [{'filter_path': 'slot-number', 'regexp': ''}]},
+                    {'name': 'port', 'filters': [{'filter_path': 'port-id', 'regexp': ''},
+                                                 {'filter_path': 'description', 'regexp': 'uplink'}]}]
+NESTED_QUERY: list = [{'name': 'card', 'filters': [{'filter_path': 'slot-number', 'regexp': ''}]},
+                      {'name': 'mda', 'filters': [{'filter_path': 'mda-type', 'regexp': ''}]}]
+LAYOUTS: dict[str, list] = {"flat": FLAT_QUERY, "nested": NESTED_QUERY}
+
+
+def write_config(config_file: Path) -> None:
+    """
+    Write configuration with cards and ports
+    :param config_file: Path to the configuration file
+    """
+    with config_file.open("w") as config:
+        config.write('<configure xmlns="urn:nokia.com:sros:ns:yang:sr:conf">\n')
+        for card in range(1, CARD_COUNT + 1):
+            config.write(f"    <card>\n        <slot-number>{card}</slot-number>\n")
+            for port in range(1, PORTS_PER_CARD + 1):
+                config.write(f"        <port>\n            <port-id>{card}/1/{port}</port-id>\n"
+                             f"            <admin-state>enable</admin-state>\n"
+                             f"            <description>{'uplink' if port % 100 == 0 else 'access'} port</description>\n"
+                             f"            <ethernet>\n                <mtu>9212</mtu>\n            </ethernet>\n"
+                             f"        </port>\n")
+            config.write("    </card>\n")
+        config.write("</configure>\n")
+
+
+def get_peak_memory() -> int:
+    """
+    Get peak resident memory of the process
+    :return: Peak resident memory in kB
+    """
+    status: dict[str, str] = dict(line.split(":", 1) for line in Path("/proc/self/status").read_text().splitlines())
+    return int(status["VmHWM"].split()[0])
+
+
+def run_engine(engine: str, layout: str, config_file: Path) -> None:
+    """
+    Run the query with one engine and print elapsed time, peak memory and number of matches
+    :param engine: "tree" or "stream"
+    :param layout: Layout of the configuration, the key of LAYOUTS
+    :param config_file: Path to the configuration file
+    """
+    parsed_xpath: list = XpathConstructor(LAYOUTS[layout]).convert_xpath_to_dataclass()
+    baseline_rss: int = get_peak_memory()
+    start: float = time.perf_counter()
+    if engine == "stream":
+        results: list = StreamingConfigHandler(config_file).process_query_pipeline(parsed_xpath)
+    else:
+        results = ConfigHandler(XMLRoot(config_file).xml_root).process_query_pipeline(parsed_xpath)
+    elapsed: float = time.perf_counter() - start
+    peak_rss: int = get_peak_memory()
+    print(f"{layout:>8} {engine:>8}: {elapsed:.2f} s, peak memory +{(peak_rss - baseline_rss) / 1024:.1f} MB, "
+          f"{len(results)} matches")
+
+
+def run_benchmark() -> None:
+    with tempfile.TemporaryDirectory() as work_dir:
+        for layout in LAYOUTS:
+            config_file: Path = Path(work_dir) / f"{layout}_config.xml"
+            if layout == "flat":
+                write_config(config_file)
+            else:
+                write_nested_config(config_file, NESTED_SHAPE)
+            print(f"{layout} configuration size: {config_file.stat().st_size / 1024 / 1024:.1f} MB")
+            for engine in ("tree", "stream"):
+                subprocess.run([sys.executable, __file__, engine, layout, str(config_file)], check=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4:
+        run_engine(sys.argv[1], sys.argv[2], Path(sys.argv[3]))
+    else:
+        run_benchmark()
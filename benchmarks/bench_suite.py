@@ -0,0 +1,246 @@
+"""
+Benchmark suite on synthetic SR OS-style configurations: parsing with XMLRoot, ConfigHandler.process_query_pipeline
+and the /xml_parser/ route under concurrency. Results are stored as JSON and compared with a baseline:
+a scenario is a regression if its median time exceeds the baseline median by more than the threshold.
+Run from the root of the repo:
+    python benchmarks/bench_suite.py --output results.json
+    python benchmarks/bench_suite.py --baseline results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable
+
+import httpx
+import lxml.etree as ET
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config_generator import ConfigShape, write_config  # noqa: E402
+from config_handler import XMLRoot, ConfigHandler, XpathConstructor  # noqa: E402
+from main import xml_parser_app  # noqa: E402
+from xml_parser_cache import config_cache, result_cache  # noqa: E402
+
+SUITE_VERSION: int = 1
+PARSE_SHAPES: dict[str, ConfigShape] = {
+    "small": ConfigShape(cards=2, mdas=1, ports=12, services=20, saps=2, profiles=5, fanout=10),
+    "medium": ConfigShape(cards=8, mdas=2, ports=24, services=500, saps=4, profiles=20, fanout=50),
+    "large": ConfigShape(cards=16, mdas=4, ports=36, services=4000, saps=8, profiles=50, fanout=200),
+}
+QUERY_SHAPE: str = "medium"
+TEST_QUERIES: dict[str, list] = {
+    "port-description": [{'name': 'port', 'filters': [{'filter_path': 'port-id', 'regexp': ''},
+                                                      {'filter_path': 'description', 'regexp': 'uplink'}]}],
+    "sap-exact": [{'name': 'service'},
+                  {'name': 'vpls', 'filters': [{'filter_path': 'service-name', 'regexp': ''}]},
+                  {'name': 'sap', 'filters': [{'filter_path': 'sap-id', 'regexp': '^1/1/1:'}]}],
+    "sap-qos": [{'name': 'service'},
+                {'name': 'vpls', 'filters': [{'filter_path': 'service-name', 'regexp': ''}]},
+                {'name': 'sap', 'filters': [{'filter_path': 'sap-id', 'regexp': ''},
+                                            {'filter_path': 'ingress/qos/sap-ingress/policy-name',
+                                             'regexp': 'qos-3'}]}],
+    "profile-entries": [{'name': 'system'}, {'name': 'security'}, {'name': 'aaa'}, {'name': 'local-profiles'},
+                        {'name': 'profile', 'filters': [{'filter_path': 'user-profile-name', 'regexp': ''}]},
+                        {'name': 'entry', 'filters': [{'filter_path': 'entry-id', 'regexp': ''},
+                                                      {'filter_path': 'match', 'regexp': '^show'}]}],
+    "filter-fanout": [{'name': 'filter'},
+                      {'name': 'ip-filter', 'filters': [{'filter_path': 'filter-name', 'regexp': ''}]},
+                      {'name': 'entry', 'filters': [{'filter_path': 'entry-id', 'regexp': ''},
+                                                    {'filter_path': 'match/protocol', 'regexp': 'tcp'}]}],
+}
+ROUTE_SHAPE: ConfigShape = ConfigShape(cards=4, mdas=2, ports=12, services=100, saps=4, profiles=10, fanout=20)
+ROUTE_DEVICES: int = 20
+ROUTE_CONCURRENCY: int = 8
+
+
+def measure(func: Callable[[], object], repeats: int, before: Callable[[], object] | None = None) -> list[float]:
+    """
+    Measure time of the function
+    :param func: Function to measure
+    :param repeats: Number of runs
+    :param before: Function run before every run and not measured, e.g. clearing caches
+    :return: List of elapsed times in seconds
+    """
+    timings: list[float] = list()
+    for _ in range(repeats):
+        if before is not None:
+            before()
+        start: float = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(timings: list[float], **extra) -> dict:
+    """
+    Get statistics of the measured times
+    :param timings: List of elapsed times in seconds
+    :param extra: Additional values of the scenario
+    :return: Dictionary with median, min and max times
+    """
+    return {"median": statistics.median(timings), "min": min(timings), "max": max(timings), "runs": len(timings),
+            **extra}
+
+
+def bench_parse(work_dir: Path, repeats: int) -> dict[str, dict]:
+    """
+    Parse configurations of every shape with XMLRoot
+    :return: Results by scenario name
+    """
+    results: dict[str, dict] = dict()
+    for shape_name, shape in PARSE_SHAPES.items():
+        config_file: Path = work_dir / f"parse_{shape_name}.xml"
+        write_config(config_file, shape)
+        size: int = config_file.stat().st_size
+        timings: list[float] = measure(lambda: XMLRoot(config_file), repeats)
+        results[f"parse/{shape_name}"] = summarize(timings, size_bytes=size,
+                                                   mb_per_second=size / statistics.median(timings) / 1024 / 1024)
+    return results
+
+
+def bench_queries(work_dir: Path, repeats: int) -> dict[str, dict]:
+    """
+    Run every test query on a parsed configuration with ConfigHandler.process_query_pipeline
+    :return: Results by scenario name
+    """
+    config_file: Path = work_dir / f"parse_{QUERY_SHAPE}.xml"
+    config_handler: ConfigHandler = ConfigHandler(XMLRoot(config_file).xml_root)
+    results: dict[str, dict] = dict()
+    for query_name, query in TEST_QUERIES.items():
+        parsed_xpath: list = XpathConstructor(query).convert_xpath_to_dataclass()
+        matches: int = len(config_handler.process_query_pipeline(parsed_xpath))
+        timings: list[float] = measure(lambda: config_handler.process_query_pipeline(parsed_xpath), repeats)
+        results[f"query/{query_name}"] = summarize(timings, matches=matches)
+    return results
+
+
+async def run_route_load(device_list: list[str], query: list, concurrency: int) -> list[float]:
+    """
+    Send concurrent API calls to the /xml_parser/ route, every call queries all devices
+    :return: List of latencies of the calls in seconds
+    """
+    async def send_request(client: httpx.AsyncClient) -> float:
+        start: float = time.perf_counter()
+        response: httpx.Response = await client.post("/xml_parser/", json={'device_list': device_list,
+                                                                           'xpath': query})
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    async with httpx.AsyncClient(app=xml_parser_app, base_url="http://bench") as client:
+        return list(await asyncio.gather(*(send_request(client) for _ in range(concurrency))))
+
+
+def bench_route(work_dir: Path, repeats: int) -> dict[str, dict]:
+    """
+    Run concurrent API calls to the /xml_parser/ route: with empty caches (every device is parsed) and with
+    parsed configurations in the cache (queries run every time, cached results are dropped)
+    :return: Results by scenario name
+    """
+    config_dir: Path = work_dir / "configurations"
+    config_dir.mkdir()
+    device_list: list[str] = [f"r{device_id}.xml" for device_id in range(1, ROUTE_DEVICES + 1)]
+    for device_id, device_name in enumerate(device_list, start=1):
+        write_config(config_dir / device_name, ROUTE_SHAPE, device_id)
+    query: list = TEST_QUERIES["port-description"]
+    results: dict[str, dict] = dict()
+    for scenario, clear_caches in (("cold", lambda: (config_cache.clear(), result_cache.clear())),
+                                   ("warm", result_cache.clear)):
+        latencies: list[float] = list()
+
+        def run_load() -> None:
+            latencies.extend(asyncio.run(run_route_load(device_list, query, ROUTE_CONCURRENCY)))
+
+        # Configurations are parsed once before the warm runs
+        run_load()
+        latencies.clear()
+        timings: list[float] = measure(run_load, repeats, clear_caches)
+        latencies.sort()
+        results[f"route/{scenario}"] = summarize(
+            timings, devices=ROUTE_DEVICES, concurrency=ROUTE_CONCURRENCY,
+            latency_p50=latencies[len(latencies) // 2], latency_p95=latencies[int(len(latencies) * 0.95)])
+    return results
+
+
+def compare_results(results: dict[str, dict], baseline: dict[str, dict], threshold: float,
+                    min_delta: float) -> list[str]:
+    """
+    Compare median times of the scenarios with the baseline
+    :param results: Results by scenario name
+    :param baseline: Baseline results by scenario name
+    :param threshold: Allowed slowdown, e.g. 0.2 for 20%
+    :param min_delta: Slowdown in seconds ignored as noise, e.g. for sub-millisecond scenarios
+    :return: List of regressions
+    """
+    regressions: list[str] = list()
+    for scenario, result in results.items():
+        if scenario not in baseline:
+            continue
+        ratio: float = result["median"] / baseline[scenario]["median"]
+        if ratio > 1 + threshold and result["median"] - baseline[scenario]["median"] > min_delta:
+            regressions.append(f"{scenario}: {baseline[scenario]['median'] * 1000:.2f} ms -> "
+                               f"{result['median'] * 1000:.2f} ms ({(ratio - 1) * 100:+.0f}%)")
+    return regressions
+
+
+def run_suite(repeats: int) -> dict:
+    """
+    Run all scenarios in a temporary directory
+    :param repeats: Number of runs of every scenario
+    :return: Results of the suite with environment description
+    """
+    current_dir: Path = Path.cwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            results: dict[str, dict] = {**bench_parse(Path(work_dir), repeats),
+                                        **bench_queries(Path(work_dir), repeats),
+                                        **bench_route(Path(work_dir), repeats)}
+        finally:
+            os.chdir(current_dir)
+    return {
+        "suite_version": SUITE_VERSION,
+        "environment": {"python": platform.python_version(), "lxml": ".".join(map(str, ET.LXML_VERSION)),
+                        "platform": platform.platform(), "cpu_count": os.cpu_count()},
+        "shapes": {**{name: asdict(shape) for name, shape in PARSE_SHAPES.items()}, "route": asdict(ROUTE_SHAPE)},
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5, help="number of runs of every scenario")
+    parser.add_argument("--output", type=Path, help="file to store results as JSON")
+    parser.add_argument("--baseline", type=Path, help="JSON results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown against the baseline")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="slowdown in ms ignored as noise")
+    arguments: argparse.Namespace = parser.parse_args()
+
+    suite: dict = run_suite(arguments.repeats)
+    for scenario, result in suite["results"].items():
+        extra: str = ", ".join(f"{key} {value:.4g}" if isinstance(value, float) else f"{key} {value}"
+                               for key, value in result.items() if key not in ("median", "min", "max", "runs"))
+        print(f"{scenario:>24}: median {result['median'] * 1000:.2f} ms, min {result['min'] * 1000:.2f} ms"
+              f"{f', {extra}' if extra else ''}")
+    if arguments.output:
+        arguments.output.write_text(json.dumps(suite, indent=2))
+    if arguments.baseline:
+        baseline: dict = json.loads(arguments.baseline.read_text())
+        regressions: list[str] = compare_results(suite["results"], baseline["results"], arguments.threshold,
+                                                 arguments.min_delta_ms / 1000)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {arguments.baseline} (threshold {arguments.threshold:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark of the selective filters over the fleet: XPATH re:match predicates vs. the value index.
+Configurations are parsed once, the value index is built by the first query (reported separately).
+Run from the root of the repo: python benchmarks/bench_value_index.py
+"""
+import sys
+import time
+from pathlib import Path
+
+import lxml.etree as ET
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config_handler import ConfigHandler, XpathConstructor  # noqa: E402
+from value_index import ValueIndex  # noqa: E402
+
+DEVICE_COUNT: int = 50
+CARD_COUNT: int = 8
+PORTS_PER_CARD: int = 120
+REPEATS: int = 5
+TEST_QUERIES: dict = {
+    "exact port-id": [{'name': 'card'}, {'name': 'port', 'filters': [{'filter_path': 'port-id', 'regexp': '^3/1/17$'},
+                                                                    {'filter_path': 'description', 'regexp': ''}]}],
+    "literal prefix": [{'name': 'card'}, {'name': 'port', 'filters': [{'filter_path': 'description',
+                                                                       'regexp': '^uplink to r1[0-9]$'}]}],
+    "literal substring": [{'name': 'card', 'filters': [{'filter_path': 'slot-number', 'regexp': ''}]},
+                          {'name': 'port', 'filters': [{'filter_path': 'port-id', 'regexp': ''},
+                                                       {'filter_path': 'description', 'regexp': 'to r7'}]}],
+}
+
+
+def build_config(device_id: int) -> ET._ElementTree:
+    """
+    Build configuration with cards and ports of a single device, one uplink per card
+    :param device_id: Number of the device
+    :return: Parsed configuration
+    """
+    cards: str = "".join(
+        f"<card><slot-number>{card}</slot-number>" +
+        "".join(f"<port><port-id>{card}/1/{port}</port-id><admin-state>enable</admin-state>"
+                f"<description>{f'uplink to r{device_id + card}' if port == 1 else f'access port {port}'}"
+                f"</description></port>" for port in range(1, PORTS_PER_CARD + 1)) +
+        "</card>" for card in range(1, CARD_COUNT + 1))
+    return ET.fromstring(f'<configure xmlns="urn:nokia.com:sros:ns:yang:sr:conf">{cards}</configure>').getroottree()
+
+
+def run_fleet_query(fleet: list[ConfigHandler], parsed_xpath: list) -> tuple[float, list]:
+    """
+    Run the query on every device of the fleet
+    :return: Tuple (elapsed time, results by device)
+    """
+    start: float = time.perf_counter()
+    results: list = [config_handler.process_query_pipeline(parsed_xpath) for config_handler in fleet]
+    return time.perf_counter() - start, results
+
+
+def run_benchmark() -> None:
+    fleet: list[ConfigHandler] = [ConfigHandler(build_config(device_id)) for device_id in range(DEVICE_COUNT)]
+    indexed_fleet: list[ConfigHandler] = [ConfigHandler(config_handler.xml_root) for config_handler in fleet]
+    for config_handler in indexed_fleet:
+        config_handler.value_index = ValueIndex()
+    print(f"{DEVICE_COUNT} devices, {CARD_COUNT * PORTS_PER_CARD} ports per device")
+    for query_name, query in TEST_QUERIES.items():
+        parsed_xpath: list = XpathConstructor(query).convert_xpath_to_dataclass()
+        build_time, _ = run_fleet_query(indexed_fleet, parsed_xpath)
+        xpath_time: float = min(run_fleet_query(fleet, parsed_xpath)[0] for _ in range(REPEATS))
+        index_time: float = min(run_fleet_query(indexed_fleet, parsed_xpath)[0] for _ in range(REPEATS))
+        _, expected_results = run_fleet_query(fleet, parsed_xpath)
+        _, results = run_fleet_query(indexed_fleet, parsed_xpath)
+        assert results == expected_results
+        matched_devices: int = sum(1 for device_results in results if device_results)
+        print(f"{query_name:>18}: xpath {xpath_time * 1000:.1f} ms, value index {index_time * 1000:.1f} ms "
+              f"(first query with build {build_time * 1000:.1f} ms), {matched_devices} devices matched")
+
+
+if __name__ == "__main__":
+    run_benchmark()
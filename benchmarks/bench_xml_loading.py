@@ -0,0 +1,96 @@
+"""
+Benchmark of loading a configuration: parse time and resident memory of the default lxml parser vs. the tuned parser
+of XMLRoot, reading into memory vs. memory-mapped file, plain vs. compressed files.
+Every mode runs in a fresh process, so the resident memory is measured per configuration (Linux only).
+Run from the root of the repo: python benchmarks/bench_xml_loading.py
+"""
+import gzip
+import lzma
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import lxml.etree as ET
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config_generator import ConfigShape, write_config  # noqa: E402
+from config_handler import XMLRoot  # noqa: E402
+import xml_parser_settings as settings  # noqa: E402
+
+CONFIG_SHAPE: ConfigShape = ConfigShape(cards=16, mdas=4, ports=36, services=4000, saps=8, profiles=50, fanout=200)
+LOAD_MODES: dict[str, str] = {
+    "default parser": "",
+    "tuned parser, file": "",
+    "tuned parser, bytes": "",
+    "tuned parser, mmap": "",
+    "tuned parser, gzip": ".gz",
+    "tuned parser, xz": ".xz",
+}
+
+
+def load_config(mode: str, config_file: Path) -> ET._ElementTree:
+    """
+    Load the configuration in the mode
+    :param mode: Name of the mode
+    :param config_file: Path to the configuration file
+    :return: Parsed configuration
+    """
+    if mode == "default parser":
+        return ET.parse(str(config_file))
+    if mode == "tuned parser, bytes":
+        return XMLRoot(config_file, config_file.read_bytes()).xml_root
+    if mode == "tuned parser, mmap":
+        settings.PARSE_MMAP = True
+        return XMLRoot(config_file, XMLRoot.read_config_file(config_file)).xml_root
+    return XMLRoot(config_file).xml_root
+
+
+def get_memory_usage() -> tuple[int, int]:
+    """
+    Get resident memory of the process
+    :return: Tuple (current, peak) in kB
+    """
+    status: dict[str, str] = dict(line.split(":", 1) for line in Path("/proc/self/status").read_text().splitlines())
+    return int(status["VmRSS"].split()[0]), int(status["VmHWM"].split()[0])
+
+
+def run_mode(mode: str, config_file: Path) -> None:
+    """
+    Load the configuration and print elapsed time, resident memory held by the parsed configuration
+    and peak resident memory while loading it, both above the baseline of the process
+    """
+    baseline, _ = get_memory_usage()
+    start: float = time.perf_counter()
+    xml_root: ET._ElementTree = load_config(mode, config_file)
+    elapsed: float = time.perf_counter() - start
+    current, peak = get_memory_usage()
+    print(f"{elapsed:.4f} {current - baseline} {peak - baseline} {sum(1 for _ in xml_root.iter())}")
+
+
+def run_benchmark() -> None:
+    with tempfile.TemporaryDirectory() as work_dir:
+        config_file: Path = Path(work_dir) / "big_config.xml"
+        write_config(config_file, CONFIG_SHAPE)
+        content: bytes = config_file.read_bytes()
+        Path(f"{config_file}.gz").write_bytes(gzip.compress(content))
+        Path(f"{config_file}.xz").write_bytes(lzma.compress(content))
+        print(f"Configuration size: {len(content) / 1024 / 1024:.1f} MB, "
+              f"gzip {Path(f'{config_file}.gz').stat().st_size / 1024 / 1024:.1f} MB, "
+              f"xz {Path(f'{config_file}.xz').stat().st_size / 1024 / 1024:.1f} MB")
+        for mode, suffix in LOAD_MODES.items():
+            output: list[str] = subprocess.run(
+                [sys.executable, __file__, mode, f"{config_file}{suffix}"],
+                check=True, capture_output=True, text=True).stdout.split()
+            elapsed, current, peak, elements = float(output[0]), int(output[1]), int(output[2]), int(output[3])
+            print(f"{mode:>22}: {elapsed * 1000:.0f} ms, RSS +{current / 1024:.1f} MB, "
+                  f"peak RSS +{peak / 1024:.1f} MB, {elements} elements")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        run_mode(sys.argv[1], Path(sys.argv[2]))
+    else:
+        run_benchmark()
@@ -0,0 +1,224 @@
+"""
+Generator of synthetic SR OS-style configurations (urn:nokia.com:sros:ns:yang:sr:conf namespace) for benchmarks.
+Run from the root of the repo: python benchmarks/config_generator.py r1.xml --cards 10 --ports 12
+"""
+import argparse
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import TextIO
+
+NOKIA_NAMESPACE: str = "urn:nokia.com:sros:ns:yang:sr:conf"
+INDENT: str = "    "
+
+
+@dataclass
+class ConfigShape:
+    """
+    Size of the generated configuration:
+    - cards, mdas per card, ports per MDA
+    - VPLS services and SAPs per service
+    - user profiles
+    - fan-out: entries of every profile, IP filter and log filter (siblings with the same name)
+    """
+    cards: int = 4
+    mdas: int = 2
+    ports: int = 12
+    services: int = 50
+    saps: int = 4
+    profiles: int = 10
+    fanout: int = 20
+
+
+class ConfigWriter:
+    """
+    Writer of an indented XML document, elements are written as soon as they are opened
+    """
+
+    def __init__(self, config: TextIO):
+        self.config: TextIO = config
+        self.depth: int = 0
+
+    def open(self, tag: str) -> None:
+        """
+        Write opening tag of an element with children
+        """
+        self.config.write(f"{INDENT * self.depth}<{tag}>\n")
+        self.depth += 1
+
+    def close(self, tag: str) -> None:
+        """
+        Write closing tag of an element with children
+        """
+        self.depth -= 1
+        self.config.write(f"{INDENT * self.depth}</{tag}>\n")
+
+    def leaf(self, tag: str, value: str | int) -> None:
+        """
+        Write element with a text value
+        """
+        self.config.write(f"{INDENT * self.depth}<{tag}>{value}</{tag}>\n")
+
+
+def write_system(writer: ConfigWriter, shape: ConfigShape, device_id: int) -> None:
+    """
+    Write system name and user profiles with their entries
+    """
+    writer.open("system")
+    writer.leaf("name", f"SR{device_id}")
+    writer.open("security")
+    writer.open("aaa")
+    writer.open("local-profiles")
+    for profile in range(1, shape.profiles + 1):
+        writer.open("profile")
+        writer.leaf("user-profile-name", f"profile-{profile}")
+        writer.leaf("default-action", "deny-all")
+        for entry in range(1, shape.fanout + 1):
+            writer.open("entry")
+            writer.leaf("entry-id", entry * 10)
+            writer.leaf("match", f"{('show', 'configure', 'tools', 'admin')[entry % 4]} command-{entry}")
+            writer.leaf("action", "permit" if entry % 5 else "deny")
+            writer.close("entry")
+        writer.close("profile")
+    writer.close("local-profiles")
+    writer.close("aaa")
+    writer.close("security")
+    writer.close("system")
+
+
+def write_log(writer: ConfigWriter, shape: ConfigShape) -> None:
+    """
+    Write log filter with its entries and default logs
+    """
+    writer.open("log")
+    writer.open("filter")
+    writer.leaf("filter-name", 1001)
+    for entry in range(1, shape.fanout + 1):
+        writer.open("named-entry")
+        writer.leaf("entry-name", entry * 10)
+        writer.leaf("description", f"Collect events of entry {entry}")
+        writer.leaf("action", "forward" if entry % 2 else "drop")
+        writer.close("named-entry")
+    writer.close("filter")
+    for log_id, description in ((99, "Default System Log"), (100, "Default Serious Errors Log")):
+        writer.open("log-id")
+        writer.leaf("name", log_id)
+        writer.leaf("description", description)
+        writer.close("log-id")
+    writer.close("log")
+
+
+def write_hardware(writer: ConfigWriter, shape: ConfigShape, device_id: int) -> None:
+    """
+    Write cards with MDAs and ports of every MDA
+    """
+    for card in range(1, shape.cards + 1):
+        writer.open("card")
+        writer.leaf("slot-number", card)
+        writer.leaf("card-type", "iom-s-3.0t")
+        for mda in range(1, shape.mdas + 1):
+            writer.open("mda")
+            writer.leaf("mda-slot", mda)
+            writer.leaf("mda-type", "me12-100gb-qsfp28")
+            writer.close("mda")
+        writer.close("card")
+    for card in range(1, shape.cards + 1):
+        for mda in range(1, shape.mdas + 1):
+            for port in range(1, shape.ports + 1):
+                writer.open("port")
+                writer.leaf("port-id", f"{card}/{mda}/{port}")
+                writer.leaf("admin-state", "enable" if port % 7 else "disable")
+                writer.leaf("description", f"uplink to r{device_id + card}" if port == 1 else f"access port {port}")
+                writer.open("ethernet")
+                writer.leaf("mode", "network" if port == 1 else "access")
+                writer.leaf("mtu", 9212)
+                writer.close("ethernet")
+                writer.close("port")
+
+
+def write_filters(writer: ConfigWriter, shape: ConfigShape) -> None:
+    """
+    Write IP filter with its entries
+    """
+    writer.open("filter")
+    writer.open("ip-filter")
+    writer.leaf("filter-name", "protect-cpm")
+    for entry in range(1, shape.fanout + 1):
+        writer.open("entry")
+        writer.leaf("entry-id", entry * 10)
+        writer.open("match")
+        writer.leaf("protocol", ("tcp", "udp", "icmp")[entry % 3])
+        writer.leaf("src-ip", f"10.{entry // 256}.{entry % 256}.0/24")
+        writer.close("match")
+        writer.open("action")
+        writer.leaf("accept" if entry % 4 else "drop", "")
+        writer.close("action")
+        writer.close("entry")
+    writer.close("ip-filter")
+    writer.close("filter")
+
+
+def write_services(writer: ConfigWriter, shape: ConfigShape) -> None:
+    """
+    Write VPLS services with SAPs spread over the ports
+    """
+    writer.open("service")
+    port_count: int = shape.cards * shape.mdas * shape.ports
+    for service in range(1, shape.services + 1):
+        writer.open("vpls")
+        writer.leaf("service-name", f"vpls-{service}")
+        writer.leaf("admin-state", "enable")
+        writer.leaf("service-id", service)
+        writer.leaf("customer", f"customer-{service % 10}")
+        for sap in range(shape.saps if port_count else 0):
+            port: int = (service * shape.saps + sap) % port_count
+            port_id: str = f"{port // (shape.mdas * shape.ports) % shape.cards + 1}/" \
+                           f"{port // shape.ports % shape.mdas + 1}/{port % shape.ports + 1}"
+            writer.open("sap")
+            writer.leaf("sap-id", f"{port_id}:{service}")
+            writer.leaf("description", f"sap {sap} of vpls-{service}")
+            writer.open("ingress")
+            writer.open("qos")
+            writer.open("sap-ingress")
+            writer.leaf("policy-name", f"qos-{service % 8}")
+            writer.close("sap-ingress")
+            writer.close("qos")
+            writer.close("ingress")
+            writer.close("sap")
+        writer.close("vpls")
+    writer.close("service")
+
+
+def write_config(config_file: Path, shape: ConfigShape, device_id: int = 1) -> None:
+    """
+    Write synthetic configuration of a device
+    :param config_file: Path to the configuration file
+    :param shape: Size of the configuration
+    :param device_id: Number of the device, used in the system name and in the descriptions
+    """
+    with config_file.open("w") as config:
+        config.write(f'<configure xmlns="{NOKIA_NAMESPACE}">\n')
+        writer: ConfigWriter = ConfigWriter(config)
+        writer.depth = 1
+        write_log(writer, shape)
+        write_system(writer, shape, device_id)
+        write_hardware(writer, shape, device_id)
+        write_filters(writer, shape)
+        write_services(writer, shape)
+        config.write("</configure>\n")
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("config_file", type=Path)
+    parser.add_argument("--device-id", type=int, default=1)
+    for shape_field in fields(ConfigShape):
+        parser.add_argument(f"--{shape_field.name}", type=int, default=shape_field.default)
+    arguments: argparse.Namespace = parser.parse_args()
+    write_config(arguments.config_file,
+                 ConfigShape(**{shape_field.name: getattr(arguments, shape_field.name)
+                                for shape_field in fields(ConfigShape)}),
+                 arguments.device_id)
+
+
+if __name__ == "__main__":
+    main()
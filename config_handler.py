@@ -1,37 +1,305 @@
-import copy
+import gzip
+import lzma
+import math
+import mmap
+import re
+import threading
+import time
+import weakref
 from pathlib import Path
+from typing import BinaryIO, Callable
 
 import lxml.etree as ET
 from lxml.etree import _Element, XMLSyntaxError, _ElementTree
-from xml_parser_helpers import xml_audit_logger
+from xml_parser_helpers import xml_audit_logger, LRUCache
+from value_index import ValueIndex, PathValues, has_fast_path
+from result_diff import get_key_paths, diff_results
+from query_planner import plan_filter, order_predicates, estimate_cost
 import xml_parser_dc as dc
 from xml_parser_exceptions import XmlConfigurationLoadError
+from xml_parser_metrics import stage_timer, observe_parse
+import xml_parser_settings as settings
+
+ELEMENT_NAME: re.Pattern = re.compile(r"^(?:[\w.-]+:)?[\w.-]+$")
+# Configurations are stored compressed by the archives, they are decompressed on the fly
+COMPRESSED_OPENERS: dict[str, Callable[..., BinaryIO]] = {".gz": gzip.open, ".xz": lzma.open}
+# Whitespace-only text between elements, comments and processing instructions are never queried
+XML_PARSER_OPTIONS: dict = dict(remove_blank_text=True, remove_comments=True, remove_pis=True, no_network=True,
+                                resolve_entities=False, collect_ids=False, huge_tree=settings.PARSE_HUGE_TREE)
+# ValueError: content lxml cannot parse, e.g. closed memory map or unicode string with encoding declaration
+LOAD_ERRORS: tuple = (OSError, EOFError, lzma.LZMAError, ValueError)
+# Memory-mapped configuration is fed to the parser by chunks, lxml does not parse memory maps directly
+FEED_CHUNK_SIZE: int = 1024 * 1024
+xml_parsers: threading.local = threading.local()
+
+
+def get_xml_parser() -> ET.XMLParser:
+    """
+    Get XML parser of the configurations. lxml parser must not be used by several threads at the same time,
+    so every thread reuses its own parser
+    :return: XMLParser object
+    """
+    parser: ET.XMLParser | None = getattr(xml_parsers, "parser", None)
+    if parser is None:
+        parser = xml_parsers.parser = ET.XMLParser(**XML_PARSER_OPTIONS)
+    return parser
+
+
+def read_varint(buffer: bytes, offset: int) -> tuple[int, int]:
+    """
+    Read variable-length integer of the xz format
+    :param buffer: Buffer with the integer
+    :param offset: Position of the integer in the buffer
+    :return: Tuple (value, position after the integer)
+    """
+    value: int = 0
+    for shift in range(0, 63, 7):
+        byte: int = buffer[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+    raise ValueError("Variable-length integer is too long")
+
+
+def get_xz_content_size(config: BinaryIO, file_size: int) -> int:
+    """
+    Get decompressed size of a single-stream xz file from the index at its end
+    :param config: Opened compressed file
+    :param file_size: Size of the compressed file
+    :return: Decompressed size
+    """
+    config.seek(file_size - 12)
+    footer: bytes = config.read(12)
+    if footer[-2:] != b"YZ":
+        raise ValueError("Stream footer is not found")
+    index_size: int = (int.from_bytes(footer[4:8], "little") + 1) * 4
+    config.seek(file_size - 12 - index_size)
+    index: bytes = config.read(index_size)
+    if index[:1] != b"\x00":
+        raise ValueError("Index is not found")
+    records, offset = read_varint(index, 1)
+    content_size: int = 0
+    for _ in range(records):
+        _, offset = read_varint(index, offset)
+        uncompressed_size, offset = read_varint(index, offset)
+        content_size += uncompressed_size
+    return content_size
+
+
+def get_content_size(config_file: Path) -> int:
+    """
+    Get size of the configuration after decompression without decompressing it: gzip stores the size (modulo 4 GB)
+    in the trailer, xz in the index at the end of the file. Other compressed files are decompressed to count it
+    :param config_file: Path to the configuration file
+    :return: Size of the (decompressed) configuration in bytes
+    """
+    file_size: int = config_file.stat().st_size
+    if config_file.suffix not in COMPRESSED_OPENERS:
+        return file_size
+    try:
+        with config_file.open("rb") as config:
+            if config_file.suffix == ".gz" and file_size >= 18:
+                config.seek(file_size - 4)
+                return int.from_bytes(config.read(4), "little")
+            if config_file.suffix == ".xz" and file_size >= 32:
+                return get_xz_content_size(config, file_size)
+    except (ValueError, IndexError):
+        pass
+    try:
+        with XMLRoot.open_config_file(config_file) as config:
+            return sum(len(chunk) for chunk in iter(lambda: config.read(FEED_CHUNK_SIZE), b""))
+    except LOAD_ERRORS:
+        # Broken file is reported once it is loaded
+        return file_size
+
+
+def is_above_streaming_threshold(config_file: Path) -> bool:
+    """
+    Check if the configuration is queried with the streaming engine by default, i.e. its (decompressed) size is
+    at or above STREAMING_THRESHOLD_MB. Such configurations are never kept as a parsed tree
+    :param config_file: Path to the configuration file
+    :return: True if the configuration is above the threshold
+    """
+    threshold: int = settings.STREAMING_THRESHOLD_MB * 1024 * 1024
+    return bool(threshold) and config_file.is_file() and get_content_size(config_file) >= threshold
+
+
+def close_config_content(content: bytes | mmap.mmap | None) -> None:
+    """
+    Release content of the configuration read by XMLRoot.read_config_file once it is parsed
+    :param content: Raw content of the configuration file
+    """
+    if isinstance(content, mmap.mmap):
+        content.close()
 
 
 class XMLRoot:
 
-    def __init__(self, config_file: Path):
+    def __init__(self, config_file: Path, content: bytes | None = None):
         self.config_file: Path = config_file
         self.config_file_name = config_file.__str__()
+        self.content: bytes | None = content
+        # Size of the parsed document, decompressed one for compressed files
+        self.content_size: int = 0
         self.xml_root: _ElementTree = self.get_xml_root()
 
+    @staticmethod
+    def open_config_file(config_file: Path) -> BinaryIO:
+        """
+        Open XML document representing device configuration, compressed documents (.gz, .xz) are decompressed
+        while they are read
+        :param config_file: Path to the configuration file
+        :return: Binary file object
+        """
+        return COMPRESSED_OPENERS.get(config_file.suffix, open)(config_file, "rb")
+
+    @staticmethod
+    def read_config_file(config_file: Path) -> bytes | mmap.mmap:
+        """
+        Open and read XML document representing device configuration, without parsing.
+        Plain document is memory-mapped if it is enabled in the settings, the caller closes it with
+        close_config_content once it is parsed
+        :param config_file: Path to the configuration file
+        :return: Raw (decompressed) content of the file
+        """
+        if not config_file.is_file():
+            xml_audit_logger.error(f'File "{config_file}" does not exists')
+            raise XmlConfigurationLoadError(f'Configuration file "{config_file}" could not be found')
+        try:
+            with stage_timer("read"):
+                if settings.PARSE_MMAP and config_file.suffix not in COMPRESSED_OPENERS:
+                    with config_file.open("rb") as config:
+                        # Empty file cannot be mapped
+                        if config_file.stat().st_size:
+                            return mmap.mmap(config.fileno(), 0, access=mmap.ACCESS_READ)
+                with XMLRoot.open_config_file(config_file) as config:
+                    return config.read()
+        except LOAD_ERRORS:
+            xml_audit_logger.error(f'Can not open the file "{config_file}"')
+            raise XmlConfigurationLoadError(f'Configuration file "{config_file}" could not be loaded')
+
     def get_xml_root(self) -> _ElementTree | None:
         """
-        Open and parse XML document representing device configuration
+        Open and parse XML document representing device configuration (or its content, if it is already read)
         :return: XML_Root object, i.e. parsed configuration
         """
-        if not self.config_file.is_file():
+        if self.content is None and not self.config_file.is_file():
             xml_audit_logger.error(f'File "{self.config_file_name}" does not exists')
             raise XmlConfigurationLoadError(f'Configuration file "{self.config_file_name}" could not be found')
         try:
-            return ET.parse(self.config_file_name)
-        except OSError:
+            start: float = time.perf_counter()
+            with stage_timer("parse"):
+                if isinstance(self.content, mmap.mmap):
+                    xml_root: _ElementTree = self.parse_mapped_content(self.content)
+                elif self.content is not None:
+                    xml_root = ET.fromstring(self.content, get_xml_parser(),
+                                             base_url=self.config_file_name).getroottree()
+                else:
+                    with self.open_config_file(self.config_file) as config:
+                        xml_root = ET.parse(config, get_xml_parser(), base_url=self.config_file_name)
+                        self.content_size = config.tell()
+            if self.content is not None:
+                self.content_size = len(self.content)
+            observe_parse(self.content_size, time.perf_counter() - start)
+            return xml_root
+        except LOAD_ERRORS:
             xml_audit_logger.error(f'Can not open the file "{self.config_file_name}"')
             raise XmlConfigurationLoadError(f'Configuration file "{self.config_file_name}" could not be loaded')
         except XMLSyntaxError as err_code:
             xml_audit_logger.error(f'Error parsing XML-document "{self.config_file_name}": {err_code}')
             raise XmlConfigurationLoadError(f'Configuration file "{self.config_file_name}" has not correct XML format')
 
+    @staticmethod
+    def parse_mapped_content(content: mmap.mmap) -> _ElementTree:
+        """
+        Parse memory-mapped configuration by chunks, only a chunk of the file is copied at a time
+        :param content: Memory-mapped configuration file
+        :return: Parsed configuration
+        """
+        parser: ET.XMLParser = get_xml_parser()
+        try:
+            for offset in range(0, len(content), FEED_CHUNK_SIZE):
+                parser.feed(content[offset:offset + FEED_CHUNK_SIZE])
+            return parser.close().getroottree()
+        except BaseException:
+            # Parser is reused by the thread, so the unfinished document is discarded
+            try:
+                parser.close()
+            except XMLSyntaxError:
+                pass
+            raise
+
+
+class XPathCache:
+    """
+    Cache of compiled XPATH queries, shared across devices and requests.
+    Compiled query keeps compiled EXSLT regular expressions between the calls.
+    lxml serializes calls of the same compiled query, so every thread keeps its own LRU cache of max_entries queries
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries: int = max_entries
+        self.thread_caches: threading.local = threading.local()
+        # Caches of the threads for the counters, cache of a finished thread is dropped with the thread
+        self.caches: weakref.WeakSet[LRUCache] = weakref.WeakSet()
+        self.lock: threading.Lock = threading.Lock()
+
+    def get_thread_cache(self) -> LRUCache:
+        """
+        Get cache of compiled XPATH queries of the current thread
+        :return: LRUCache object
+        """
+        cache: LRUCache | None = getattr(self.thread_caches, "cache", None)
+        if cache is None:
+            cache = self.thread_caches.cache = LRUCache(max_entries=self.max_entries)
+            with self.lock:
+                self.caches.add(cache)
+        return cache
+
+    def get_xpath(self, x_path: str, namespace_map: dict, namespace_key: tuple | None = None) -> ET.XPath:
+        """
+        Get compiled XPATH query from the cache, compile it if it is not cached
+        :param x_path: String representation of XPATH
+        :param namespace_map: Namespace mapping used in the query
+        :param namespace_key: Hashable representation of the namespace mapping (built if not provided)
+        :return: Compiled XPATH query
+        """
+        namespace_key = namespace_key or tuple(sorted(namespace_map.items()))
+        cache: LRUCache = self.get_thread_cache()
+        key: tuple = (x_path, namespace_key)
+        compiled_xpath: ET.XPath | None = cache.get(key)
+        if compiled_xpath is None:
+            compiled_xpath = ET.XPath(x_path, namespaces=namespace_map)
+            cache.put(key, compiled_xpath)
+        return compiled_xpath
+
+    def clear(self) -> None:
+        """
+        Remove all entries and reset counters of every thread
+        """
+        with self.lock:
+            caches: list[LRUCache] = list(self.caches)
+        for cache in caches:
+            cache.clear()
+
+    def stats(self) -> dict:
+        """
+        Get cache counters summed over the threads, max_entries is the limit of a single thread
+        :return: Dictionary with cache counters
+        """
+        with self.lock:
+            caches: list[LRUCache] = list(self.caches)
+        thread_stats: list[dict] = [cache.stats() for cache in caches]
+        counters: dict = {counter: sum(stats[counter] for stats in thread_stats)
+                          for counter in ("entries", "hits", "misses", "evictions")}
+        lookups: int = counters["hits"] + counters["misses"]
+        return {**counters, "max_entries": self.max_entries, "threads": len(thread_stats),
+                "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0}
+
+
+xpath_cache: XPathCache = XPathCache(max_entries=settings.XPATH_CACHE_MAX_ENTRIES)
+
 
 class XpathConstructor:
 
@@ -47,7 +315,8 @@ class XpathConstructor:
         """
         if not raw_filter_list:
             return list()
-        parsed_filters: list[dc.FilterElement] = [dc.FilterElement(**raw_filter) for raw_filter in raw_filter_list]
+        parsed_filters: list[dc.FilterElement] = [dc.FilterModel(**raw_filter).to_element()
+                                                  for raw_filter in raw_filter_list]
         return parsed_filters
 
     def convert_xpath_to_dataclass(self) -> list[dc.PathElement]:
@@ -58,7 +327,7 @@ class XpathConstructor:
         parsed_elements: list = []
         for elem in self.input_path:
             path_elem = dc.PathElement(
-                name=elem.get("name").strip(),
+                name=dc.PathModel(name=elem.get("name")).name,
                 filters=self.parse_filters(elem.get("filters"))
             )
             parsed_elements.append(path_elem)
@@ -67,24 +336,52 @@ class XpathConstructor:
 
 class ConfigHandler:
 
-    def __init__(self, xml_root: _ElementTree):
-        self.xml_root: _ElementTree = xml_root
-        self.namespace_map: dict = self.get_namespace_mapping()
+    def __init__(self, xml_root: _ElementTree | None, root_element: _Element | None = None):
+        # Engines which do not keep the parsed tree pass None, namespaces are read from root_element if it is known
+        self.xml_root: _ElementTree | None = xml_root
+        self.value_index: ValueIndex | None = ValueIndex(settings.VALUE_INDEX_MAX_ELEMENTS) \
+            if settings.VALUE_INDEX and xml_root is not None else None
+        if xml_root is not None:
+            root_element = xml_root.getroot()
+        if root_element is not None:
+            self.set_namespaces(root_element)
+
+    def set_namespaces(self, root_element: _Element) -> None:
+        """
+        Set namespace mapping and prefix used in the queries
+        :param root_element: Root element of the configuration
+        """
+        self.namespace_map: dict = self.get_namespace_mapping(root_element)
         self.inverse_namespace_map = {f"{{{v}}}": k for k, v in self.namespace_map.items()}
+        self.namespace_key: tuple = tuple(sorted(self.namespace_map.items()))
         self.namespace_prefix: str = "ns:" if "ns" in self.namespace_map else ""
 
-    def get_namespace_mapping(self) -> dict:
+    @staticmethod
+    def get_namespace_mapping(root_element: _Element) -> dict:
         """
         Get namespaces from XML header, add REGEX to the NS
+        :param root_element: Root element of the configuration
         :return: Namespace mapping as dictionary
         """
-        ns_map: dict = self.xml_root.getroot().nsmap
+        ns_map: dict = root_element.nsmap
         ns_map["re"] = "http://exslt.org/regular-expressions"
         # Currently Nokia uses xmlns="urn:nokia.com:sros:ns:yang:sr:conf" in the XML header => which lxml parses as None
         if None in ns_map:
             ns_map["ns"] = ns_map.pop(None)
         return ns_map
 
+    def get_tag(self, name: str) -> str | None:
+        """
+        Get tag of the element (as lxml reports it) by its name in the XPATH
+        :param name: Name of the element, with or without namespace prefix
+        :return: Tag in Clark notation or None if the name is not a plain element name
+        """
+        if not ELEMENT_NAME.match(name):
+            return None
+        prefix, _, local_name = name.rpartition(":")
+        namespace: str | None = self.namespace_map.get(prefix or self.namespace_prefix.rstrip(":"))
+        return f"{{{namespace}}}{local_name}" if namespace else local_name
+
     def prepend_namespace(self, x_path: str) -> str:
         """
         Prepend namespace to the path
@@ -100,106 +397,231 @@ class ConfigHandler:
         :param parsed_xpath: Parsed representation of XPATH
         :return: String representation XPATH query
         """
-        xpath: str = ""
-        last_item_id: int = len(parsed_xpath) - 1
-        for idx, elem in enumerate(parsed_xpath):
-            xpath += self.namespace_prefix
-            xpath += elem.name
+        return self.plan_query(parsed_xpath).xpath
+
+    def plan_query(self, parsed_xpath: list[dc.PathElement]) -> dc.QueryPlan:
+        """
+        Plan XPATH query: filters are converted to the cheapest equal predicates, no-op filters are dropped,
+        predicates of every element are ordered by the static cost and selectivity of their strategies and joined
+        into a single predicate
+        :param parsed_xpath: Parsed representation of XPATH
+        :return: QueryPlan object with string representation of XPATH
+        """
+        steps: list[dc.StepPlan] = list()
+        xpath_steps: list[str] = list()
+        for elem in parsed_xpath:
+            step: dc.StepPlan = dc.StepPlan(name=elem.name, sibling_id=elem.sibling_id)
+            xpath_step: str = self.namespace_prefix + elem.name
             if elem.sibling_id:
-                xpath += f'[{elem.sibling_id}]'
+                xpath_step += f'[{elem.sibling_id}]'
             else:
                 for filter_id in elem.filters:
                     filter_path: str = self.prepend_namespace(filter_id.filter_path) if filter_id.is_a_path \
                         else filter_id.filter_path
-                    xpath += f'[re:match({filter_path}, "{filter_id.regexp}")]'
-            xpath += "/" if idx != last_item_id else ""
-        return xpath
-
-    def get_position_index(self, node: _Element, element_tag: str) -> int:
-        """
-        Run preceding-sibling query to get index among siblings
-        :param node: XML node element
-        :param element_tag: Tag of an element with prepended NS
-        :return: Index number as integer
-        """
-        siblings: list = node.xpath(f"./preceding-sibling::{self.namespace_prefix}{element_tag}",
-                                    namespaces=self.namespace_map)
-        return len(siblings) + 1
+                    filter_predicates: list[dc.PredicatePlan] = plan_filter(filter_path, filter_id)
+                    if not filter_predicates:
+                        step.dropped_filters.append(filter_id.filter_path)
+                    step.predicates.extend(filter_predicates)
+                step.predicates = order_predicates(step.predicates)
+                if step.predicates:
+                    xpath_step += f'[{" and ".join(predicate.expression for predicate in step.predicates)}]'
+            steps.append(step)
+            xpath_steps.append(xpath_step)
+        return dc.QueryPlan(xpath="/".join(xpath_steps), steps=steps)
 
-    def get_indexed_path(self, parsed_xpath: list[dc.PathElement], node: _Element) -> list[dc.PathElement]:
+    def explain_query(self, parsed_xpath: list[dc.PathElement]) -> dc.QueryPlan:
         """
-        Parsing ancestors(except node 'configure') and getting indexes of the Elements in the path
+        Plan XPATH query and estimate its cost from the number of elements on every level of XPATH
         :param parsed_xpath: Parsed representation of XPATH
-        :param node: XML node element
-        :return: Updated list of responses to XPATH query
+        :return: QueryPlan object with the engine running the query and the estimated cost
         """
-        updated_xpath: list[dc.PathElement] = copy.deepcopy(parsed_xpath)
-        node_ancestors: list[_Element] = node.xpath('./ancestor-or-self::*')
-        for node_id in range(1, len(node_ancestors)):
-            updated_xpath[node_id - 1].sibling_id = \
-                self.get_position_index(node_ancestors[node_id], updated_xpath[node_id - 1].name)
-        return updated_xpath
+        query_plan: dc.QueryPlan = self.plan_query(parsed_xpath)
+        element_path: str = ""
+        for step in query_plan.steps:
+            element_path += self.namespace_prefix + step.name
+            step.candidates = int(self.run_xpath_query(f"count({element_path})", use_cache=False))
+            element_path += "/"
+        query_plan.estimated_cost = estimate_cost(query_plan.steps)
+        if self.value_index is not None and self.select_indexed_filter(parsed_xpath) is not None:
+            query_plan.engine = "value_index"
+        return query_plan
 
-    @staticmethod
-    def prepare_queries(response: list[dc.PathElement]) -> list[dc.FilterElement]:
+    def prepare_relative_queries(self, parsed_xpath: list[dc.PathElement]) -> list[tuple[int, str, str | None]]:
         """
-        Build explicit indexed path to get a data from XML (alongside with unindexed path, to use in an API)
-        :param response: Parsed response from to the XPATH query
-        :return: List of elements where filter is applied
+        Build filter queries relative to the element of XPATH where filter is applied (alongside with unindexed path,
+        to use in an API)
+        :param parsed_xpath: Parsed representation of XPATH
+        :return: List of tuples (level of the element in XPATH, unindexed path, relative query or None for the element)
         """
-        elements_with_filters: list = list()
+        relative_queries: list = list()
         root_path: str = ""
-        idx_root_path: str = ""
-        for path_element in response:
+        for level, path_element in enumerate(parsed_xpath):
             root_path += f"{path_element.name}/"
-            idx_root_path += f"{path_element.name}[{path_element.sibling_id}]/"
-            if path_element.filters:
-                for fltr in path_element.filters:
-                    fltr.indexed_query = idx_root_path + fltr.filter_path if fltr.is_a_path else idx_root_path
-                    fltr.unindexed_path = root_path + fltr.filter_path if fltr.is_a_path else root_path
-                    elements_with_filters.append(fltr)
-        return elements_with_filters
+            for fltr in path_element.filters:
+                if fltr.is_a_path:
+                    relative_queries.append((level, root_path + fltr.filter_path,
+                                             self.prepend_namespace(fltr.filter_path)))
+                else:
+                    relative_queries.append((level, root_path, None))
+        return relative_queries
 
-    def run_indexed_query(self, indexed_queries: list[dc.FilterElement]) -> list[dc.ResultItem]:
+    def run_relative_queries(self, relative_queries: list[tuple[int, str, str | None]], node: _Element,
+                             resolved_values: dict[tuple[int, _Element], dc.ResultItem | None]) -> list[dc.ResultItem]:
         """
-        Run explicit indexed XPATH queries and record the results to the 'value' attribute
+        Run filter queries relative to the ancestors of a result node and record the results to the 'value' attribute
         Response to the query is always unique, i.e. response list's length == 1
-        :param indexed_queries: List of elements where filter is applied
-        :return: List of elements where filter is applied with updated values
-        """
-        explicit_queries_results = list()
-        for query in indexed_queries:
-            query_result = dc.ResultItem()
-            xpath: str = self.prepend_namespace(query.indexed_query)
-            results: list[_Element] = self.run_xpath_query(xpath)
-            if len(results) == 1:
-                query_result.path_attribute = query.unindexed_path
-                query_result.value = results[0].text
-                explicit_queries_results.append(query_result)
+        :param relative_queries: List of relative queries built by prepare_relative_queries
+        :param node: XML node element, i.e. result of the XPATH query
+        :param resolved_values: Results of the queries to the ancestors shared by several result nodes
+        :return: List of elements where filter is applied with values
+        """
+        node_ancestors: list[_Element] = [node, *node.iterancestors()][-2::-1]
+        relative_queries_results = list()
+        for query_id, (level, unindexed_path, relative_query) in enumerate(relative_queries):
+            ancestor: _Element = node_ancestors[level]
+            if (query_id, ancestor) in resolved_values:
+                query_result: dc.ResultItem | None = resolved_values[query_id, ancestor]
             else:
-                xml_audit_logger.error(f'Response to the explicit query is more than one: "{query.indexed_query}"')
-        return explicit_queries_results
+                results: list[_Element] = self.get_compiled_xpath(relative_query)(ancestor) \
+                    if relative_query else [ancestor]
+                query_result = dc.ResultItem(path_attribute=unindexed_path, value=results[0].text) \
+                    if len(results) == 1 else None
+                if query_result is None:
+                    xml_audit_logger.error(f'Response to the relative query is not unique: "{unindexed_path}"')
+                if ancestor is not node:
+                    resolved_values[query_id, ancestor] = query_result
+            if query_result is not None:
+                relative_queries_results.append(query_result)
+        return relative_queries_results
 
-    def process_query_pipeline(self, parsed_xpath: list[dc.PathElement]) -> list[list[dc.ResultItem]]:
+    def process_query_pipeline(self, parsed_xpath: list[dc.PathElement],
+                               string_xpath: str | None = None) -> list[list[dc.ResultItem]]:
         """
-        Process Query: convert XPATH to string => run query => process reply
+        Process Query: convert XPATH to string => run query => process reply.
+        Values are read relative to the ancestors of every result node
         :param parsed_xpath: Parsed representation of XPATH
+        :param string_xpath: String representation of XPATH, if it is already converted for the same namespace prefix
         :return: List of elements with activated filter and values
         """
-        string_xpath: str = self.convert_xpath_to_string(parsed_xpath)
-        query_response: list[_Element] = self.run_xpath_query(string_xpath)
-        indexed_paths_responses = [self.get_indexed_path(parsed_xpath, result_node) for result_node in query_response]
-        indexed_queries = [self.prepare_queries(response) for response in indexed_paths_responses]
-        result_list = [self.run_indexed_query(query) for query in indexed_queries]
-        return result_list
+        query_response: list[_Element] | None = None
+        if self.value_index is not None:
+            with stage_timer("value_index"):
+                query_response = self.run_value_index_query(parsed_xpath)
+        if query_response is None:
+            with stage_timer("xpath"):
+                string_xpath = string_xpath or self.convert_xpath_to_string(parsed_xpath)
+                query_response = self.run_xpath_query(string_xpath)
+        with stage_timer("relative_queries"):
+            relative_queries: list[tuple[int, str, str | None]] = self.prepare_relative_queries(parsed_xpath)
+            resolved_values: dict[tuple[int, _Element], dc.ResultItem | None] = dict()
+            return [self.run_relative_queries(relative_queries, result_node, resolved_values)
+                    for result_node in query_response]
 
-    def run_xpath_query(self, x_path: str) -> list[_Element]:
+    def diff_query_pipeline(self, target_configuration: "ConfigHandler", parsed_xpath: list[dc.PathElement],
+                            key_leaves: list[str] | None = None) -> dc.ResultDiff:
+        """
+        Process Query to two versions of the configuration and compare the results: this configuration is the base
+        version. Results are matched by the unindexed path and values of the key leaves
+        :param target_configuration: ConfigHandler object of the target version of the configuration
+        :param parsed_xpath: Parsed representation of XPATH
+        :param key_leaves: Filter paths of the key leaves, by default the first filter of every element of XPATH
+        :return: ResultDiff object with added, removed and changed results
+        """
+        return diff_results(self.process_query_pipeline(parsed_xpath),
+                            target_configuration.process_query_pipeline(parsed_xpath),
+                            get_key_paths(parsed_xpath, key_leaves))
+
+    def select_indexed_filter(self, parsed_xpath: list[dc.PathElement]) -> tuple[int, dc.FilterElement] | None:
+        """
+        Select filter of XPATH to look up in the value index: the most selective filter with exact match,
+        literal prefix or literal substring regex, the first one of equally selective filters
+        :param parsed_xpath: Parsed representation of XPATH
+        :return: Tuple (level of the element in XPATH, filter) or None if no filter is selective
+        """
+        selected_filter: tuple[int, dc.FilterElement] | None = None
+        selected_selectivity: float = 1.0
+        for level, path_element in enumerate(parsed_xpath):
+            for fltr in path_element.filters:
+                if has_fast_path(fltr.regexp):
+                    try:
+                        re.compile(fltr.regexp)
+                    except re.error:
+                        return None
+                    selectivity: float = math.prod(predicate.selectivity
+                                                   for predicate in plan_filter(fltr.filter_path, fltr))
+                    if selected_filter is None or selectivity < selected_selectivity:
+                        selected_filter, selected_selectivity = (level, fltr), selectivity
+        return selected_filter
+
+    def build_path_values(self, element_path: str, filter_path: str) -> PathValues:
+        """
+        Read values of the filter of all elements on the path, as re:match sees them (string value of the first node)
+        :param element_path: Path of the elements with prepended namespaces
+        :param filter_path: Path of the filter relative to the elements with prepended namespaces
+        :return: PathValues object
+        """
+        elements: list[_Element] = self.run_xpath_query(element_path)
+        read_value: ET.XPath = ET.XPath(f"string({filter_path})", namespaces=self.namespace_map, smart_strings=False)
+        return PathValues(elements, [read_value(element) for element in elements])
+
+    def run_value_index_query(self, parsed_xpath: list[dc.PathElement]) -> list[_Element] | None:
+        """
+        Run XPATH query starting from the elements found in the value index by one of the filters:
+        elements which cannot match are skipped, the rest of the query is checked relative to the found elements
+        :param parsed_xpath: Parsed representation of XPATH
+        :return: List of XPATH Elements or None if the query has no selective filter or the filter is not indexed
+        """
+        indexed_filter: tuple[int, dc.FilterElement] | None = self.select_indexed_filter(parsed_xpath)
+        if indexed_filter is None:
+            return None
+        level, fltr = indexed_filter
+        element_path: str = self.prepend_namespace("/".join(path_element.name
+                                                            for path_element in parsed_xpath[:level + 1]))
+        filter_path: str = self.prepend_namespace(fltr.filter_path) if fltr.is_a_path else fltr.filter_path
+        path_values: PathValues | None = self.value_index.get_path_values(element_path, filter_path,
+                                                                          self.build_path_values)
+        if path_values is None:
+            return None
+        candidates: list[_Element] = path_values.find(fltr.regexp)
+        if not candidates:
+            return list()
+        # Filters of the ancestors and the rest of XPATH are checked with the queries relative to the elements
+        level_queries: dict[int, ET.XPath] = {
+            ancestor_level: self.get_compiled_xpath(f"self::{self.convert_xpath_to_string([path_element])}")
+            for ancestor_level, path_element in enumerate(parsed_xpath[:level]) if path_element.filters}
+        subtree_query: ET.XPath = self.get_compiled_xpath(f"self::{self.convert_xpath_to_string(parsed_xpath[level:])}")
+        checked_ancestors: dict[_Element, bool] = dict()
+        query_response: list[_Element] = list()
+        for candidate in candidates:
+            ancestors: list[_Element] = [candidate, *candidate.iterancestors()][-2::-1]
+            for ancestor_level, level_query in level_queries.items():
+                ancestor: _Element = ancestors[ancestor_level]
+                if ancestor not in checked_ancestors:
+                    checked_ancestors[ancestor] = bool(level_query(ancestor))
+                if not checked_ancestors[ancestor]:
+                    break
+            else:
+                query_response.extend(subtree_query(candidate))
+        return query_response
+
+    def run_xpath_query(self, x_path: str, use_cache: bool = True) -> list[_Element]:
         """
         Run absolute XPATH query
         :param x_path: String representation of XPATH
+        :param use_cache: Take compiled query from the cache of compiled XPATH queries
         :return: List of XPATH Elements
         """
-        return self.xml_root.xpath(x_path, namespaces=self.namespace_map)
+        if not use_cache:
+            return self.xml_root.xpath(x_path, namespaces=self.namespace_map)
+        return self.get_compiled_xpath(x_path)(self.xml_root)
+
+    def get_compiled_xpath(self, x_path: str) -> ET.XPath:
+        """
+        Get compiled XPATH query with namespaces of the configuration
+        :param x_path: String representation of XPATH
+        :return: Compiled XPATH query
+        """
+        return xpath_cache.get_xpath(x_path, self.namespace_map, self.namespace_key)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,469 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import sys
+import threading
+from array import array
+from pathlib import Path
+from typing import Callable, Iterator
+
+import lxml.etree as ET
+from lxml.etree import _Element
+from config_handler import XMLRoot, ConfigHandler
+from query_planner import is_match_all, estimate_cost
+from xml_parser_helpers import xml_audit_logger
+import xml_parser_dc as dc
+from xml_parser_metrics import stage_timer
+
+INDEX_MAGIC: bytes = b"XMLPIDX\n"
+INDEX_VERSION: int = 2
+# Order of the sections in the index file
+INDEX_SECTIONS: tuple = ("tags", "ends", "texts", "heads", "tails", "string_offsets", "strings")
+
+
+def get_content_hash(content: bytes) -> str:
+    """
+    Get hash of the configuration file content
+    :param content: Raw content of the file
+    :return: Hex digest
+    """
+    return hashlib.blake2b(content, digest_size=20).hexdigest()
+
+
+class ConfigIndex:
+    """
+    Flat representation of the parsed configuration, read from a memory-mapped index file.
+    Elements are stored in document order, every element is described by:
+    - tags: id of the tag (in Clark notation) in the header
+    - ends: id of the first element after the subtree of the element, children are found by jumping over subtrees
+    - texts: id of the text of the element (as lxml reports it)
+    - heads: id of the text before the first child element, including tails of comments
+    - tails: id of the text after the element, including tails of the following comments
+    Id of the string is -1 for None
+    """
+
+    def __init__(self, header: dict, buffer: bytes | mmap.mmap):
+        self.header: dict = header
+        self.buffer: bytes | mmap.mmap = buffer
+        view: memoryview = memoryview(buffer)
+        sections: dict = header["sections"]
+        self.tags: memoryview = view[slice(*sections["tags"])].cast("i")
+        self.ends: memoryview = view[slice(*sections["ends"])].cast("i")
+        self.texts: memoryview = view[slice(*sections["texts"])].cast("i")
+        self.heads: memoryview = view[slice(*sections["heads"])].cast("i")
+        self.tails: memoryview = view[slice(*sections["tails"])].cast("i")
+        self.string_offsets: memoryview = view[slice(*sections["string_offsets"])].cast("q")
+        self.strings: memoryview = view[slice(*sections["strings"])]
+        self.tag_ids: dict[str, int] = {tag: tag_id for tag_id, tag in enumerate(header["tags"])}
+        self.nsmap: dict = {prefix or None: namespace for prefix, namespace in header["nsmap"]}
+        self.size: int = len(buffer)
+
+    def get_string(self, string_id: int) -> str | None:
+        if string_id < 0:
+            return None
+        return str(self.strings[self.string_offsets[string_id]:self.string_offsets[string_id + 1]], "utf-8")
+
+    def get_text(self, element_id: int) -> str | None:
+        """
+        Get text of the element, as lxml reports it
+        """
+        return self.get_string(self.texts[element_id])
+
+    def iter_children(self, element_id: int) -> Iterator[int]:
+        child_id: int = element_id + 1
+        end: int = self.ends[element_id]
+        while child_id < end:
+            yield child_id
+            child_id = self.ends[child_id]
+
+    def get_string_value(self, element_id: int) -> str:
+        """
+        Get string value of the element (as XPATH functions see it): all text of the subtree in document order
+        """
+        head: str = self.get_string(self.heads[element_id]) or ""
+        if self.ends[element_id] == element_id + 1:
+            return head
+        parts: list[str] = [head]
+        for child_id in self.iter_children(element_id):
+            parts.append(self.get_string_value(child_id))
+            parts.append(self.get_string(self.tails[child_id]) or "")
+        return "".join(parts)
+
+    def get_first_text_node(self, element_id: int) -> str:
+        """
+        Get value of the first text node of the element, i.e. of text() in the XPATH
+        """
+        text: str | None = self.get_text(element_id)
+        if text is not None:
+            return text
+        for child_id in self.iter_children(element_id):
+            tail: str | None = self.get_string(self.tails[child_id])
+            if tail is not None:
+                return tail
+        return ""
+
+    def select(self, element_id: int, tag_ids: list[int]) -> list[int]:
+        """
+        Get descendants of the element by relative path, in document order
+        :param element_id: Id of the element the path is relative to
+        :param tag_ids: Ids of the tags of every step of the path
+        :return: List of element ids
+        """
+        tags: memoryview = self.tags
+        ends: memoryview = self.ends
+        selected: list[int] = [element_id]
+        for tag_id in tag_ids:
+            children: list[int] = list()
+            for parent_id in selected:
+                child_id: int = parent_id + 1
+                end: int = ends[parent_id]
+                while child_id < end:
+                    if tags[child_id] == tag_id:
+                        children.append(child_id)
+                    child_id = ends[child_id]
+            selected = children
+        return selected
+
+    @staticmethod
+    def build(root: _Element) -> tuple[dict, list[bytes]]:
+        """
+        Build index of the parsed configuration
+        :param root: Root element of the configuration
+        :return: Tuple (header without file attributes, sections in the order of INDEX_SECTIONS)
+        """
+        tags: array = array("i")
+        ends: array = array("i")
+        texts: array = array("i")
+        heads: list[str | None] = list()
+        tails: list[str | None] = list()
+        tag_ids: dict[str, int] = dict()
+        string_ids: dict[str, int] = dict()
+
+        def get_string_id(value: str | None) -> int:
+            if value is None:
+                return -1
+            return string_ids.setdefault(value, len(string_ids))
+
+        def add_element(element: _Element) -> int:
+            element_id: int = len(tags)
+            tags.append(tag_ids.setdefault(element.tag, len(tag_ids)))
+            ends.append(0)
+            texts.append(get_string_id(element.text))
+            heads.append(element.text)
+            tails.append(None)
+            last_child_id: int | None = None
+            for child in element:
+                if isinstance(child.tag, str):
+                    last_child_id = add_element(child)
+                    tails[last_child_id] = child.tail
+                elif child.tail is not None:
+                    # Comments and processing instructions are not indexed, but their tails are a part of the text
+                    if last_child_id is None:
+                        heads[element_id] = (heads[element_id] or "") + child.tail
+                    else:
+                        tails[last_child_id] = (tails[last_child_id] or "") + child.tail
+            ends[element_id] = len(tags)
+            return element_id
+
+        add_element(root)
+        strings: list[bytes] = [value.encode() for value in string_ids]
+        string_offsets: array = array("q", [0])
+        for value in strings:
+            string_offsets.append(string_offsets[-1] + len(value))
+        header: dict = {"tags": list(tag_ids), "nsmap": [[prefix or "", namespace]
+                                                         for prefix, namespace in root.nsmap.items()]}
+        sections: list[bytes] = [tags.tobytes(), ends.tobytes(), texts.tobytes(),
+                                 array("i", map(get_string_id, heads)).tobytes(),
+                                 array("i", map(get_string_id, tails)).tobytes(),
+                                 string_offsets.tobytes(), b"".join(strings)]
+        return header, sections
+
+
+def write_index_file(index_file: Path, header: dict, sections: list[bytes | memoryview]) -> None:
+    """
+    Write index file, the file is replaced at once so readers never see it half-written.
+    Layout: magic, length of the header, JSON header, sections aligned to 8 bytes (to be cast to arrays of numbers)
+    :param index_file: Path to the index file
+    :param header: Header of the index
+    :param sections: Sections in the order of INDEX_SECTIONS
+    """
+    section_bounds: dict[str, list[int]] = dict()
+    offset: int = 0
+    for name, section in zip(INDEX_SECTIONS, sections):
+        section_bounds[name] = [offset, offset + len(section)]
+        offset += len(section) + (-len(section) % 8)
+    header_bytes: bytes = json.dumps({**header, "version": INDEX_VERSION, "byteorder": sys.byteorder,
+                                      "sections": section_bounds}).encode()
+    index_file.parent.mkdir(parents=True, exist_ok=True)
+    temp_file: Path = index_file.with_name(f".{index_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with temp_file.open("wb") as index:
+        index.write(INDEX_MAGIC)
+        index.write(len(header_bytes).to_bytes(8, "little"))
+        index.write(header_bytes + b" " * (-len(header_bytes) % 8))
+        for section in sections:
+            index.write(section)
+            index.write(b"\0" * (-len(section) % 8))
+    os.replace(temp_file, index_file)
+
+
+def read_index_file(index_file: Path) -> tuple[dict, mmap.mmap] | None:
+    """
+    Map index file into memory and read its header
+    :param index_file: Path to the index file
+    :return: Tuple (header, mapped file) or None if the file is absent or has another format.
+    Bounds of the sections in the header are converted to the offsets in the file
+    """
+    try:
+        with index_file.open("rb") as index:
+            buffer: mmap.mmap = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        if buffer[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError("unknown file format")
+        header_length: int = int.from_bytes(buffer[len(INDEX_MAGIC):len(INDEX_MAGIC) + 8], "little")
+        header: dict = json.loads(buffer[len(INDEX_MAGIC) + 8:len(INDEX_MAGIC) + 8 + header_length])
+        if header.get("version") != INDEX_VERSION or header.get("byteorder") != sys.byteorder:
+            raise ValueError(f'version {header.get("version")} is not supported')
+        data_offset: int = len(INDEX_MAGIC) + 8 + header_length + (-header_length % 8)
+        header["sections"] = {name: [data_offset + start, data_offset + end]
+                              for name, (start, end) in header["sections"].items()}
+        if len(header["sections"]) != len(INDEX_SECTIONS) or \
+                max(end for _, end in header["sections"].values()) > len(buffer):
+            raise ValueError("file is truncated")
+    except (ValueError, KeyError, TypeError) as err:
+        xml_audit_logger.error(f'Index file "{index_file}" is ignored: {err}')
+        buffer.close()
+        return None
+    return header, buffer
+
+
+def get_index_file(index_dir: Path, config_file: Path) -> Path:
+    """
+    Get location of the index of the configuration file, named by the file name and the hash of its absolute path
+    (files of the same name in different directories get different indexes)
+    :param index_dir: Directory with index files
+    :param config_file: Path to the configuration file
+    :return: Path to the index file
+    """
+    path_hash: str = hashlib.blake2b(os.path.abspath(config_file).encode(), digest_size=8).hexdigest()
+    return index_dir / f"{config_file.name}.{path_hash}.idx"
+
+
+def open_config_index(index_dir: Path, config_file: Path, signature: tuple[int, int, int] | None,
+                      content: bytes | None = None) -> ConfigIndex | None:
+    """
+    Open index of the configuration file if it is built from the same content.
+    Index is trusted if the file on the disk has the same mtime, size and inode. Otherwise, the content
+    (if it is already read) is compared by hash, the index of the same content gets the new file version
+    :param index_dir: Directory with index files
+    :param config_file: Path to the configuration file
+    :param signature: Version of the configuration file
+    :param content: Raw content of the configuration file, if it is already read
+    :return: ConfigIndex object or None if there is no valid index
+    """
+    if signature is None:
+        return None
+    index_file: Path = get_index_file(index_dir, config_file)
+    with stage_timer("index_load"):
+        index_data: tuple[dict, mmap.mmap] | None = read_index_file(index_file)
+    if index_data is None:
+        return None
+    header, buffer = index_data
+    config_index: ConfigIndex | None = None
+    try:
+        if header.get("source") != os.path.abspath(config_file):
+            return None
+        if header.get("signature") == list(signature):
+            config_index = ConfigIndex(header, buffer)
+            return config_index
+        if content is None or header.get("content_hash") != get_content_hash(content):
+            return None
+        config_index = ConfigIndex(header, buffer)
+        try:
+            write_index_file(index_file, {**header, "signature": list(signature)},
+                             [memoryview(buffer)[slice(*header["sections"][name])] for name in INDEX_SECTIONS])
+        except OSError as err:
+            xml_audit_logger.error(f'Index file "{index_file}" could not be updated: {err}')
+        return config_index
+    finally:
+        # Mapped file is owned by the index, it is closed here if the index is not used
+        if config_index is None:
+            buffer.close()
+
+
+def save_config_index(index_dir: Path, config_file: Path, signature: tuple[int, int, int] | None, content_hash: str,
+                      root: _Element) -> None:
+    """
+    Build index of the parsed configuration and write it to the index directory
+    :param index_dir: Directory with index files
+    :param config_file: Path to the configuration file
+    :param signature: Version of the configuration file
+    :param content_hash: Hash of the raw content of the configuration file, see get_content_hash
+    :param root: Root element of the parsed configuration
+    """
+    if signature is None:
+        return
+    index_file: Path = get_index_file(index_dir, config_file)
+    header, sections = ConfigIndex.build(root)
+    header.update({"source": os.path.abspath(config_file), "signature": list(signature),
+                   "content_hash": content_hash})
+    try:
+        write_index_file(index_file, header, sections)
+    except OSError as err:
+        xml_audit_logger.error(f'Index file "{index_file}" could not be written: {err}')
+
+
+class IndexedConfigHandler(ConfigHandler):
+    """
+    Query engine answering queries from the index of the configuration, without parsing the XML.
+    Queries which are not plain paths of element names (or filters with quotes in the regex) are
+    sent to the parsed tree, the configuration is parsed on the first such query with load_tree
+    (by default in the calling thread, the configuration cache parses it in the parse pool and caches the tree)
+    """
+
+    def __init__(self, config_file: Path, config_index: ConfigIndex,
+                 load_tree: Callable[[ConfigHandler], ConfigHandler] | None = None):
+        super().__init__(None, ET.Element(config_index.header["tags"][0], nsmap=config_index.nsmap))
+        self.config_file: Path = config_file
+        self.config_index: ConfigIndex = config_index
+        self.load_tree: Callable[[ConfigHandler], ConfigHandler] | None = load_tree
+        self.tree_handler: ConfigHandler | None = None
+        self.tree_lock: threading.Lock = threading.Lock()
+
+    def get_tree_handler(self) -> ConfigHandler:
+        """
+        Parse the configuration for the queries the index cannot answer
+        :return: ConfigHandler object of the parsed configuration
+        """
+        with self.tree_lock:
+            if self.tree_handler is None:
+                self.tree_handler = self.load_tree(self) if self.load_tree is not None \
+                    else ConfigHandler(XMLRoot(self.config_file).xml_root)
+            return self.tree_handler
+
+    def get_tag_ids(self, path: str) -> list[int] | None:
+        """
+        Get tag ids of every step of the relative path
+        :param path: Relative path of element names
+        :return: List of tag ids (-1 for tags absent in the configuration) or None if the path is not plain
+        """
+        tag_ids: list[int] = list()
+        for name in path.split("/"):
+            tag: str | None = self.get_tag(name)
+            if tag is None:
+                return None
+            tag_ids.append(self.config_index.tag_ids.get(tag, -1))
+        return tag_ids
+
+    def compile_query(self, parsed_xpath: list[dc.PathElement]) -> list[tuple[int, list]] | None:
+        """
+        Convert parsed XPATH to the steps over the index
+        :param parsed_xpath: Parsed representation of XPATH
+        :return: List of tuples (tag id, list of filters) or None if the index cannot answer the query.
+        Filter is a tuple (tag ids of the filter path or None for text(), compiled regex or None for no-op filter,
+        unindexed path)
+        """
+        query: list[tuple[int, list]] = list()
+        root_path: str = ""
+        for path_element in parsed_xpath:
+            tag_ids: list[int] | None = self.get_tag_ids(path_element.name)
+            if tag_ids is None or len(tag_ids) != 1:
+                return None
+            root_path += f"{path_element.name}/"
+            filters: list = list()
+            for fltr in path_element.filters:
+                filter_tag_ids: list[int] | None = self.get_tag_ids(fltr.filter_path) if fltr.is_a_path else None
+                if (fltr.is_a_path and filter_tag_ids is None) or '"' in fltr.regexp:
+                    return None
+                try:
+                    # No-op filters are not checked, their values are still read
+                    regex: re.Pattern | None = None if is_match_all(fltr.regexp) else re.compile(fltr.regexp)
+                except re.error:
+                    return None
+                filters.append((filter_tag_ids, regex,
+                                root_path + fltr.filter_path if fltr.is_a_path else root_path))
+            query.append((tag_ids[0], filters))
+        return query
+
+    def match_filter(self, element_id: int, filter_tag_ids: list[int] | None, regex: re.Pattern) -> bool:
+        """
+        Check re:match filter of the element: regex is searched in the string value of the first node of the path
+        """
+        if filter_tag_ids is None:
+            return regex.search(self.config_index.get_first_text_node(element_id)) is not None
+        selected: list[int] = self.config_index.select(element_id, filter_tag_ids)
+        return regex.search(self.config_index.get_string_value(selected[0]) if selected else "") is not None
+
+    def process_query_pipeline(self, parsed_xpath: list[dc.PathElement],
+                               string_xpath: str | None = None) -> list[list[dc.ResultItem]]:
+        """
+        Process Query over the index: find elements of the XPATH level by level => read values of the filters
+        relative to the matched elements
+        :param parsed_xpath: Parsed representation of XPATH
+        :param string_xpath: Used only if the query is sent to the parsed tree
+        :return: List of elements with activated filter and values
+        """
+        query: list[tuple[int, list]] | None = self.compile_query(parsed_xpath)
+        if query is None:
+            return self.get_tree_handler().process_query_pipeline(parsed_xpath, string_xpath)
+        with stage_timer("index_query"):
+            return self.run_index_query(query)
+
+    def explain_query(self, parsed_xpath: list[dc.PathElement]) -> dc.QueryPlan:
+        """
+        Plan the query and estimate its cost from the number of elements on every level of XPATH in the index,
+        queries the index cannot answer are explained by the parsed tree
+        :param parsed_xpath: Parsed representation of XPATH
+        :return: QueryPlan object with the engine running the query and the estimated cost
+        """
+        query: list[tuple[int, list]] | None = self.compile_query(parsed_xpath)
+        if query is None:
+            return self.get_tree_handler().explain_query(parsed_xpath)
+        query_plan: dc.QueryPlan = self.plan_query(parsed_xpath)
+        element_ids: list[int] = [0]
+        for step, (tag_id, _) in zip(query_plan.steps, query):
+            element_ids = [child_id for element_id in element_ids
+                           for child_id in self.config_index.iter_children(element_id)
+                           if self.config_index.tags[child_id] == tag_id]
+            step.candidates = len(element_ids)
+        query_plan.estimated_cost = estimate_cost(query_plan.steps)
+        query_plan.engine = "index"
+        return query_plan
+
+    def run_index_query(self, query: list[tuple[int, list]]) -> list[list[dc.ResultItem]]:
+        """
+        Find elements of the XPATH level by level => read values of the filters relative to the matched elements
+        :param query: Compiled query
+        :return: List of elements with activated filter and values
+        """
+        config_index: ConfigIndex = self.config_index
+        # Every match is a chain of element ids, one per level of the XPATH
+        matches: list[tuple[int, ...]] = [()]
+        for tag_id, filters in query:
+            matches = [(*chain, child_id) for chain in matches
+                       for child_id in config_index.iter_children(chain[-1] if chain else 0)
+                       if config_index.tags[child_id] == tag_id and
+                       all(self.match_filter(child_id, filter_tag_ids, regex)
+                           for filter_tag_ids, regex, _ in filters if regex is not None)]
+        resolved_values: dict[tuple[int, int, int], dc.ResultItem | None] = dict()
+        result_list: list[list[dc.ResultItem]] = list()
+        for chain in matches:
+            result_items: list[dc.ResultItem] = list()
+            for level, (element_id, (_, filters)) in enumerate(zip(chain, query)):
+                for filter_id, (filter_tag_ids, _, unindexed_path) in enumerate(filters):
+                    if (level, filter_id, element_id) not in resolved_values:
+                        selected: list[int] = config_index.select(element_id, filter_tag_ids) \
+                            if filter_tag_ids is not None else [element_id]
+                        if len(selected) != 1:
+                            xml_audit_logger.error(f'Response to the relative query is not unique: "{unindexed_path}"')
+                        resolved_values[level, filter_id, element_id] = dc.ResultItem(
+                            path_attribute=unindexed_path, value=config_index.get_text(selected[0])) \
+                            if len(selected) == 1 else None
+                    query_result: dc.ResultItem | None = resolved_values[level, filter_id, element_id]
+                    if query_result is not None:
+                        result_items.append(query_result)
+            result_list.append(result_items)
+        return result_list
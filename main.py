@@ -1,43 +1,664 @@
-from fastapi import FastAPI, HTTPException
-from config_handler import XpathConstructor, XMLRoot, ConfigHandler
+import asyncio
+import hashlib
+import os
+import time
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable
+import orjson
+from fastapi import FastAPI, HTTPException, Header, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+from config_handler import XMLRoot, XpathConstructor, ConfigHandler, xpath_cache, COMPRESSED_OPENERS, \
+    is_above_streaming_threshold
+from streaming_handler import StreamingConfigHandler
 from pathlib import Path
-from xml_parser_exceptions import XmlConfigurationLoadError
+from xml_parser_cache import config_cache, result_cache, read_config_source, get_file_signature, get_query_key
+from xml_parser_executor import device_executor, parse_executor, device_limiter
+from xml_parser_warmup import config_warmer
+from xml_parser_metrics import DEVICE_QUERY_SECONDS, QUERY_MATCHES, RequestTimings, request_timings, render_metrics
+from xml_parser_exceptions import XmlConfigurationLoadError, DeviceQueryTimeoutError, IncorrectXmlParserApiRequest, \
+    ExecutorSaturatedError
 import xml_parser_dc as dc
-from lxml.etree import _ElementTree
+import xml_parser_settings as settings
 
 xml_parser_app = FastAPI()
 
-def run_query_to_device(xml_query: list, device_name: str) -> list[list[dc.ResultItem]]:
+QUERY_ENGINES: tuple = ("tree", "stream")
+RESPONSE_FORMATS: tuple = ("json", "ndjson", "ndjson-match")
+NDJSON_MEDIA_TYPE: str = "application/x-ndjson"
+# Loads of the configurations in flight by the key of the configuration cache
+config_loads: dict[str, asyncio.Task] = dict()
+
+
+def select_query_engine(device_cfg_location: Path, engine: str | None) -> str:
     """
-    Process API call as a query to particular device
+    Select query engine for a device: requested one or streaming for configurations above the size threshold,
+    size of compressed configurations is taken after decompression
+    :param device_cfg_location: Path to the configuration file
+    :param engine: Engine requested in the API call
+    :return: Name of the engine
+    """
+    if engine:
+        return engine
+    return "stream" if is_above_streaming_threshold(device_cfg_location) else "tree"
+
+
+def get_device_cfg_location(device_name: str, config_dir: str | None = None) -> Path:
+    """
+    Get location of the device configuration
+    :param device_name: Hostname of a device
+    :param config_dir: Directory with configurations, by default the one from the settings
+    :return: Path to the configuration file, compressed one (.gz, .xz) if there is no plain file
+    """
+    device_cfg_location: Path = Path(config_dir or settings.CONFIG_DIR) / device_name
+    if device_cfg_location.is_file():
+        return device_cfg_location
+    for suffix in COMPRESSED_OPENERS:
+        compressed_location: Path = device_cfg_location.with_name(device_cfg_location.name + suffix)
+        if compressed_location.is_file():
+            return compressed_location
+    return device_cfg_location
+
+
+def get_snapshot_dir(snapshot: str | None) -> str | None:
+    """
+    Get directory of the snapshot of the configurations, paths outside the snapshot directory are rejected
+    :param snapshot: Name of the snapshot, i.e. its path relative to the snapshot directory
+    :return: Resolved path to the snapshot or None for the configuration directory
+    """
+    if not snapshot:
+        return None
+    snapshot_root: Path = Path(settings.SNAPSHOT_DIR).resolve()
+    snapshot_dir: Path = (snapshot_root / snapshot).resolve()
+    if snapshot_dir == snapshot_root or not snapshot_dir.is_relative_to(snapshot_root) or not snapshot_dir.is_dir():
+        raise HTTPException(status_code=404, detail=f'Snapshot "{snapshot}" is not found')
+    return str(snapshot_dir)
+
+
+def parse_xml_query(xml_query: list) -> list[dc.PathElement]:
+    """
+    Convert query from the API call to the dataclasses, once for all devices
     :param xml_query: query to the XML config
+    :return: Parsed representation of XPATH
+    """
+    try:
+        return XpathConstructor(xml_query).convert_xpath_to_dataclass()
+    except (IncorrectXmlParserApiRequest, ValueError, TypeError, AttributeError):
+        raise HTTPException(status_code=404, detail=f'Input XML query is not correct')
+
+
+def run_query_to_device(parsed_xpath: list[dc.PathElement], device_name: str,
+                        engine: str | None = None) -> list[list[dc.ResultItem]]:
+    """
+    Process API call as a query to particular device
+    :param parsed_xpath: Parsed representation of the query to the XML config
     :param device_name: Hostname of a device
+    :param engine: Query engine: "tree" (parsed configuration is cached) or "stream" (configuration is not kept)
     :return: Response to the query as a list of ResultItem dataclasses
     """
-    device_cfg_location: Path = Path(f"configurations/{device_name}")
-    adopted_x_path: list[dc.PathElement] = XpathConstructor(xml_query).convert_xpath_to_dataclass()
-    xml_root: _ElementTree = XMLRoot(device_cfg_location).get_xml_root()
-    parsed_configuration = ConfigHandler(xml_root)
-    return parsed_configuration.process_query_pipeline(adopted_x_path)
+    device_cfg_location: Path = get_device_cfg_location(device_name)
+    if select_query_engine(device_cfg_location, engine) == "stream":
+        return StreamingConfigHandler(device_cfg_location).process_query_pipeline(parsed_xpath)
+    parsed_configuration: ConfigHandler = config_cache.get_config_handler(device_cfg_location)
+    return parsed_configuration.process_query_pipeline(parsed_xpath)
 
 
-@xml_parser_app.post("/xml_parser/")
-def run_query_route(query_data: dict):
+def explain_query_to_device(parsed_xpath: list[dc.PathElement], device_name: str,
+                            engine: str | None = None) -> dc.QueryPlan:
+    """
+    Plan a query to particular device without running it
+    :param parsed_xpath: Parsed representation of the query to the XML config
+    :param device_name: Hostname of a device
+    :param engine: Query engine requested in the API call
+    :return: Plan of the query and its estimated cost as QueryPlan dataclass
+    """
+    device_cfg_location: Path = get_device_cfg_location(device_name)
+    if select_query_engine(device_cfg_location, engine) == "stream":
+        return StreamingConfigHandler(device_cfg_location).explain_query(parsed_xpath)
+    return config_cache.get_config_handler(device_cfg_location).explain_query(parsed_xpath)
+
+
+def run_queries_to_config(parsed_configuration: ConfigHandler, parsed_queries: dict[str, list[dc.PathElement]],
+                          translations: dict[tuple[str, str], str]) -> dict[str, list[list[dc.ResultItem]]]:
+    """
+    Run several queries against the same parsed configuration
+    :param parsed_configuration: ConfigHandler object of the parsed configuration
+    :param parsed_queries: Parsed representations of the queries by query name
+    :param translations: String representations of the queries by query name and namespace prefix,
+    shared by all devices of the API call
+    :return: Responses to the queries by query name
+    """
+    device_items: dict[str, list[list[dc.ResultItem]]] = dict()
+    for query_name, parsed_xpath in parsed_queries.items():
+        translation_key: tuple[str, str] = (query_name, parsed_configuration.namespace_prefix)
+        if translation_key not in translations:
+            translations[translation_key] = parsed_configuration.convert_xpath_to_string(parsed_xpath)
+        device_items[query_name] = parsed_configuration.process_query_pipeline(
+            parsed_xpath, string_xpath=translations[translation_key])
+    return device_items
+
+
+def run_queries_to_device(parsed_queries: dict[str, list[dc.PathElement]], translations: dict[tuple[str, str], str],
+                          device_name: str, engine: str | None = None) -> dict[str, list[list[dc.ResultItem]]]:
+    """
+    Process API call as several queries to particular device. With the tree engine configuration is parsed once,
+    with the streaming engine it is parsed again for every query, so the parsed tree is never kept in memory
+    :param parsed_queries: Parsed representations of the queries by query name
+    :param translations: String representations of the queries by query name and namespace prefix,
+    shared by all devices of the API call
+    :param device_name: Hostname of a device
+    :param engine: Query engine: "tree" (parsed configuration is cached) or "stream" (configuration is not kept)
+    :return: Responses to the queries by query name
+    """
+    device_cfg_location: Path = get_device_cfg_location(device_name)
+    if select_query_engine(device_cfg_location, engine) == "stream":
+        streamed_configuration: StreamingConfigHandler = StreamingConfigHandler(device_cfg_location)
+        return {query_name: streamed_configuration.process_query_pipeline(parsed_xpath)
+                for query_name, parsed_xpath in parsed_queries.items()}
+    parsed_configuration: ConfigHandler = config_cache.get_config_handler(device_cfg_location)
+    return run_queries_to_config(parsed_configuration, parsed_queries, translations)
+
+
+def read_snapshot_handler(device_cfg_location: Path) -> ConfigHandler:
+    """
+    Parse configuration of a snapshot without storing it in the cache, so snapshots queried once do not push
+    the current configurations out of the cache
+    :param device_cfg_location: Path to the configuration file in the snapshot
+    :return: ConfigHandler object of the parsed configuration
+    """
+    return ConfigHandler(XMLRoot(device_cfg_location).xml_root)
+
+
+def get_diff_configuration(device_name: str, config_dir: str | None, engine: str | None) -> ConfigHandler:
+    """
+    Get version of the configuration of particular device for a diff query: streamed one, current one from
+    the cache or parsed one from a snapshot
+    :param device_name: Hostname of a device
+    :param config_dir: Directory of the snapshot, None for the current configurations
+    :param engine: Query engine requested in the API call
+    :return: ConfigHandler object of the configuration
+    """
+    device_cfg_location: Path = get_device_cfg_location(device_name, config_dir)
+    if select_query_engine(device_cfg_location, engine) == "stream":
+        return StreamingConfigHandler(device_cfg_location)
+    if config_dir is None:
+        return config_cache.get_config_handler(device_cfg_location)
+    return read_snapshot_handler(device_cfg_location)
+
+
+def run_diff_to_device(parsed_xpath: list[dc.PathElement], key_leaves: list[str] | None, engine: str | None,
+                       base_dir: str | None, target_dir: str | None, device_name: str) -> dc.ResultDiff:
+    """
+    Process API call as a query to two versions of the configuration of particular device
+    :param parsed_xpath: Parsed representation of the query to the XML config
+    :param key_leaves: Filter paths of the key leaves matching the results of two versions
+    :param engine: Query engine requested in the API call
+    :param base_dir: Directory with the base versions of the configurations, None for the current ones
+    :param target_dir: Directory with the target versions of the configurations, None for the current ones
+    :param device_name: Hostname of a device
+    :return: Added, removed and changed results as ResultDiff dataclass
+    """
+    return get_diff_configuration(device_name, base_dir, engine).diff_query_pipeline(
+        get_diff_configuration(device_name, target_dir, engine), parsed_xpath, key_leaves)
+
+
+async def load_config_handler(device_cfg_location: Path) -> ConfigHandler:
+    """
+    Get parsed configuration from the cache, or load it if it is not cached. Concurrent requests to the same
+    configuration share a single load, so they neither read the file again nor take more slots of the parse pool
+    :param device_cfg_location: Path to the configuration file
+    :return: ConfigHandler object of the parsed configuration
+    """
+    parsed_configuration: ConfigHandler | None = await asyncio.to_thread(config_cache.lookup_file,
+                                                                         device_cfg_location)
+    if parsed_configuration is not None:
+        return parsed_configuration
+    key: str = os.path.abspath(device_cfg_location)
+    config_load: asyncio.Task | None = config_loads.get(key)
+    if config_load is None:
+        config_load = config_loads[key] = asyncio.ensure_future(load_config_file(device_cfg_location))
+        config_load.add_done_callback(partial(release_config_load, key))
+    # Load goes on for the rest of the requests if this one is cancelled
+    return await asyncio.shield(config_load)
+
+
+async def load_config_file(device_cfg_location: Path) -> ConfigHandler:
+    """
+    Load configuration which is not cached: from the saved index, otherwise the file is read and parsed in
+    the dedicated pool. Slot of the pool is taken before the file is read, so a rejected request reads nothing
+    :param device_cfg_location: Path to the configuration file
+    :return: ConfigHandler object of the parsed configuration
+    """
+    if config_cache.index_dir is not None:
+        parsed_configuration: ConfigHandler | None = await asyncio.to_thread(config_cache.load_index,
+                                                                             device_cfg_location)
+        if parsed_configuration is not None:
+            return parsed_configuration
+    return await parse_executor.run(read_config_handler, device_cfg_location)
+
+
+def read_config_handler(device_cfg_location: Path) -> ConfigHandler:
+    """
+    Read and parse configuration in the parse pool and store it in the cache
+    :param device_cfg_location: Path to the configuration file
+    :return: ConfigHandler object of the parsed configuration
+    """
+    signature, content = read_config_source(device_cfg_location)
+    return config_cache.load_config_handler(device_cfg_location, signature, content)
+
+
+def release_config_load(key: str, config_load: asyncio.Task) -> None:
+    """
+    Forget finished load of the configuration, its error is retrieved even if all requests waiting for it
+    are cancelled
+    :param key: Key of the configuration in the cache
+    :param config_load: Finished load
+    """
+    if config_loads.get(key) is config_load:
+        del config_loads[key]
+    if not config_load.cancelled():
+        config_load.exception()
+
+
+async def query_device(parsed_xpath: list[dc.PathElement], engine: str | None,
+                       device_name: str) -> list[list[dc.ResultItem]]:
+    """
+    Process API call as a query to particular device without blocking the event loop.
+    Result is taken from the cache if the query is already run on the same version of the configuration
+    :param parsed_xpath: Parsed representation of the query to the XML config
+    :param engine: Query engine requested in the API call
+    :param device_name: Hostname of a device
+    :return: Response to the query as a list of ResultItem dataclasses
+    """
+    start: float = time.perf_counter()
+    device_cfg_location: Path = get_device_cfg_location(device_name)
+    query_key: tuple = get_query_key(parsed_xpath)
+    signature: tuple[int, int, int] | None = await asyncio.to_thread(get_file_signature, device_cfg_location)
+    device_items: list[list[dc.ResultItem]] | None = result_cache.get_result(query_key, device_cfg_location,
+                                                                             signature)
+    cache_status: str = "hit"
+    if device_items is None:
+        cache_status = "miss"
+        device_items = await run_device_query(parsed_xpath, engine, device_cfg_location, device_name)
+        result_cache.put_result(query_key, device_cfg_location, signature, device_items)
+    QUERY_MATCHES.observe(len(device_items))
+    DEVICE_QUERY_SECONDS.observe(time.perf_counter() - start, cache_status)
+    return device_items
+
+
+async def run_device_query(parsed_xpath: list[dc.PathElement], engine: str | None, device_cfg_location: Path,
+                           device_name: str) -> list[list[dc.ResultItem]]:
+    """
+    Run query to particular device in the pools
+    :param parsed_xpath: Parsed representation of the query to the XML config
+    :param engine: Query engine requested in the API call
+    :param device_cfg_location: Path to the configuration file
+    :param device_name: Hostname of a device
+    :return: Response to the query as a list of ResultItem dataclasses
+    """
+    engine = await asyncio.to_thread(select_query_engine, device_cfg_location, engine)
+    if device_executor.use_processes or engine == "stream":
+        # Worker process keeps its own cache, so the whole query is sent to the worker
+        return await device_executor.run(run_query_to_device, parsed_xpath, device_name, engine)
+    parsed_configuration: ConfigHandler = await load_config_handler(device_cfg_location)
+    return await device_executor.run(parsed_configuration.process_query_pipeline, parsed_xpath)
+
+
+async def explain_device(parsed_xpath: list[dc.PathElement], engine: str | None, device_name: str) -> dc.QueryPlan:
+    """
+    Plan a query to particular device without blocking the event loop, the query is not run
+    :param parsed_xpath: Parsed representation of the query to the XML config
+    :param engine: Query engine requested in the API call
+    :param device_name: Hostname of a device
+    :return: Plan of the query and its estimated cost as QueryPlan dataclass
+    """
+    device_cfg_location: Path = get_device_cfg_location(device_name)
+    engine = await asyncio.to_thread(select_query_engine, device_cfg_location, engine)
+    if device_executor.use_processes or engine == "stream":
+        return await device_executor.run(explain_query_to_device, parsed_xpath, device_name, engine)
+    parsed_configuration: ConfigHandler = await load_config_handler(device_cfg_location)
+    return await device_executor.run(parsed_configuration.explain_query, parsed_xpath)
+
+
+async def query_device_diff(parsed_xpath: list[dc.PathElement], key_leaves: list[str] | None, engine: str | None,
+                            base_dir: str | None, target_dir: str | None, device_name: str) -> dc.ResultDiff:
+    """
+    Process API call as a query to two versions of the configuration of particular device without blocking
+    the event loop. Only the current version is kept in the configuration cache
+    :param parsed_xpath: Parsed representation of the query to the XML config
+    :param key_leaves: Filter paths of the key leaves matching the results of two versions
+    :param engine: Query engine requested in the API call
+    :param base_dir: Directory with the base versions of the configurations, checked by get_snapshot_dir
+    :param target_dir: Directory with the target versions of the configurations, checked by get_snapshot_dir
+    :param device_name: Hostname of a device
+    :return: Added, removed and changed results as ResultDiff dataclass
+    """
+    if device_executor.use_processes:
+        return await device_executor.run(run_diff_to_device, parsed_xpath, key_leaves, engine, base_dir,
+                                         target_dir, device_name)
+    base_configuration, target_configuration = await asyncio.gather(
+        load_diff_configuration(engine, base_dir, device_name),
+        load_diff_configuration(engine, target_dir, device_name))
+    return await device_executor.run(base_configuration.diff_query_pipeline, target_configuration, parsed_xpath,
+                                     key_leaves)
+
+
+async def load_diff_configuration(engine: str | None, config_dir: str | None, device_name: str) -> ConfigHandler:
+    """
+    Load version of the configuration of particular device for a diff query without blocking the event loop.
+    Streamed configuration is parsed later, while the query is run
+    :param engine: Query engine requested in the API call
+    :param config_dir: Directory of the snapshot, None for the current configurations
+    :param device_name: Hostname of a device
+    :return: ConfigHandler object of the configuration
+    """
+    device_cfg_location: Path = get_device_cfg_location(device_name, config_dir)
+    if await asyncio.to_thread(select_query_engine, device_cfg_location, engine) == "stream":
+        return StreamingConfigHandler(device_cfg_location)
+    if config_dir is None:
+        return await load_config_handler(device_cfg_location)
+    return await parse_executor.run(read_snapshot_handler, device_cfg_location)
+
+
+async def query_device_batch(parsed_queries: dict[str, list[dc.PathElement]],
+                             translations: dict[tuple[str, str], str], engine: str | None,
+                             device_name: str) -> dict[str, list[list[dc.ResultItem]]]:
+    """
+    Process API call as several queries to particular device without blocking the event loop.
+    Only the queries without cached result for the version of the configuration are run
+    :param parsed_queries: Parsed representations of the queries by query name
+    :param translations: String representations of the queries by query name and namespace prefix
+    :param engine: Query engine requested in the API call
+    :param device_name: Hostname of a device
+    :return: Responses to the queries by query name
+    """
+    start: float = time.perf_counter()
+    device_cfg_location: Path = get_device_cfg_location(device_name)
+    query_keys: dict[str, tuple] = {query_name: get_query_key(parsed_xpath)
+                                    for query_name, parsed_xpath in parsed_queries.items()}
+    signature: tuple[int, int, int] | None = await asyncio.to_thread(get_file_signature, device_cfg_location)
+    device_items: dict[str, list[list[dc.ResultItem]] | None] = {
+        query_name: result_cache.get_result(query_key, device_cfg_location, signature)
+        for query_name, query_key in query_keys.items()}
+    missing_queries: dict[str, list[dc.PathElement]] = {query_name: parsed_queries[query_name]
+                                                        for query_name, query_items in device_items.items()
+                                                        if query_items is None}
+    if not missing_queries:
+        DEVICE_QUERY_SECONDS.observe(time.perf_counter() - start, "hit")
+        return device_items
+    engine = await asyncio.to_thread(select_query_engine, device_cfg_location, engine)
+    if device_executor.use_processes or engine == "stream":
+        missing_items: dict = await device_executor.run(run_queries_to_device, missing_queries, translations,
+                                                        device_name, engine)
+    else:
+        parsed_configuration: ConfigHandler = await load_config_handler(device_cfg_location)
+        missing_items = await device_executor.run(run_queries_to_config, parsed_configuration, missing_queries,
+                                                  translations)
+    for query_name, query_items in missing_items.items():
+        result_cache.put_result(query_keys[query_name], device_cfg_location, signature, query_items)
+        QUERY_MATCHES.observe(len(query_items))
+    DEVICE_QUERY_SECONDS.observe(time.perf_counter() - start, "miss")
+    return {**device_items, **missing_items}
+
+
+def get_device_signatures(device_list: list) -> tuple:
+    """
+    Get versions of the configuration files of the devices
+    :param device_list: List of devices
+    :return: Tuple of tuples (device name, version of the configuration file or None)
+    """
+    return tuple((device_name, get_file_signature(get_device_cfg_location(device_name)))
+                 for device_name in device_list)
+
+
+def get_etag(*response_key) -> str:
+    """
+    Get ETag of the response
+    :param response_key: Everything the response depends on: queries, format, versions of the configurations
+    :return: Quoted ETag value
+    """
+    return f'"{hashlib.blake2b(repr(response_key).encode(), digest_size=16).hexdigest()}"'
+
+
+def is_etag_matched(if_none_match: str | None, etag: str) -> bool:
+    """
+    Check If-None-Match header of the API call
+    :param if_none_match: Value of the header
+    :param etag: ETag of the response
+    :return: True if the caller already has the response
+    """
+    if not if_none_match:
+        return False
+    return any(tag.strip() in (etag, f"W/{etag}", "*") for tag in if_none_match.split(","))
+
+
+def get_device_error(device_name: str, error: BaseException) -> HTTPException:
+    """
+    Convert error of a query to a device to the API response
+    :param device_name: Hostname of a device
+    :param error: Exception raised by the query
+    :return: HTTP exception with status code and description
+    """
+    if isinstance(error, XmlConfigurationLoadError):
+        return HTTPException(status_code=404, detail=f'Configuration of the device "{device_name}" is corrupt or '
+                                                     f'could not be found')
+    if isinstance(error, DeviceQueryTimeoutError):
+        return HTTPException(status_code=504, detail=f'Query to the device "{device_name}" is timed out')
+    if isinstance(error, ExecutorSaturatedError):
+        return HTTPException(status_code=429, detail=f'Too many configurations are being loaded, retry later',
+                             headers={"Retry-After": str(settings.PARSE_RETRY_AFTER)})
+    return HTTPException(status_code=500, detail=f'Query to the device "{device_name}" failed')
+
+
+async def collect_device_results(device_query: Callable[[str], Awaitable], device_list: list) -> dict:
+    """
+    Run query to every device of the API call
+    :param device_query: Coroutine function processing a query to a single device by its name
+    :param device_list: List of devices
+    :return: Responses to the query by device name
+    """
     items = dict()
+    device_results: AsyncIterator = device_limiter.run_device_queries(device_query, device_list)
+    try:
+        for device_name in device_list:
+            try:
+                items.update([await anext(device_results)])
+            except (XmlConfigurationLoadError, DeviceQueryTimeoutError, ExecutorSaturatedError) as err:
+                raise get_device_error(device_name, err)
+    finally:
+        await device_results.aclose()
+    return items
+
+
+def encode_ndjson_record(record: dict) -> bytes:
+    """
+    Serialize a record of NDJSON response
+    :param record: Record as a dictionary
+    :return: JSON line
+    """
+    return orjson.dumps(record) + b"\n"
+
+
+async def stream_device_results(device_query: Callable[[str], Awaitable], device_list: list,
+                                per_match: bool) -> AsyncIterator[bytes]:
+    """
+    Run query to every device of the API call and stream the responses as soon as they are computed.
+    Errors of the devices are streamed as records with "error" and "status_code"
+    :param device_query: Coroutine function processing a query to a single device by its name
+    :param device_list: List of devices
+    :param per_match: Stream a record per match instead of a record per device
+    :return: Iterator of NDJSON lines
+    """
+    async for device_name, result in device_limiter.run_device_queries_unordered(device_query, device_list):
+        if isinstance(result, BaseException):
+            error: HTTPException = get_device_error(device_name, result)
+            yield encode_ndjson_record({"device": device_name, "error": error.detail, "status_code": error.status_code})
+        elif per_match:
+            for match in result:
+                yield encode_ndjson_record({"device": device_name, "match": match})
+        else:
+            yield encode_ndjson_record({"device": device_name, "result": result})
+
+
+async def add_server_timing(request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
+    """
+    Collect time of the stages of the API call and return it in the Server-Timing header.
+    Streamed (NDJSON) responses get no header: the devices are queried while the body is sent, after the headers
+    """
+    timings: RequestTimings = RequestTimings()
+    start: float = time.perf_counter()
+    token = request_timings.set(timings)
+    try:
+        response: Response = await call_next(request)
+    finally:
+        request_timings.reset(token)
+    if response.headers.get("content-type", "").startswith(NDJSON_MEDIA_TYPE):
+        return response
+    response.headers["Server-Timing"] = timings.get_header(time.perf_counter() - start)
+    return response
+
+
+def install_server_timing(app: FastAPI) -> None:
+    """
+    Add Server-Timing header to the responses of the application
+    :param app: FastAPI application
+    """
+    app.add_middleware(BaseHTTPMiddleware, dispatch=add_server_timing)
+
+
+# Middleware runs every API call through an extra task and stream, so it is installed only if the header is enabled
+if settings.SERVER_TIMING:
+    install_server_timing(xml_parser_app)
+
+
+@xml_parser_app.post("/xml_parser/")
+async def run_query_route(query_data: dict, response: Response, if_none_match: str | None = Header(default=None)):
     xpath: list = query_data.get("xpath")
     device_list: list = query_data.get("device_list")
+    engine: str | None = query_data.get("engine")
+    response_format: str = query_data.get("response_format") or "json"
 
     if not xpath:
         raise HTTPException(status_code=404, detail=f'Input XML query is absent')
     if not device_list:
         raise HTTPException(status_code=404, detail=f'Input list of devices is empty')
+    if engine and engine not in QUERY_ENGINES:
+        raise HTTPException(status_code=404, detail=f'Query engine "{engine}" is not supported')
+    if response_format not in RESPONSE_FORMATS:
+        raise HTTPException(status_code=404, detail=f'Response format "{response_format}" is not supported')
 
-    for device_name in device_list:
-        try:
-            items[device_name] = run_query_to_device(xpath, device_name)
-        except XmlConfigurationLoadError:
-            raise HTTPException(status_code=404, detail=f'Configuration of the device "{device_name}" is corrupt or '
-                                                        f'could not be found')
+    parsed_xpath: list[dc.PathElement] = parse_xml_query(xpath)
+    if query_data.get("explain"):
+        return await collect_device_results(partial(explain_device, parsed_xpath, engine), device_list)
+    device_query: Callable = partial(query_device, parsed_xpath, engine)
+    if response_format != "json":
+        return StreamingResponse(stream_device_results(device_query, device_list, response_format == "ndjson-match"),
+                                 media_type=NDJSON_MEDIA_TYPE)
+    etag: str = get_etag("query", get_query_key(parsed_xpath),
+                         await asyncio.to_thread(get_device_signatures, device_list))
+    if is_etag_matched(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    items: dict = await collect_device_results(device_query, device_list)
     if not any(items.values()):
         raise HTTPException(status_code=404, detail=f'Nothing is found in the selected configurations to the request')
+    response.headers["ETag"] = etag
+    return items
+
+
+@xml_parser_app.post("/xml_parser/batch/")
+async def run_batch_query_route(query_data: dict, response: Response,
+                                if_none_match: str | None = Header(default=None)):
+    queries: list = query_data.get("queries")
+    device_list: list = query_data.get("device_list")
+    engine: str | None = query_data.get("engine")
+
+    if not queries:
+        raise HTTPException(status_code=404, detail=f'Input list of XML queries is empty')
+    if not device_list:
+        raise HTTPException(status_code=404, detail=f'Input list of devices is empty')
+    if engine and engine not in QUERY_ENGINES:
+        raise HTTPException(status_code=404, detail=f'Query engine "{engine}" is not supported')
+
+    parsed_queries: dict[str, list[dc.PathElement]] = dict()
+    for query in queries:
+        query_name: str | None = query.get("name")
+        if not query_name or not query.get("xpath"):
+            raise HTTPException(status_code=404, detail=f'Name or XML query is absent in the list of queries')
+        if query_name in parsed_queries:
+            raise HTTPException(status_code=404, detail=f'Name of the query "{query_name}" is not unique')
+        parsed_queries[query_name] = parse_xml_query(query["xpath"])
+
+    etag: str = get_etag("batch", tuple((query_name, get_query_key(parsed_xpath))
+                                        for query_name, parsed_xpath in parsed_queries.items()),
+                         await asyncio.to_thread(get_device_signatures, device_list))
+    if is_etag_matched(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    device_items: dict = await collect_device_results(partial(query_device_batch, parsed_queries, dict(), engine),
+                                                      device_list)
+    items: dict = {query_name: {device_name: query_items[query_name]
+                                for device_name, query_items in device_items.items()}
+                   for query_name in parsed_queries}
+    if not any(any(query_items.values()) for query_items in items.values()):
+        raise HTTPException(status_code=404, detail=f'Nothing is found in the selected configurations to the request')
+    response.headers["ETag"] = etag
     return items
+
+
+@xml_parser_app.post("/xml_parser/diff/")
+async def run_diff_query_route(query_data: dict):
+    device_list: list = query_data.get("device_list")
+    xpath: list = query_data.get("xpath")
+    base_dir: str | None = query_data.get("base_dir")
+    target_dir: str | None = query_data.get("target_dir")
+    key_leaves: list | None = query_data.get("key_leaves")
+    engine: str | None = query_data.get("engine")
+
+    if not xpath:
+        raise HTTPException(status_code=404, detail=f'Input XML query is empty')
+    if not device_list:
+        raise HTTPException(status_code=404, detail=f'Input list of devices is empty')
+    if not base_dir and not target_dir:
+        raise HTTPException(status_code=404, detail=f'Snapshot of the base or target configurations is absent')
+    if not all(isinstance(snapshot, str) for snapshot in (base_dir or "", target_dir or "")):
+        raise HTTPException(status_code=404, detail=f'Snapshot should be a path relative to the snapshot directory')
+    if key_leaves is not None and (not isinstance(key_leaves, list) or
+                                   not all(isinstance(key_leaf, str) for key_leaf in key_leaves)):
+        raise HTTPException(status_code=404, detail=f'Key leaves should be a list of filter paths')
+    if engine and engine not in QUERY_ENGINES:
+        raise HTTPException(status_code=404, detail=f'Query engine "{engine}" is not supported')
+
+    base_dir = await asyncio.to_thread(get_snapshot_dir, base_dir)
+    target_dir = await asyncio.to_thread(get_snapshot_dir, target_dir)
+    parsed_xpath: list[dc.PathElement] = parse_xml_query(xpath)
+    return await collect_device_results(partial(query_device_diff, parsed_xpath, key_leaves, engine, base_dir,
+                                                target_dir), device_list)
+
+
+@xml_parser_app.on_event("startup")
+async def start_config_warmer():
+    if settings.WARM_MODE and not device_executor.use_processes:
+        config_warmer.start()
+
+
+@xml_parser_app.on_event("shutdown")
+async def shutdown_executor():
+    await config_warmer.stop()
+    device_executor.shutdown()
+    parse_executor.shutdown()
+
+
+@xml_parser_app.get("/xml_parser/stats/")
+def get_stats_route():
+    return {"config_cache": config_cache.stats(), "xpath_cache": xpath_cache.stats(),
+            "result_cache": result_cache.stats(), "device_executor": device_executor.stats(),
+            "parse_executor": parse_executor.stats()}
+
+
+@xml_parser_app.get("/xml_parser/status/")
+def get_status_route():
+    return {"warm_mode": config_warmer.status()}
+
+
+@xml_parser_app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics_route():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
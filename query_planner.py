@@ -0,0 +1,134 @@
+import re
+
+from value_index import is_literal, get_literal_prefix
+import xml_parser_dc as dc
+
+# Strategy of a filter -> (cost of the check per candidate element, share of the candidates passing the check).
+# Native XPATH comparisons run in libxml2, re:match calls back into Python for every candidate
+PREDICATE_COSTS: dict[str, tuple[float, float]] = {
+    "equals": (1.0, 0.05),
+    "starts-with": (1.0, 0.2),
+    "contains": (2.0, 0.3),
+    "regex": (25.0, 0.5),
+}
+# Cost of visiting a candidate element of the path
+STEP_COST: float = 1.0
+# Zero-width assertions which could fail at the start of the string
+ASSERTION_MARKERS: tuple = ("$", "\\", "(?")
+
+
+def is_match_all(pattern: str) -> bool:
+    """
+    Check if the regex matches any string, i.e. the filter is a no-op (".*" is set for the filters without regex)
+    :param pattern: Regex of the filter
+    :return: True if re.search matches at the start of every string
+    """
+    if any(marker in pattern for marker in ASSERTION_MARKERS):
+        return False
+    try:
+        return re.match(pattern, "") is not None
+    except re.error:
+        return False
+
+
+def quote_literal(value: str) -> str | None:
+    """
+    Quote string literal of XPATH 1.0, which has no escaping
+    :param value: String value
+    :return: Quoted value or None if the value contains both kinds of quotes
+    """
+    if '"' not in value:
+        return f'"{value}"'
+    if "'" not in value:
+        return f"'{value}'"
+    return None
+
+
+def get_predicate(filter_expression: str, fltr: dc.FilterElement, strategy: str,
+                  literal: str | None = None) -> dc.PredicatePlan:
+    """
+    Build predicate of the filter
+    :param filter_expression: Path of the filter with prepended namespaces
+    :param fltr: Filter of the element
+    :param strategy: Strategy of the check, one of PREDICATE_COSTS
+    :param literal: Literal of the native comparison
+    :return: PredicatePlan object
+    """
+    # re:match tests the string value of the first node of the path, as string() does
+    value: str = f"string({filter_expression})"
+    quoted_literal: str | None = quote_literal(literal) if literal is not None else None
+    if strategy == "equals":
+        # "$" also matches before the trailing newline
+        expression: str = f"({value} = {quoted_literal} or {value} = {quote_literal(literal + chr(10))})"
+    elif strategy == "starts-with":
+        expression = f"starts-with({value}, {quoted_literal})"
+    elif strategy == "contains":
+        expression = f"contains({value}, {quoted_literal})"
+    else:
+        expression = f're:match({filter_expression}, "{fltr.regexp}")'
+    cost, selectivity = PREDICATE_COSTS[strategy]
+    return dc.PredicatePlan(filter_path=fltr.filter_path, regexp=fltr.regexp, strategy=strategy,
+                            expression=expression, cost=cost, selectivity=selectivity)
+
+
+def plan_filter(filter_expression: str, fltr: dc.FilterElement) -> list[dc.PredicatePlan]:
+    """
+    Choose the cheapest check equal to the re:match filter:
+    - match-all regex: no check
+    - exact match (^literal$): equality
+    - literal prefix (^literal): starts-with
+    - literal substring: contains
+    - regex with literal prefix: starts-with before re:match
+    - other regex: re:match
+    :param filter_expression: Path of the filter with prepended namespaces
+    :param fltr: Filter of the element
+    :return: List of predicates, all of them should be true
+    """
+    pattern: str = fltr.regexp
+    if is_match_all(pattern):
+        return list()
+    if pattern.startswith("^") and pattern.endswith("$") and is_literal(pattern[1:-1]) and \
+            quote_literal(pattern[1:-1]) is not None:
+        return [get_predicate(filter_expression, fltr, "equals", pattern[1:-1])]
+    if pattern.startswith("^") and is_literal(pattern[1:]) and quote_literal(pattern[1:]) is not None:
+        return [get_predicate(filter_expression, fltr, "starts-with", pattern[1:])]
+    if is_literal(pattern) and quote_literal(pattern) is not None:
+        return [get_predicate(filter_expression, fltr, "contains", pattern)]
+    prefix: str = get_literal_prefix(pattern)
+    if prefix and quote_literal(prefix) is not None:
+        return [get_predicate(filter_expression, fltr, "starts-with", prefix),
+                get_predicate(filter_expression, fltr, "regex")]
+    return [get_predicate(filter_expression, fltr, "regex")]
+
+
+def order_predicates(predicates: list[dc.PredicatePlan]) -> list[dc.PredicatePlan]:
+    """
+    Order predicates of an element by the static cost and selectivity of their strategies (PREDICATE_COSTS),
+    values of the configuration are not taken into account: the cheapest and the most selective strategy first,
+    the rest are short-circuited. Predicates of the same strategy keep the order of the filters
+    :param predicates: Predicates of the element
+    :return: Ordered predicates
+    """
+    return sorted(predicates, key=lambda predicate: predicate.cost / (1 - predicate.selectivity))
+
+
+def estimate_cost(steps: list[dc.StepPlan]) -> float:
+    """
+    Estimate cost of the query from the number of candidate elements of every step: every candidate is visited and
+    checked by the predicates until the first one fails. Predicates of the previous steps reduce the candidates
+    :param steps: Steps of the plan with the number of candidates
+    :return: Estimated cost in units of visiting an element
+    """
+    total_cost: float = 0.0
+    passed_share: float = 1.0
+    for step in steps:
+        candidates: float = (step.candidates or 0) * passed_share
+        step_cost: float = 0.0
+        reached_share: float = 1.0
+        for predicate in step.predicates:
+            step_cost += predicate.cost * reached_share
+            reached_share *= predicate.selectivity
+        step.cost = candidates * (STEP_COST + step_cost)
+        total_cost += step.cost
+        passed_share *= reached_share
+    return total_cost
@@ -0,0 +1,94 @@
+from collections import defaultdict
+
+import xml_parser_dc as dc
+
+
+def get_key_paths(parsed_xpath: list[dc.PathElement], key_leaves: list[str] | None = None) -> set[str]:
+    """
+    Get unindexed paths of the key leaves identifying a result of the query between two versions of the configuration.
+    By default, the first filter of every element of XPATH is the key (e.g. port-id of port, entry-id of entry)
+    :param parsed_xpath: Parsed representation of XPATH
+    :param key_leaves: Filter paths of the key leaves, if the default keys do not fit
+    :return: Set of unindexed paths, as they are set in the ResultItem path_attribute
+    """
+    key_paths: set[str] = set()
+    root_path: str = ""
+    for path_element in parsed_xpath:
+        root_path += f"{path_element.name}/"
+        for filter_id, fltr in enumerate(path_element.filters):
+            is_key: bool = fltr.filter_path in key_leaves if key_leaves is not None else filter_id == 0
+            if is_key:
+                key_paths.add(root_path + fltr.filter_path if fltr.is_a_path else root_path)
+    return key_paths
+
+
+def group_results(results: list[list[dc.ResultItem]],
+                  key_paths: set[str]) -> dict[tuple, list[list[dc.ResultItem]]]:
+    """
+    Group results of the query by the values of the key leaves
+    :param results: Results of the query
+    :param key_paths: Unindexed paths of the key leaves
+    :return: Results by key, in the document order
+    """
+    grouped_results: dict[tuple, list[list[dc.ResultItem]]] = defaultdict(list)
+    for result_items in results:
+        grouped_results[tuple((result_item.path_attribute, result_item.value) for result_item in result_items
+                              if result_item.path_attribute in key_paths)].append(result_items)
+    return grouped_results
+
+
+def diff_result(before: list[dc.ResultItem], after: list[dc.ResultItem],
+                key_paths: set[str]) -> dc.ResultChange | None:
+    """
+    Compare values of a result matched in both versions of the configuration
+    :param before: Result in the base version
+    :param after: Result in the target version
+    :param key_paths: Unindexed paths of the key leaves
+    :return: ResultChange object or None if values are the same
+    """
+    before_values: dict[str, list] = defaultdict(list)
+    for result_item in before:
+        before_values[result_item.path_attribute].append(result_item.value)
+    after_values: dict[str, list] = defaultdict(list)
+    for result_item in after:
+        after_values[result_item.path_attribute].append(result_item.value)
+    changes: list[dc.ChangedItem] = list()
+    for path_attribute in {**before_values, **after_values}:
+        old_values: list = before_values.get(path_attribute, [])
+        new_values: list = after_values.get(path_attribute, [])
+        if old_values == new_values:
+            continue
+        for value_id in range(max(len(old_values), len(new_values))):
+            old_value = old_values[value_id] if value_id < len(old_values) else None
+            new_value = new_values[value_id] if value_id < len(new_values) else None
+            if old_value != new_value:
+                changes.append(dc.ChangedItem(path_attribute=path_attribute, before=old_value, after=new_value))
+    if not changes:
+        return None
+    return dc.ResultChange(key=[result_item for result_item in after if result_item.path_attribute in key_paths],
+                           changes=changes)
+
+
+def diff_results(before: list[list[dc.ResultItem]], after: list[list[dc.ResultItem]],
+                 key_paths: set[str]) -> dc.ResultDiff:
+    """
+    Compare results of the query to two versions of the configuration. Results are matched by the values of the key
+    leaves, not by the positions of the elements, results with the same key are matched in the document order
+    :param before: Results of the query to the base version
+    :param after: Results of the query to the target version
+    :param key_paths: Unindexed paths of the key leaves
+    :return: ResultDiff object with added, removed and changed results
+    """
+    result_diff: dc.ResultDiff = dc.ResultDiff()
+    before_results: dict[tuple, list[list[dc.ResultItem]]] = group_results(before, key_paths)
+    for key, after_group in group_results(after, key_paths).items():
+        before_group: list[list[dc.ResultItem]] = before_results.pop(key, [])
+        for after_items, before_items in zip(after_group, before_group):
+            result_change: dc.ResultChange | None = diff_result(before_items, after_items, key_paths)
+            if result_change is not None:
+                result_diff.changed.append(result_change)
+        result_diff.added.extend(after_group[len(before_group):])
+        result_diff.removed.extend(before_group[len(after_group):])
+    for before_group in before_results.values():
+        result_diff.removed.extend(before_group)
+    return result_diff
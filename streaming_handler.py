@@ -0,0 +1,167 @@
+from pathlib import Path
+from typing import BinaryIO, Callable
+
+import lxml.etree as ET
+from lxml.etree import _Element, XMLSyntaxError
+from config_handler import XMLRoot, ConfigHandler, XML_PARSER_OPTIONS, LOAD_ERRORS
+from xml_parser_helpers import xml_audit_logger
+import xml_parser_dc as dc
+from xml_parser_exceptions import XmlConfigurationLoadError
+from xml_parser_metrics import stage_timer
+
+
+class StreamingConfigHandler(ConfigHandler):
+    """
+    Query engine parsing configuration with lxml iterparse instead of building the whole tree.
+    Only elements of the XPATH and subtrees used in their filters are kept in memory, and only until
+    the top-level element containing them is processed
+    """
+
+    def __init__(self, config_file: Path):
+        # Namespaces are set once the root element is parsed
+        super().__init__(None)
+        self.config_file: Path = config_file
+        self.config_file_name = config_file.__str__()
+
+    def get_filter_tags(self, path_element: dc.PathElement) -> set[str] | None:
+        """
+        Get tags of the children used in the filters of the XPATH element
+        :param path_element: Element of the XPATH
+        :return: Set of tags or None if any filter is not a plain relative path (all children should be kept)
+        """
+        filter_tags: set[str] = set()
+        for fltr in path_element.filters:
+            if not fltr.is_a_path:
+                continue
+            filter_tag: str | None = self.get_tag(fltr.filter_path.strip("/").split("/")[0])
+            if filter_tag is None or fltr.filter_path.startswith("/"):
+                return None
+            filter_tags.add(filter_tag)
+        return filter_tags
+
+    def process_query_pipeline(self, parsed_xpath: list[dc.PathElement],
+                               string_xpath: str | None = None) -> list[list[dc.ResultItem]]:
+        """
+        Process Query while parsing the configuration: every top-level element matching the XPATH is queried
+        as soon as it is parsed, then it is cleared
+        :param parsed_xpath: Parsed representation of XPATH
+        :param string_xpath: Not used, the query is checked against every top-level element
+        :return: List of elements with activated filter and values
+        """
+        result_list: list[list[dc.ResultItem]] = list()
+        with stage_timer("stream_query"):
+            self.parse_config(lambda config: self.run_iterparse(config, parsed_xpath, result_list))
+        return result_list
+
+    def explain_query(self, parsed_xpath: list[dc.PathElement]) -> dc.QueryPlan:
+        """
+        Plan the query run against every top-level element, only the root element is parsed to read the namespaces.
+        Number of elements is unknown before the configuration is parsed, so the cost is not estimated
+        :param parsed_xpath: Parsed representation of XPATH
+        :return: QueryPlan object with the engine running the query
+        """
+        self.parse_config(self.read_namespaces)
+        query_plan: dc.QueryPlan = self.plan_query(parsed_xpath)
+        query_plan.xpath = f"self::{query_plan.xpath}"
+        query_plan.engine = "stream"
+        return query_plan
+
+    def parse_config(self, run_parser: Callable[[BinaryIO], None]) -> None:
+        """
+        Open the configuration file and parse it
+        :param run_parser: Function parsing the opened configuration file
+        """
+        if not self.config_file.is_file():
+            xml_audit_logger.error(f'File "{self.config_file_name}" does not exists')
+            raise XmlConfigurationLoadError(f'Configuration file "{self.config_file_name}" could not be found')
+        try:
+            with XMLRoot.open_config_file(self.config_file) as config:
+                run_parser(config)
+        except LOAD_ERRORS:
+            xml_audit_logger.error(f'Can not open the file "{self.config_file_name}"')
+            raise XmlConfigurationLoadError(f'Configuration file "{self.config_file_name}" could not be loaded')
+        except XMLSyntaxError as err_code:
+            xml_audit_logger.error(f'Error parsing XML-document "{self.config_file_name}": {err_code}')
+            raise XmlConfigurationLoadError(f'Configuration file "{self.config_file_name}" has not correct XML format')
+
+    def read_namespaces(self, config: BinaryIO) -> None:
+        """
+        Set namespaces of the configuration from its root element
+        :param config: Opened configuration file
+        """
+        for _, elem in ET.iterparse(config, events=("start",), **XML_PARSER_OPTIONS):
+            self.set_namespaces(elem)
+            return
+
+    def run_iterparse(self, config: BinaryIO, parsed_xpath: list[dc.PathElement],
+                      result_list: list[list[dc.ResultItem]]) -> None:
+        """
+        Parse the configuration and collect results of the query.
+        For every open element the number of leading XPATH elements matched by it and its ancestors is tracked,
+        and whether its subtree is needed: it is a part of the XPATH or of the filters of a matched element.
+        Elements which are not needed are removed as soon as they are parsed, so only the matched parts of
+        the current top-level element are kept in memory
+        :param config: Opened configuration file
+        :param parsed_xpath: Parsed representation of XPATH
+        :param result_list: List to record the results to
+        """
+        path_tags: list[str | None] = list()
+        filter_tags: list[set[str] | None] = list()
+        relative_queries: list[tuple[int, str, str | None]] = list()
+        subtree_xpath: str = ""
+        matched_levels: list[int] = list()
+        needed_subtrees: list[bool] = list()
+        for event, elem in ET.iterparse(config, events=("start", "end"), **XML_PARSER_OPTIONS):
+            if event == "start":
+                if not matched_levels:
+                    self.set_namespaces(elem)
+                    path_tags = [self.get_tag(path_element.name) for path_element in parsed_xpath]
+                    filter_tags = [self.get_filter_tags(path_element) for path_element in parsed_xpath]
+                    relative_queries = self.prepare_relative_queries(parsed_xpath)
+                    subtree_xpath = f"self::{self.convert_xpath_to_string(parsed_xpath)}"
+                    matched_levels.append(0)
+                    needed_subtrees.append(True)
+                    continue
+                depth: int = len(matched_levels)
+                parent_level: int = matched_levels[-1]
+                is_matched: bool = parent_level == depth - 1 and depth <= len(path_tags) and \
+                    path_tags[depth - 1] in (None, elem.tag)
+                matched_levels.append(parent_level + 1 if is_matched else parent_level)
+                if is_matched:
+                    needed_subtrees.append(True)
+                elif parent_level == depth - 1:
+                    # Child of a matched element is needed if it is used in the filters of the element
+                    needed_subtrees.append(parent_level > 0 and (filter_tags[parent_level - 1] is None or
+                                                                 elem.tag in filter_tags[parent_level - 1]))
+                else:
+                    needed_subtrees.append(needed_subtrees[-1])
+                continue
+
+            level: int = matched_levels.pop()
+            is_needed: bool = needed_subtrees.pop()
+            depth = len(matched_levels)
+            if depth == 1:
+                if level:
+                    result_list.extend(self.process_subtree(elem, subtree_xpath, relative_queries))
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+            elif not is_needed and needed_subtrees[-1]:
+                # Child of a matched element which is neither the next element of the XPATH nor used in filters
+                elem.clear(keep_tail=True)
+            elif not is_needed and len(elem):
+                # Inside a subtree which cannot match no element is needed, the leaves are dropped with their parent
+                elem.getparent().remove(elem)
+
+    def process_subtree(self, subtree: _Element, subtree_xpath: str,
+                        relative_queries: list[tuple[int, str, str | None]]) -> list[list[dc.ResultItem]]:
+        """
+        Run the query against a top-level element of the configuration
+        :param subtree: Top-level element
+        :param subtree_xpath: XPATH with the first element checked against the top-level element itself
+        :param relative_queries: List of relative queries built by prepare_relative_queries
+        :return: List of elements with activated filter and values
+        """
+        resolved_values: dict[tuple[int, _Element], dc.ResultItem | None] = dict()
+        return [self.run_relative_queries(relative_queries, result_node, resolved_values)
+                for result_node in self.get_compiled_xpath(subtree_xpath)(subtree)]
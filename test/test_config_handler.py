@@ -1,9 +1,14 @@
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 from xml_parser_exceptions import XmlConfigurationLoadError
 from config_handler import XMLRoot
 from pathlib import Path
 from lxml.etree import _ElementTree
-from config_handler import ConfigHandler
+from config_handler import ConfigHandler, XpathConstructor, XPathCache
+from value_index import ValueIndex
+from xml_parser_dc import ResultItem
+import lxml.etree as ET
+import xml_parser_settings as settings
 
 
 current_dir: Path = Path(__file__).resolve().parent
@@ -29,3 +34,95 @@ def test_prepend_namespace(input_x_path, expected_result):
         test_config = ConfigHandler(test_xml_root)
         result = test_config.prepend_namespace(input_x_path)
         assert result == expected_result
+
+
+test_query_1: list = [{'name': 'log'},
+                      {'name': 'log-id', 'filters': [{'filter_path': 'name', 'regexp': ''},
+                                                     {'filter_path': 'description', 'regexp': 'System'}]}]
+query_1_out: list = [[ResultItem(path_attribute='log/log-id/name', value='99'),
+                      ResultItem(path_attribute='log/log-id/description', value='Default System Log')]]
+
+test_query_2: list = [{'name': 'system'}, {'name': 'security'}, {'name': 'aaa'}, {'name': 'local-profiles'},
+                      {'name': 'profile', 'filters': [{'filter_path': 'user-profile-name', 'regexp': 'default'}]},
+                      {'name': 'entry', 'filters': [{'filter_path': 'entry-id', 'regexp': ''},
+                                                    {'filter_path': 'match', 'regexp': '^exec'}]}]
+query_2_out: list = [[ResultItem(path_attribute='system/security/aaa/local-profiles/profile/user-profile-name',
+                                 value='default'),
+                      ResultItem(path_attribute='system/security/aaa/local-profiles/profile/entry/entry-id',
+                                 value='10'),
+                      ResultItem(path_attribute='system/security/aaa/local-profiles/profile/entry/match',
+                                 value='exec')]]
+
+
+# Value index: none, unlimited, too small for any filter
+@pytest.mark.parametrize("value_index_limit", [None, 0, 1])
+@pytest.mark.parametrize("input_query, expected_result", [
+    (test_query_1, query_1_out),
+    (test_query_2, query_2_out),
+])
+def test_process_query_pipeline(input_query, expected_result, value_index_limit):
+    test_xml_root = XMLRoot(XML_CONFIG).get_xml_root()
+    test_config = ConfigHandler(test_xml_root)
+    test_config.value_index = ValueIndex(value_index_limit) if value_index_limit is not None else None
+    parsed_xpath = XpathConstructor(input_query).convert_xpath_to_dataclass()
+    assert test_config.process_query_pipeline(parsed_xpath) == expected_result
+
+
+def test_xpath_cache():
+    test_xpath_cache = XPathCache(max_entries=2)
+    test_config = ConfigHandler(XMLRoot(XML_CONFIG).get_xml_root())
+    first_xpath = test_xpath_cache.get_xpath(xpath_2_3_out, test_config.namespace_map)
+    second_xpath = test_xpath_cache.get_xpath(xpath_2_3_out, dict(test_config.namespace_map))
+    assert first_xpath is second_xpath
+    assert len(first_xpath(test_config.xml_root)) == 24
+    stats: dict = test_xpath_cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+
+def test_xpath_cache_threads():
+    test_xpath_cache = XPathCache(max_entries=1)
+    test_config = ConfigHandler(XMLRoot(XML_CONFIG).get_xml_root())
+    first_xpath = test_xpath_cache.get_xpath(xpath_2_3_out, test_config.namespace_map)
+    # Every thread gets its own copy of the query, queries of other threads do not evict it
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        thread_xpath = executor.submit(test_xpath_cache.get_xpath, xpath_2_3_out, test_config.namespace_map).result()
+        executor.submit(test_xpath_cache.get_xpath, "ns:system", test_config.namespace_map).result()
+        assert thread_xpath is not first_xpath
+        assert test_xpath_cache.get_xpath(xpath_2_3_out, test_config.namespace_map) is first_xpath
+        stats: dict = test_xpath_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["threads"]) == (1, 3, 1, 2)
+
+def test_diff_query_pipeline(tmp_path):
+    target_config = tmp_path / "r1.xml"
+    target_config.write_bytes(XML_CONFIG.read_bytes().replace(b"<match>show system security</match>",
+                                                                 b"<match>show router</match>"))
+    profile_path: list = [{'name': 'system'}, {'name': 'security'}, {'name': 'aaa'}, {'name': 'local-profiles'}]
+    parsed_xpath = XpathConstructor([*profile_path,
+                                     {'name': 'profile', 'filters': [{'filter_path': 'user-profile-name',
+                                                                      'regexp': ''}]},
+                                     {'name': 'entry', 'filters': [{'filter_path': 'entry-id', 'regexp': ''},
+                                                                   {'filter_path': 'match', 'regexp': '^show'}]}]
+                                    ).convert_xpath_to_dataclass()
+    base_handler = ConfigHandler(XMLRoot(XML_CONFIG).xml_root)
+    result_diff = base_handler.diff_query_pipeline(ConfigHandler(XMLRoot(target_config).xml_root), parsed_xpath)
+    assert not result_diff.added and not result_diff.removed
+    assert [(change.before, change.after) for result_change in result_diff.changed
+            for change in result_change.changes] == [("show system security", "show router")]
+    assert [item.path_attribute for item in result_diff.changed[0].key] == \
+           ['system/security/aaa/local-profiles/profile/user-profile-name',
+            'system/security/aaa/local-profiles/profile/entry/entry-id']
+
+
+@pytest.mark.parametrize("use_value_index, expected_engine", [(False, "xpath"), (True, "value_index")])
+def test_explain_query(use_value_index, expected_engine):
+    test_config = ConfigHandler(XMLRoot(XML_CONFIG).xml_root)
+    test_config.value_index = ValueIndex() if use_value_index else None
+    parsed_xpath = XpathConstructor(test_query_2).convert_xpath_to_dataclass()
+    query_plan = test_config.explain_query(parsed_xpath)
+    assert query_plan.engine == expected_engine
+    assert query_plan.xpath == test_config.convert_xpath_to_string(parsed_xpath)
+    assert [step.candidates for step in query_plan.steps] == [1, 1, 1, 1, 2, 24]
+    assert query_plan.estimated_cost > 0
+    # Results of the planned query are equal to the results of re:match filters
+    assert test_config.process_query_pipeline(parsed_xpath) == query_2_out
@@ -0,0 +1,196 @@
+import os
+import shutil
+import threading
+import pytest
+from pathlib import Path
+import indexed_handler
+from config_handler import XMLRoot, ConfigHandler, XpathConstructor
+from indexed_handler import IndexedConfigHandler, open_config_index, save_config_index, get_index_file, \
+    get_content_hash
+from xml_parser_cache import ConfigCache, read_config_source
+from xml_parser_exceptions import ExecutorSaturatedError
+from xml_parser_executor import BoundedExecutor
+
+current_dir: Path = Path(__file__).resolve().parent
+good_config_1: Path = current_dir / Path("test_configurations/good_xml_config.xml")
+
+profile_path: list = [{'name': 'system'}, {'name': 'security'}, {'name': 'aaa'}, {'name': 'local-profiles'}]
+
+test_query_1: list = [{'name': 'log'},
+                      {'name': 'log-id', 'filters': [{'filter_path': 'name', 'regexp': ''},
+                                                     {'filter_path': 'description', 'regexp': 'Log'}]}]
+test_query_2: list = [*profile_path,
+                      {'name': 'profile', 'filters': [{'filter_path': 'user-profile-name', 'regexp': ''}]},
+                      {'name': 'entry', 'filters': [{'filter_path': 'entry-id', 'regexp': ''},
+                                                    {'filter_path': 'match', 'regexp': '^exec'}]}]
+test_query_3: list = [*profile_path,
+                      {'name': 'profile', 'filters': [{'filter_path': 'user-profile-parent/user-profile-child',
+                                                       'regexp': 'target'}]},
+                      {'name': 'default-action', 'filters': [{'filter_path': '', 'regexp': ''}]}]
+test_query_4: list = [{'name': 'system', 'filters': [{'filter_path': 'security', 'regexp': 'exec'}]}]
+test_query_5: list = [{'name': 'system', 'filters': [{'filter_path': 'name[1]', 'regexp': 'SR'}]}]
+
+
+@pytest.fixture
+def config_file(tmp_path) -> Path:
+    shutil.copy(good_config_1, tmp_path / "r1.xml")
+    return tmp_path / "r1.xml"
+
+
+def save_index(config_file: Path, index_dir: Path) -> tuple[int, int, int]:
+    signature, content = read_config_source(config_file)
+    save_config_index(index_dir, config_file, signature, get_content_hash(content),
+                      XMLRoot(config_file).xml_root.getroot())
+    return signature
+
+
+@pytest.mark.parametrize("input_query, uses_tree", [(test_query_1, False), (test_query_2, False),
+                                                    (test_query_3, False), (test_query_4, False),
+                                                    (test_query_5, True)])
+def test_process_query_pipeline(config_file, tmp_path, input_query, uses_tree):
+    signature = save_index(config_file, tmp_path / "index")
+    indexed_handler = IndexedConfigHandler(config_file, open_config_index(tmp_path / "index", config_file, signature))
+    parsed_xpath = XpathConstructor(input_query).convert_xpath_to_dataclass()
+    expected_result = ConfigHandler(XMLRoot(config_file).xml_root).process_query_pipeline(parsed_xpath)
+    assert indexed_handler.process_query_pipeline(parsed_xpath) == expected_result
+    assert (indexed_handler.tree_handler is not None) == uses_tree
+
+
+def test_open_config_index(config_file, tmp_path):
+    signature = save_index(config_file, tmp_path / "index")
+    assert open_config_index(tmp_path / "index", config_file, signature) is not None
+    # Same content with another version of the file is found by hash, the index gets the new version
+    content: bytes = config_file.read_bytes()
+    new_signature = (signature[0] + 1, *signature[1:])
+    assert open_config_index(tmp_path / "index", config_file, new_signature) is None
+    assert open_config_index(tmp_path / "index", config_file, new_signature, content) is not None
+    assert open_config_index(tmp_path / "index", config_file, new_signature) is not None
+    assert open_config_index(tmp_path / "index", config_file, signature, content + b"\n") is None
+    get_index_file(tmp_path / "index", config_file).write_bytes(b"broken index")
+    assert open_config_index(tmp_path / "index", config_file, new_signature) is None
+
+
+def test_open_config_index_close(config_file, tmp_path, monkeypatch):
+    signature = save_index(config_file, tmp_path / "index")
+    read_index_file = indexed_handler.read_index_file
+    buffers: list = list()
+
+    def record_read_index_file(index_file):
+        index_data = read_index_file(index_file)
+        buffers.append(index_data[1])
+        return index_data
+
+    monkeypatch.setattr(indexed_handler, "read_index_file", record_read_index_file)
+    new_signature = (signature[0] + 1, *signature[1:])
+    # Index of another version of the file (without content or with changed content) and of another file
+    assert open_config_index(tmp_path / "index", config_file, new_signature) is None
+    assert open_config_index(tmp_path / "index", config_file, new_signature, b"<configure/>") is None
+    (tmp_path / "r2.xml").write_bytes(config_file.read_bytes())
+    os.replace(get_index_file(tmp_path / "index", config_file), get_index_file(tmp_path / "index", tmp_path / "r2.xml"))
+    assert open_config_index(tmp_path / "index", tmp_path / "r2.xml", signature) is None
+    assert len(buffers) == 3 and all(buffer.closed for buffer in buffers)
+
+
+def test_config_cache_index(config_file, tmp_path):
+    cache = ConfigCache(max_entries=2, max_memory=0, memory_factor=1, index_dir=tmp_path / "index")
+    assert type(cache.get_config_handler(config_file)) is ConfigHandler
+    assert get_index_file(tmp_path / "index", config_file).is_file()
+    # Restart: the index is loaded instead of parsing the file
+    cache = ConfigCache(max_entries=2, max_memory=0, memory_factor=1, index_dir=tmp_path / "index")
+    assert type(cache.get_config_handler(config_file)) is IndexedConfigHandler
+    assert cache.stats()["index_loads"] == 1
+    config_file.write_bytes(config_file.read_bytes().replace(b"SR2", b"SR3"))
+    os.utime(config_file, ns=(0, 0))
+    assert type(cache.get_config_handler(config_file)) is ConfigHandler
+
+
+def test_config_cache_index_replacement(config_file, tmp_path):
+    signature = save_index(config_file, tmp_path / "index")
+    executor = BoundedExecutor(max_workers=1)
+    cache = ConfigCache(max_entries=2, max_memory=0, memory_factor=1, index_dir=tmp_path / "index",
+                        background_executor=executor)
+    index_handler = cache.get_config_handler(config_file)
+    assert type(index_handler) is IndexedConfigHandler
+    # Configuration is parsed in the background, then the parsed tree replaces the index
+    executor.get_executor().shutdown(wait=True)
+    config_handler = cache.get_config_handler(config_file)
+    assert type(config_handler) is ConfigHandler
+    assert cache.stats()["index_replacements"] == 1
+    assert cache.stats()["weight"] == config_file.stat().st_size
+    parsed_xpath = XpathConstructor(test_query_2).convert_xpath_to_dataclass()
+    assert config_handler.process_query_pipeline(parsed_xpath) == index_handler.process_query_pipeline(parsed_xpath)
+    # Entry which is not the index any more is kept
+    cache.replace_index_handler(config_file, signature, index_handler)
+    assert cache.get_config_handler(config_file) is config_handler
+    assert cache.stats()["index_replacements"] == 1
+
+
+
+def test_config_cache_index_background_save(config_file, tmp_path):
+    executor = BoundedExecutor(max_workers=1)
+    cache = ConfigCache(max_entries=2, max_memory=0, memory_factor=1, index_dir=tmp_path / "index",
+                        background_executor=executor)
+    release_event = threading.Event()
+    executor.submit(release_event.wait, 5)
+    # Index is written by the background pool, after the parsed configuration is returned
+    assert type(cache.get_config_handler(config_file)) is ConfigHandler
+    assert not get_index_file(tmp_path / "index", config_file).exists()
+    release_event.set()
+    executor.get_executor().shutdown(wait=True)
+    assert open_config_index(tmp_path / "index", config_file, read_config_source(config_file)[0]) is not None
+
+
+def test_config_cache_index_tree_fallback(config_file, tmp_path):
+    save_index(config_file, tmp_path / "index")
+    executor = BoundedExecutor(max_workers=1, max_pending=1)
+    cache = ConfigCache(max_entries=2, max_memory=0, memory_factor=2, index_dir=tmp_path / "index")
+    index_handler = cache.get_config_handler(config_file)
+    assert type(index_handler) is IndexedConfigHandler and index_handler.value_index is None
+    cache.background_executor = executor
+    parsed_xpath = XpathConstructor(test_query_5).convert_xpath_to_dataclass()
+    # Parse pool is busy: the query the index cannot answer is rejected instead of parsing in the caller's thread
+    release_event = threading.Event()
+    executor.submit(release_event.wait, 5)
+    with pytest.raises(ExecutorSaturatedError):
+        index_handler.process_query_pipeline(parsed_xpath)
+    release_event.set()
+    executor.shutdown()
+    cache.background_executor = BoundedExecutor(max_workers=1)
+    # Tree parsed for the query replaces the index in the cache, its memory is counted
+    result = index_handler.process_query_pipeline(parsed_xpath)
+    assert result == ConfigHandler(XMLRoot(config_file).xml_root).process_query_pipeline(parsed_xpath)
+    assert cache.get_config_handler(config_file) is index_handler.tree_handler
+    assert cache.stats()["weight"] == 2 * config_file.stat().st_size
+    assert cache.stats()["index_replacements"] == 1
+    cache.background_executor.shutdown()
+
+def test_get_index_file(config_file, tmp_path):
+    # Configurations of the same name in different directories, e.g. the current one and its archived version
+    archived_config: Path = tmp_path / "archive" / "r1.xml"
+    archived_config.parent.mkdir()
+    archived_config.write_bytes(config_file.read_bytes().replace(b"SR2", b"SR3"))
+    assert get_index_file(tmp_path / "index", config_file) != get_index_file(tmp_path / "index", archived_config)
+    signature = save_index(config_file, tmp_path / "index")
+    archived_signature = save_index(archived_config, tmp_path / "index")
+    parsed_xpath = XpathConstructor([{'name': 'system', 'filters': [{'filter_path': 'name', 'regexp': ''}]}]) \
+        .convert_xpath_to_dataclass()
+    for input_file, input_signature, name in ((config_file, signature, "SR2"),
+                                              (archived_config, archived_signature, "SR3")):
+        config_index = open_config_index(tmp_path / "index", input_file, input_signature)
+        assert config_index is not None
+        result = IndexedConfigHandler(input_file, config_index).process_query_pipeline(parsed_xpath)
+        assert result == ConfigHandler(XMLRoot(input_file).xml_root).process_query_pipeline(parsed_xpath)
+        assert result[0][0].value == name
+
+
+@pytest.mark.parametrize("input_query, expected_engine", [(test_query_2, "index"), (test_query_5, "xpath")])
+def test_explain_query(config_file, tmp_path, input_query, expected_engine):
+    signature = save_index(config_file, tmp_path / "index")
+    indexed_handler = IndexedConfigHandler(config_file, open_config_index(tmp_path / "index", config_file, signature))
+    parsed_xpath = XpathConstructor(input_query).convert_xpath_to_dataclass()
+    tree_plan = ConfigHandler(XMLRoot(config_file).xml_root).explain_query(parsed_xpath)
+    query_plan = indexed_handler.explain_query(parsed_xpath)
+    assert query_plan.engine == expected_engine
+    assert query_plan.xpath == tree_plan.xpath
+    assert [step.candidates for step in query_plan.steps] == [step.candidates for step in tree_plan.steps]
+    assert query_plan.estimated_cost == tree_plan.estimated_cost
@@ -0,0 +1,300 @@
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import pytest
+from pathlib import Path
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from config_handler import XMLRoot
+from main import xml_parser_app, select_query_engine, install_server_timing, load_config_handler, config_loads
+from xml_parser_cache import config_cache
+import xml_parser_executor
+import xml_parser_settings as settings
+
+current_dir: Path = Path(__file__).resolve().parent
+good_config_1: Path = current_dir / Path("test_configurations/good_xml_config.xml")
+broken_config_1: Path = current_dir / Path("test_configurations/broken_xml_config.xml")
+
+log_query: list = [{'name': 'log'},
+                   {'name': 'log-id', 'filters': [{'filter_path': 'name', 'regexp': ''},
+                                                  {'filter_path': 'description', 'regexp': 'System'}]}]
+log_query_out: list = [[{'path_attribute': 'log/log-id/name', 'value': '99'},
+                        {'path_attribute': 'log/log-id/description', 'value': 'Default System Log'}]]
+system_query: list = [{'name': 'system', 'filters': [{'filter_path': 'name', 'regexp': ''}]}]
+system_query_out: list = [[{'path_attribute': 'system/name', 'value': 'SR2'}]]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch) -> TestClient:
+    (tmp_path / "configurations").mkdir()
+    shutil.copy(good_config_1, tmp_path / "configurations" / "r1.xml")
+    shutil.copy(good_config_1, tmp_path / "configurations" / "r2.xml")
+    shutil.copy(broken_config_1, tmp_path / "configurations" / "r3.xml")
+    monkeypatch.chdir(tmp_path)
+    return TestClient(xml_parser_app)
+
+
+@pytest.mark.parametrize("engine", [None, "tree", "stream"])
+def test_run_query_route(client, engine):
+    response = client.post("/xml_parser/", json={'device_list': ['r2.xml', 'r1.xml'], 'xpath': log_query,
+                                                 'engine': engine})
+    assert response.status_code == 200
+    assert list(response.json().items()) == [('r2.xml', log_query_out), ('r1.xml', log_query_out)]
+
+
+@pytest.mark.parametrize("engine, expected_xpath, expected_candidates", [
+    ("tree", 'ns:log/ns:log-id[contains(string(ns:description), "System")]', [1, 2]),
+    ("stream", 'self::ns:log/ns:log-id[contains(string(ns:description), "System")]', [None, None]),
+])
+def test_run_query_route_explain(client, engine, expected_xpath, expected_candidates):
+    response = client.post("/xml_parser/", json={'device_list': ['r1.xml'], 'xpath': log_query, 'engine': engine,
+                                                 'explain': True})
+    assert response.status_code == 200
+    query_plan: dict = response.json()['r1.xml']
+    assert (query_plan['xpath'], query_plan['engine']) == (expected_xpath, engine.replace("tree", "xpath"))
+    assert [step['candidates'] for step in query_plan['steps']] == expected_candidates
+    assert query_plan['steps'][1]['dropped_filters'] == ['name']
+    assert [predicate['strategy'] for predicate in query_plan['steps'][1]['predicates']] == ['contains']
+    assert "ETag" not in response.headers
+
+
+@pytest.mark.parametrize("query_data", [
+    {'device_list': ['r1.xml'], 'xpath': []},
+    {'device_list': [], 'xpath': log_query},
+    {'device_list': ['r1.xml'], 'xpath': log_query, 'engine': 'unknown'},
+    {'device_list': ['r1.xml'], 'xpath': [{'filters': []}]},
+    {'device_list': ['r1.xml', 'r3.xml'], 'xpath': log_query},
+    {'device_list': ['r1.xml', 'r4.xml'], 'xpath': log_query},
+    {'device_list': ['r1.xml', 'r4.xml'], 'xpath': log_query, 'explain': True},
+    {'device_list': ['r1.xml'], 'xpath': [{'name': 'absent-element'}]},
+])
+def test_run_query_route_errors(client, query_data):
+    assert client.post("/xml_parser/", json=query_data).status_code == 404
+
+
+def test_run_batch_query_route(client):
+    response = client.post("/xml_parser/batch/", json={
+        'device_list': ['r1.xml', 'r2.xml'],
+        'queries': [{'name': 'logs', 'xpath': log_query}, {'name': 'system', 'xpath': system_query}]})
+    assert response.status_code == 200
+    assert response.json() == {'logs': {'r1.xml': log_query_out, 'r2.xml': log_query_out},
+                               'system': {'r1.xml': system_query_out, 'r2.xml': system_query_out}}
+
+
+def test_run_batch_query_route_streaming(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "STREAMING_THRESHOLD_MB", 1)
+    config_file: Path = tmp_path / "configurations" / "r5.xml"
+    config_file.write_bytes(good_config_1.read_bytes().replace(b"</configure>",
+                                                               b" " * 2 * 1024 * 1024 + b"</configure>"))
+    response = client.post("/xml_parser/batch/", json={
+        'device_list': ['r5.xml', 'r1.xml'],
+        'queries': [{'name': 'logs', 'xpath': log_query}, {'name': 'system', 'xpath': system_query}]})
+    assert response.status_code == 200
+    assert response.json() == {'logs': {'r5.xml': log_query_out, 'r1.xml': log_query_out},
+                               'system': {'r5.xml': system_query_out, 'r1.xml': system_query_out}}
+    # Configuration above the threshold is streamed, the one below it is parsed and cached
+    assert config_cache.lookup_file(config_file) is None
+    assert config_cache.lookup_file(tmp_path / "configurations" / "r1.xml") is not None
+
+
+@pytest.mark.parametrize("query_data", [
+    {'device_list': ['r1.xml'], 'queries': []},
+    {'device_list': ['r1.xml'], 'queries': [{'name': 'logs', 'xpath': log_query}], 'engine': 'unknown'},
+    {'device_list': ['r1.xml'], 'queries': [{'name': 'logs'}]},
+    {'device_list': ['r1.xml'], 'queries': [{'name': 'logs', 'xpath': log_query}, {'name': 'logs', 'xpath': log_query}]},
+    {'device_list': ['r3.xml'], 'queries': [{'name': 'logs', 'xpath': log_query}]},
+])
+def test_run_batch_query_route_errors(client, query_data):
+    assert client.post("/xml_parser/batch/", json=query_data).status_code == 404
+
+
+@pytest.mark.parametrize("response_format, expected_records", [
+    ("ndjson", [{'device': 'r1.xml', 'result': log_query_out},
+                {'device': 'r3.xml', 'status_code': 404,
+                 'error': 'Configuration of the device "r3.xml" is corrupt or could not be found'},
+                {'device': 'r2.xml', 'result': log_query_out}]),
+    ("ndjson-match", [{'device': 'r1.xml', 'match': log_query_out[0]},
+                      {'device': 'r3.xml', 'status_code': 404,
+                       'error': 'Configuration of the device "r3.xml" is corrupt or could not be found'},
+                      {'device': 'r2.xml', 'match': log_query_out[0]}]),
+])
+def test_run_query_route_ndjson(client, response_format, expected_records):
+    response = client.post("/xml_parser/", json={'device_list': ['r1.xml', 'r3.xml', 'r2.xml'], 'xpath': log_query,
+                                                 'response_format': response_format})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    records: list = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(records, key=lambda record: record['device']) == \
+           sorted(expected_records, key=lambda record: record['device'])
+
+
+def test_run_query_route_saturated(client, monkeypatch):
+    read_files: list = list()
+    monkeypatch.setattr(XMLRoot, "read_config_file", staticmethod(read_files.append))
+    monkeypatch.setattr(xml_parser_executor.parse_executor, "max_pending", 1)
+    monkeypatch.setattr(xml_parser_executor.parse_executor, "pending", 1)
+    response = client.post("/xml_parser/", json={'device_list': ['r1.xml'], 'xpath': log_query})
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == str(settings.PARSE_RETRY_AFTER)
+    # Request is rejected before the configuration is read
+    assert read_files == []
+
+
+def test_load_config_handler_shared(client, tmp_path, monkeypatch):
+    read_config_file = XMLRoot.read_config_file
+    read_files: list = list()
+
+    def record_read_config_file(config_file: Path) -> bytes:
+        read_files.append(config_file)
+        return read_config_file(config_file)
+
+    monkeypatch.setattr(XMLRoot, "read_config_file", staticmethod(record_read_config_file))
+    monkeypatch.setattr(xml_parser_executor.parse_executor, "max_pending", 1)
+
+    async def load_concurrently() -> list:
+        return await asyncio.gather(*(load_config_handler(tmp_path / "configurations" / "r1.xml") for _ in range(3)))
+
+    # Concurrent requests to the same configuration share a single read and a single slot of the parse pool
+    config_handlers: list = asyncio.run(load_concurrently())
+    assert len(read_files) == 1
+    assert config_handlers[0] is config_handlers[1] is config_handlers[2]
+    assert config_loads == {}
+
+
+def test_run_query_route_etag(client, tmp_path):
+    query_data: dict = {'device_list': ['r1.xml', 'r2.xml'], 'xpath': log_query}
+    response = client.post("/xml_parser/", json=query_data)
+    etag: str = response.headers["etag"]
+    hits: int = client.get("/xml_parser/stats/").json()["result_cache"]["hits"]
+    response = client.post("/xml_parser/", json=query_data)
+    assert response.headers["etag"] == etag
+    assert client.get("/xml_parser/stats/").json()["result_cache"]["hits"] == hits + 2
+    assert client.post("/xml_parser/", json=query_data, headers={"If-None-Match": etag}).status_code == 304
+    # New version of the configuration of a single device
+    config_file: Path = tmp_path / "configurations" / "r1.xml"
+    config_file.write_bytes(config_file.read_bytes().replace(b"Default System Log", b"Changed System Log"))
+    os.utime(config_file, ns=(0, 0))
+    response = client.post("/xml_parser/", json=query_data, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()['r1.xml'][0][1]['value'] == 'Changed System Log'
+    assert response.json()['r2.xml'] == log_query_out
+
+
+def test_run_batch_query_route_etag(client):
+    query_data: dict = {'device_list': ['r1.xml'], 'queries': [{'name': 'logs', 'xpath': log_query}]}
+    etag: str = client.post("/xml_parser/batch/", json=query_data).headers["etag"]
+    assert client.post("/xml_parser/batch/", json=query_data, headers={"If-None-Match": etag}).status_code == 304
+    query_data['queries'].append({'name': 'system', 'xpath': system_query})
+    response = client.post("/xml_parser/batch/", json=query_data, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json() == {'logs': {'r1.xml': log_query_out}, 'system': {'r1.xml': system_query_out}}
+
+
+@pytest.fixture
+def timed_client(client) -> TestClient:
+    timed_app: FastAPI = FastAPI()
+    timed_app.include_router(xml_parser_app.router)
+    install_server_timing(timed_app)
+    return TestClient(timed_app)
+
+
+def test_metrics_route(client, timed_client):
+    query_data: dict = {'device_list': ['r1.xml'], 'xpath': log_query, 'engine': 'tree'}
+    assert "server-timing" not in client.post("/xml_parser/", json=query_data).headers
+    response = timed_client.post("/xml_parser/", json={**query_data, 'device_list': ['r2.xml']})
+    stages: list[str] = [metric.split(";")[0] for metric in response.headers["server-timing"].split(", ")]
+    assert {"read", "parse", "xpath", "relative_queries", "total"}.issubset(stages)
+    # Devices of a streamed response are queried after the headers are sent
+    response = timed_client.post("/xml_parser/", json={**query_data, 'response_format': 'ndjson'})
+    assert response.status_code == 200 and "server-timing" not in response.headers
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'xml_parser_stage_seconds_count{stage="parse"}' in response.text
+    assert 'xml_parser_device_query_seconds_count{cache="miss"}' in response.text
+    assert "xml_parser_parse_bytes_total" in response.text
+
+
+def test_run_query_route_compressed(client, tmp_path):
+    config_dir: Path = tmp_path / "configurations"
+    (config_dir / "r4.xml.gz").write_bytes(gzip.compress(good_config_1.read_bytes()))
+    response = client.post("/xml_parser/", json={'device_list': ['r4.xml', 'r4.xml.gz'], 'xpath': log_query})
+    assert response.status_code == 200
+    assert response.json() == {'r4.xml': log_query_out, 'r4.xml.gz': log_query_out}
+
+
+def test_select_query_engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "STREAMING_THRESHOLD_MB", 1)
+    config_file: Path = tmp_path / "r1.xml.gz"
+    # Compressed file is far below the threshold, decompressed configuration is above it
+    config_file.write_bytes(gzip.compress(b"<configure>" + b" " * 2 * 1024 * 1024 + b"</configure>"))
+    assert config_file.stat().st_size < 1024 * 1024
+    assert select_query_engine(config_file, None) == "stream"
+    assert select_query_engine(config_file, "tree") == "tree"
+
+
+def test_run_diff_query_route(client, tmp_path):
+    (tmp_path / "snapshots" / "archive").mkdir(parents=True)
+    shutil.copy(good_config_1, tmp_path / "snapshots" / "archive" / "r1.xml")
+    shutil.copy(good_config_1, tmp_path / "snapshots" / "archive" / "r2.xml")
+    config_file: Path = tmp_path / "configurations" / "r1.xml"
+    config_file.write_bytes(config_file.read_bytes().replace(b"Default System Log", b"Changed System Log"))
+    response = client.post("/xml_parser/diff/", json={'device_list': ['r1.xml', 'r2.xml'], 'xpath': log_query,
+                                                      'base_dir': 'archive'})
+    assert response.status_code == 200
+    assert response.json() == {
+        'r1.xml': {'added': [], 'removed': [], 'changed': [
+            {'key': [{'path_attribute': 'log/log-id/name', 'value': '99'}],
+             'changes': [{'path_attribute': 'log/log-id/description', 'before': 'Default System Log',
+                          'after': 'Changed System Log'}]}]},
+        'r2.xml': {'added': [], 'removed': [], 'changed': []}}
+    response = client.post("/xml_parser/diff/", json={'device_list': ['r1.xml'], 'xpath': log_query,
+                                                      'base_dir': 'archive', 'key_leaves': ['description']})
+    assert response.json() == {'r1.xml': {'added': [log_query_out[0][:1] + [
+        {'path_attribute': 'log/log-id/description', 'value': 'Changed System Log'}]],
+        'removed': log_query_out, 'changed': []}}
+
+
+@pytest.mark.parametrize("engine, threshold", [(None, 0), ("stream", 0), (None, 1)])
+def test_run_diff_query_route_cache(client, tmp_path, monkeypatch, engine, threshold):
+    monkeypatch.setattr(settings, "STREAMING_THRESHOLD_MB", threshold)
+    (tmp_path / "snapshots" / "archive").mkdir(parents=True)
+    snapshot_file: Path = tmp_path / "snapshots" / "archive" / "r1.xml"
+    # Snapshot is above the threshold, the current configuration is below it
+    snapshot_file.write_bytes(good_config_1.read_bytes().replace(b"Default System Log", b"Changed System Log")
+                              .replace(b"</configure>", b" " * 2 * 1024 * 1024 + b"</configure>"))
+    config_file: Path = tmp_path / "configurations" / "r1.xml"
+    response = client.post("/xml_parser/diff/", json={'device_list': ['r1.xml'], 'xpath': log_query,
+                                                      'target_dir': 'archive', 'engine': engine})
+    assert response.status_code == 200
+    assert [change['after'] for result_change in response.json()['r1.xml']['changed']
+            for change in result_change['changes']] == ['Changed System Log']
+    # Snapshot is never cached, current configuration is cached unless it is streamed
+    assert config_cache.lookup_file(snapshot_file) is None
+    assert (config_cache.lookup_file(config_file) is None) == (engine == "stream")
+
+
+@pytest.mark.parametrize("query_data", [
+    {'device_list': ['r1.xml'], 'xpath': log_query},
+    {'device_list': ['r1.xml'], 'xpath': log_query, 'base_dir': 'archive'},
+    {'device_list': ['r1.xml'], 'xpath': log_query, 'target_dir': 'archive', 'engine': 'unknown'},
+    {'device_list': ['r1.xml'], 'xpath': log_query, 'base_dir': 'archive', 'key_leaves': 'name'},
+    {'device_list': [], 'xpath': log_query, 'base_dir': 'archive'},
+    {'device_list': ['r1.xml'], 'xpath': log_query, 'base_dir': ['archive']},
+])
+def test_run_diff_query_route_errors(client, query_data):
+    assert client.post("/xml_parser/diff/", json=query_data).status_code == 404
+
+
+@pytest.mark.parametrize("snapshot", ['/etc', '../..', '..', '.', '../configurations', 'archive/../../configurations',
+                                      str(Path('/tmp').resolve())])
+def test_run_diff_query_route_outside_snapshots(client, tmp_path, snapshot):
+    (tmp_path / "snapshots" / "archive").mkdir(parents=True)
+    for snapshot_key in ('base_dir', 'target_dir'):
+        response = client.post("/xml_parser/diff/", json={'device_list': ['r1.xml'], 'xpath': log_query,
+                                                          snapshot_key: snapshot})
+        assert response.status_code == 404
+        assert response.json() == {'detail': f'Snapshot "{snapshot}" is not found'}
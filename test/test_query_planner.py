@@ -0,0 +1,61 @@
+import pytest
+from query_planner import is_match_all, quote_literal, plan_filter, order_predicates, estimate_cost
+from xml_parser_dc import FilterElement, PredicatePlan, StepPlan
+
+
+@pytest.mark.parametrize("pattern, expected_result", [
+    (".*", True),
+    ("a*", True),
+    ("^", True),
+    ("", True),
+    ("^$", False),
+    ("\\w*", False),
+    ("(?=a)", False),
+    ("a", False),
+    ("[", False),
+])
+def test_is_match_all(pattern, expected_result):
+    assert is_match_all(pattern) is expected_result
+
+
+def test_quote_literal():
+    assert quote_literal('a"b') == "'a\"b'"
+    assert quote_literal("a'b") == '"a\'b"'
+    assert quote_literal("a'\"b") is None
+
+
+@pytest.mark.parametrize("pattern, expected_result", [
+    (".*", []),
+    ("^1/1/1$", [("equals", '(string(ns:port-id) = "1/1/1" or string(ns:port-id) = "1/1/1\n")')]),
+    ("^1/1", [("starts-with", 'starts-with(string(ns:port-id), "1/1")')]),
+    ("1/1", [("contains", 'contains(string(ns:port-id), "1/1")')]),
+    ("^1/1/[23]", [("starts-with", 'starts-with(string(ns:port-id), "1/1/")'),
+                   ("regex", 're:match(ns:port-id, "^1/1/[23]")')]),
+    ("1/[23]$", [("regex", 're:match(ns:port-id, "1/[23]$")')]),
+    ("a'\"b", [("regex", 're:match(ns:port-id, "a\'"b")')]),
+])
+def test_plan_filter(pattern, expected_result):
+    predicates = plan_filter("ns:port-id", FilterElement(filter_path="port-id", regexp=pattern))
+    assert [(predicate.strategy, predicate.expression) for predicate in predicates] == expected_result
+
+
+def test_order_predicates():
+    predicates = [plan_filter("ns:description", FilterElement("description", "uplink.*"))[0],
+                  plan_filter("ns:mtu", FilterElement("mtu", "9212"))[0],
+                  plan_filter("ns:port-id", FilterElement("port-id", "^1/1/1$"))[0]]
+    assert [predicate.strategy for predicate in order_predicates(predicates)] == ["equals", "contains", "regex"]
+    # Order depends only on the strategy, predicates of the same strategy keep the order of the filters
+    predicates = [plan_filter("ns:mtu", FilterElement("mtu", "9212"))[0],
+                  plan_filter("ns:description", FilterElement("description", "uplink"))[0]]
+    assert [predicate.filter_path for predicate in order_predicates(predicates)] == ["mtu", "description"]
+
+
+def test_estimate_cost():
+    steps = [StepPlan(name="port", candidates=100,
+                      predicates=[PredicatePlan("port-id", "^1/", "starts-with", "", cost=1.0, selectivity=0.2),
+                                  PredicatePlan("mtu", "9212", "contains", "", cost=2.0, selectivity=0.3)]),
+             StepPlan(name="ethernet", candidates=100)]
+    # 100 ports are visited, every one is checked by the first predicate, 20 of them by the second one;
+    # 6 ports pass, so 6 of 100 ethernet elements are visited
+    assert estimate_cost(steps) == pytest.approx(100 * (1 + 1 + 0.2 * 2) + 6)
+    assert steps[0].cost == pytest.approx(240)
@@ -0,0 +1,45 @@
+import pytest
+from config_handler import XpathConstructor
+from result_diff import get_key_paths, diff_results
+from xml_parser_dc import ResultItem, ResultDiff, ResultChange, ChangedItem
+
+port_query: list = [{'name': 'card', 'filters': [{'filter_path': 'slot-number', 'regexp': ''}]},
+                    {'name': 'port', 'filters': [{'filter_path': 'port-id', 'regexp': ''},
+                                                 {'filter_path': 'description', 'regexp': ''}]}]
+
+
+def port(slot: str, port_id: str, description: str | None) -> list[ResultItem]:
+    return [ResultItem('card/slot-number', slot), ResultItem('card/port/port-id', port_id),
+            ResultItem('card/port/description', description)]
+
+
+@pytest.mark.parametrize("key_leaves, expected_result", [
+    (None, {'card/slot-number', 'card/port/port-id'}),
+    (['description'], {'card/port/description'}),
+    ([], set()),
+])
+def test_get_key_paths(key_leaves, expected_result):
+    parsed_xpath = XpathConstructor(port_query).convert_xpath_to_dataclass()
+    assert get_key_paths(parsed_xpath, key_leaves) == expected_result
+
+
+def test_diff_results():
+    key_paths = {'card/slot-number', 'card/port/port-id'}
+    before = [port('1', '1/1/1', 'uplink'), port('1', '1/1/2', 'access'), port('2', '2/1/1', 'access')]
+    # Reordered, one port changed, one removed and one added
+    after = [port('2', '2/1/2', 'access'), port('1', '1/1/2', 'uplink'), port('1', '1/1/1', 'uplink')]
+    assert diff_results(before, after, key_paths) == ResultDiff(
+        added=[port('2', '2/1/2', 'access')],
+        removed=[port('2', '2/1/1', 'access')],
+        changed=[ResultChange(key=[ResultItem('card/slot-number', '1'), ResultItem('card/port/port-id', '1/1/2')],
+                              changes=[ChangedItem('card/port/description', 'access', 'uplink')])])
+    assert diff_results(before, before, key_paths) == ResultDiff()
+
+
+def test_diff_results_duplicate_keys():
+    before = [port('1', '1/1/1', 'a'), port('1', '1/1/1', 'b')]
+    after = [port('1', '1/1/1', 'a'), port('1', '1/1/1', 'c'), port('1', '1/1/1', 'd')]
+    result_diff = diff_results(before, after, {'card/port/port-id'})
+    assert result_diff.added == [port('1', '1/1/1', 'd')]
+    assert [result_change.changes for result_change in result_diff.changed] == \
+           [[ChangedItem('card/port/description', 'b', 'c')]]
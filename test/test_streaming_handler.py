@@ -0,0 +1,100 @@
+import lzma
+import pytest
+from pathlib import Path
+from config_handler import XMLRoot, ConfigHandler, XpathConstructor
+import streaming_handler
+from streaming_handler import StreamingConfigHandler
+from xml_parser_exceptions import XmlConfigurationLoadError
+
+current_dir: Path = Path(__file__).resolve().parent
+
+rigged_config_1: Path = current_dir / Path("test_configurations/non_existing_config.xml")
+rigged_config_2: Path = current_dir / Path("test_configurations/broken_xml_config.xml")
+good_config_1: Path = current_dir / Path("test_configurations/good_xml_config.xml")
+
+profile_path: list = [{'name': 'system'}, {'name': 'security'}, {'name': 'aaa'}, {'name': 'local-profiles'}]
+
+test_query_1: list = [{'name': 'log'},
+                      {'name': 'log-id', 'filters': [{'filter_path': 'name', 'regexp': ''},
+                                                     {'filter_path': 'description', 'regexp': 'Log'}]}]
+test_query_2: list = [*profile_path,
+                      {'name': 'profile', 'filters': [{'filter_path': 'user-profile-name', 'regexp': ''}]},
+                      {'name': 'entry', 'filters': [{'filter_path': 'entry-id', 'regexp': ''},
+                                                    {'filter_path': 'match', 'regexp': '^exec'}]}]
+test_query_3: list = [*profile_path,
+                      {'name': 'profile', 'filters': [{'filter_path': 'user-profile-parent/user-profile-child',
+                                                       'regexp': 'target'}]},
+                      {'name': 'default-action', 'filters': [{'filter_path': '', 'regexp': ''}]}]
+test_query_4: list = [{'name': 'system', 'filters': [{'filter_path': 'name', 'regexp': 'SR'}]}, {'name': 'security'}]
+test_query_5: list = [*profile_path, {'name': 'profile', 'filters': [{'filter_path': 'absent-leaf', 'regexp': '.'}]}]
+
+
+@pytest.mark.parametrize("input_query", [test_query_1, test_query_2, test_query_3, test_query_4, test_query_5])
+def test_process_query_pipeline(input_query):
+    parsed_xpath = XpathConstructor(input_query).convert_xpath_to_dataclass()
+    expected_result = ConfigHandler(XMLRoot(good_config_1).xml_root).process_query_pipeline(parsed_xpath)
+    assert StreamingConfigHandler(good_config_1).process_query_pipeline(parsed_xpath) == expected_result
+
+
+
+def test_process_query_pipeline_arguments():
+    # Streaming engine is called as any other ConfigHandler, with the arguments of the base class
+    parsed_xpath = XpathConstructor(test_query_2).convert_xpath_to_dataclass()
+    tree_handler = ConfigHandler(XMLRoot(good_config_1).xml_root)
+    stream_handler = StreamingConfigHandler(good_config_1)
+    assert stream_handler.value_index is None
+    assert stream_handler.process_query_pipeline(parsed_xpath, None) == \
+        stream_handler.process_query_pipeline(parsed_xpath, string_xpath=tree_handler.convert_xpath_to_string(
+            parsed_xpath)) == tree_handler.process_query_pipeline(parsed_xpath)
+
+@pytest.mark.parametrize("input_xml_file", [rigged_config_1, rigged_config_2])
+def test_process_query_pipeline_exceptions(input_xml_file):
+    parsed_xpath = XpathConstructor(test_query_1).convert_xpath_to_dataclass()
+    with pytest.raises(XmlConfigurationLoadError):
+        StreamingConfigHandler(input_xml_file).process_query_pipeline(parsed_xpath)
+
+
+def test_process_query_pipeline_compressed(tmp_path):
+    config_file: Path = tmp_path / "r1.xml.xz"
+    config_file.write_bytes(lzma.compress(good_config_1.read_bytes()))
+    parsed_xpath = XpathConstructor(test_query_2).convert_xpath_to_dataclass()
+    expected_result = ConfigHandler(XMLRoot(good_config_1).xml_root).process_query_pipeline(parsed_xpath)
+    assert StreamingConfigHandler(config_file).process_query_pipeline(parsed_xpath) == expected_result
+
+
+def test_run_iterparse_nested_memory(tmp_path, monkeypatch):
+    # All services under one top-level element, as in SR OS configurations
+    services: str = "".join(f"<vpls><service-name>vpls-{service}</service-name>"
+                            f"<sap><sap-id>1/1/{service}</sap-id><ingress><qos><policy-name>qos-1</policy-name>"
+                            f"</qos></ingress></sap></vpls>" for service in range(5000))
+    cards: str = "".join(f"<card><slot-number>{card}</slot-number><card-type>iom</card-type>"
+                         f"<mda><mda-slot>1</mda-slot><mda-type>me12</mda-type><port><port-id>{card}/1/1</port-id>"
+                         f"</port></mda></card>" for card in range(1, 5))
+    config_file: Path = tmp_path / "r1.xml"
+    config_file.write_text(f'<configure xmlns="urn:nokia.com:sros:ns:yang:sr:conf"><service>{services}</service>'
+                           f'{cards}</configure>')
+    iterparse = streaming_handler.ET.iterparse
+    peak_elements: list[int] = [0]
+
+    def count_iterparse(*args, **kwargs):
+        root = None
+        for event_id, (event, elem) in enumerate(iterparse(*args, **kwargs)):
+            root = elem if root is None else root
+            yield event, elem
+            if event_id % 1000 == 0:
+                peak_elements[0] = max(peak_elements[0], sum(1 for _ in root.iter()))
+
+    monkeypatch.setattr(streaming_handler.ET, "iterparse", count_iterparse)
+    # 40000 elements are parsed. Elements which cannot match are removed once parsed, only the elements of the chunk
+    # read ahead by the parser are kept: the services do not match the card query, the SAPs are not a part of
+    # the service query. Matched vpls, their names and emptied SAPs are kept until the top-level service is processed
+    for query, max_elements in (([{'name': 'card', 'filters': [{'filter_path': 'slot-number', 'regexp': ''}]},
+                                  {'name': 'mda', 'filters': [{'filter_path': 'mda-type', 'regexp': ''}]}], 3000),
+                                ([{'name': 'service'},
+                                  {'name': 'vpls', 'filters': [{'filter_path': 'service-name', 'regexp': '7$'}]}],
+                                 18000)):
+        parsed_xpath = XpathConstructor(query).convert_xpath_to_dataclass()
+        peak_elements[0] = 0
+        result = StreamingConfigHandler(config_file).process_query_pipeline(parsed_xpath)
+        assert result == ConfigHandler(XMLRoot(config_file).xml_root).process_query_pipeline(parsed_xpath)
+        assert peak_elements[0] < max_elements
@@ -0,0 +1,57 @@
+import pytest
+import lxml.etree as ET
+from value_index import PathValues, ValueIndex, get_literal_prefix, has_fast_path
+
+
+@pytest.mark.parametrize("pattern, expected_prefix", [
+    ("^uplink", "uplink"),
+    ("^uplink to r1[0-9]$", "uplink to r1"),
+    ("^ab*c", "a"),
+    ("^ab+c", "ab"),
+    ("^a|b", ""),
+    ("uplink", ""),
+    ("^.*", ""),
+])
+def test_get_literal_prefix(pattern, expected_prefix):
+    assert get_literal_prefix(pattern) == expected_prefix
+
+
+@pytest.mark.parametrize("pattern, expected_result", [("^10$", True), ("^1", True), ("10g", True),
+                                                      (".*", False), ("[0-9]+", False)])
+def test_has_fast_path(pattern, expected_result):
+    assert has_fast_path(pattern) == expected_result
+
+
+@pytest.mark.parametrize("pattern, expected_ids", [
+    ("^10g$", [1, 4]),
+    ("^1", [0, 1, 3, 4]),
+    ("0g", [1, 3, 4]),
+    ("g$", [0, 1, 3, 4]),
+    ("^100g\n?$", [3]),
+    ("^absent", []),
+])
+def test_path_values_find(pattern, expected_ids):
+    values: list = ["1g", "10g", "", "100g\n", "10g"]
+    elements: list = [ET.Element("mda", id=str(element_id)) for element_id in range(len(values))]
+    found: list = PathValues(elements, values).find(pattern)
+    assert [int(element.get("id")) for element in found] == expected_ids
+
+
+def test_value_index_limit():
+    value_index = ValueIndex(max_elements=4)
+    built_paths: list = list()
+
+    def build(element_path: str, filter_path: str) -> PathValues:
+        built_paths.append(element_path)
+        count: int = int(element_path)
+        return PathValues([ET.Element("port") for _ in range(count)], [str(value) for value in range(count)])
+
+    assert len(value_index.get_path_values("2", "name", build).elements) == 2
+    assert len(value_index.get_path_values("2", "name", build).elements) == 2
+    # Values of the least recently used filter are dropped to fit the limit
+    value_index.get_path_values("3", "name", build)
+    value_index.get_path_values("2", "name", build)
+    # Filter of more elements than the whole limit is not indexed
+    assert len(value_index.get_path_values("5", "name", build).elements) == 5
+    assert value_index.get_path_values("5", "name", build) is None
+    assert built_paths == ["2", "3", "2", "5"]
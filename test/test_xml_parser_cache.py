@@ -0,0 +1,157 @@
+import gzip
+import os
+import shutil
+import threading
+import time
+import pytest
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from config_handler import XMLRoot, XpathConstructor
+import xml_parser_cache
+from xml_parser_cache import ConfigCache, QueryResultCache, get_query_key, read_config_source
+from xml_parser_helpers import LRUCache
+from xml_parser_exceptions import XmlConfigurationLoadError
+
+current_dir: Path = Path(__file__).resolve().parent
+good_config_1: Path = current_dir / Path("test_configurations/good_xml_config.xml")
+
+
+@pytest.fixture
+def config_copy(tmp_path) -> Path:
+    config_file: Path = tmp_path / "r1.xml"
+    shutil.copy(good_config_1, config_file)
+    return config_file
+
+
+def test_lru_cache_eviction_by_entries():
+    cache = LRUCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_cache_eviction_by_weight():
+    cache = LRUCache(max_entries=10, max_weight=100)
+    cache.put("a", 1, weight=60)
+    cache.put("b", 2, weight=60)
+    assert cache.get("a") is None
+    assert cache.stats()["weight"] == 60
+    assert cache.put("c", 3, weight=101) is False
+
+
+def test_config_cache_hit_and_miss(config_copy):
+    cache = ConfigCache(max_entries=4, max_memory=0, memory_factor=6)
+    first_handler = cache.get_config_handler(config_copy)
+    second_handler = cache.get_config_handler(config_copy)
+    assert first_handler is second_handler
+    stats: dict = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_config_cache_invalidation(config_copy):
+    cache = ConfigCache(max_entries=4, max_memory=0, memory_factor=6)
+    first_handler = cache.get_config_handler(config_copy)
+    with config_copy.open("a") as config:
+        config.write("\n")
+    second_handler = cache.get_config_handler(config_copy)
+    assert first_handler is not second_handler
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_config_cache_removed_file(config_copy):
+    cache = ConfigCache(max_entries=4, max_memory=0, memory_factor=6)
+    cache.get_config_handler(config_copy)
+    os.remove(config_copy)
+    with pytest.raises(XmlConfigurationLoadError):
+        cache.get_config_handler(config_copy)
+    assert cache.stats()["entries"] == 0
+
+
+def test_config_cache_compressed_weight(tmp_path):
+    config_file: Path = tmp_path / "r1.xml.gz"
+    config_file.write_bytes(gzip.compress(good_config_1.read_bytes()))
+    cache = ConfigCache(max_entries=4, max_memory=0, memory_factor=6)
+    cache.get_config_handler(config_file)
+    # Weight is taken from the decompressed size, not from the size of the file
+    assert cache.stats()["weight"] == good_config_1.stat().st_size * 6
+    signature, content = read_config_source(config_file)
+    cache.clear()
+    cache.load_config_handler(config_file, signature, content)
+    assert cache.stats()["weight"] == good_config_1.stat().st_size * 6
+
+
+def test_query_result_cache(config_copy):
+    parsed_xpath = XpathConstructor([{'name': 'system', 'filters': [{'filter_path': 'name', 'regexp': ''}]}]
+                                    ).convert_xpath_to_dataclass()
+    query_key = get_query_key(parsed_xpath)
+    assert query_key == get_query_key(XpathConstructor([{'name': ' system ', 'filters': [{'filter_path': ' name ', 'regexp': '.*'}]}]
+                                                       ).convert_xpath_to_dataclass())
+    cache = QueryResultCache(max_entries=10, max_weight=3)
+    cache.put_result(query_key, config_copy, (1, 2, 3), [["item"]])
+    assert cache.get_result(query_key, config_copy, (1, 2, 3)) == [["item"]]
+    assert cache.get_result(query_key, config_copy, (1, 2, 4)) is None
+    # Absent file has no version, result is not cached
+    cache.put_result(query_key, config_copy, None, [["item"]])
+    assert cache.get_result(query_key, config_copy, None) is None
+    cache.put_result(query_key, config_copy, (1, 2, 4), [["item", "item"], ["item"]])
+    assert cache.get_result(query_key, config_copy, (1, 2, 4)) is None
+
+
+def test_config_cache_reload(config_copy, monkeypatch):
+    cache = ConfigCache(max_entries=4, max_memory=0, memory_factor=6)
+    old_handler = cache.get_config_handler(config_copy)
+    with config_copy.open("a") as config:
+        config.write("\n")
+    parse_started: threading.Event = threading.Event()
+    parse_released: threading.Event = threading.Event()
+    parsed_files: list[Path] = list()
+
+    class SlowXMLRoot(XMLRoot):
+        def __init__(self, config_file: Path, content: bytes | None = None):
+            parsed_files.append(config_file)
+            parse_started.set()
+            parse_released.wait(5)
+            super().__init__(config_file, content)
+
+    monkeypatch.setattr(xml_parser_cache, "XMLRoot", SlowXMLRoot)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        reload: Future = executor.submit(cache.get_config_handler, config_copy)
+        assert parse_started.wait(5)
+        # Outdated entry stays in the cache while the new version is parsed
+        assert cache.entries[os.path.abspath(config_copy)][0].config_handler is old_handler
+        # Configuration read by an API call waits for the same parse instead of parsing it again
+        signature, content = read_config_source(config_copy)
+        load: Future = executor.submit(cache.load_config_handler, config_copy, signature, content)
+        parse_released.set()
+        new_handler = reload.result()
+        assert load.result() is new_handler is not old_handler
+    assert parsed_files == [config_copy]
+    assert (cache.stats()["entries"], cache.stats()["invalidations"]) == (1, 1)
+
+
+def test_config_cache_loading_locks():
+    cache = ConfigCache(max_entries=4, max_memory=0, memory_factor=6)
+    loading_started: threading.Event = threading.Event()
+    loading_released: threading.Event = threading.Event()
+
+    def load() -> None:
+        with cache.loading("r1.xml"):
+            loading_started.set()
+            loading_released.wait(5)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with cache.loading("r1.xml"):
+            waiting_load: Future = executor.submit(load)
+            while cache.loading_locks["r1.xml"][1] < 2:
+                time.sleep(0.001)
+        assert loading_started.wait(5)
+        # Lock is kept while the waiting request loads the configuration, new requests wait for the same lock
+        loading_lock, waiters = cache.loading_locks["r1.xml"]
+        assert waiters == 1 and loading_lock.locked()
+        loading_released.set()
+        waiting_load.result()
+    assert cache.loading_locks == {}
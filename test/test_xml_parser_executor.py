@@ -0,0 +1,161 @@
+import asyncio
+import contextvars
+import threading
+import time
+import pytest
+from functools import partial
+from xml_parser_executor import BoundedExecutor, DeviceQueryLimiter
+from xml_parser_exceptions import XmlConfigurationLoadError, DeviceQueryTimeoutError, ExecutorSaturatedError
+from xml_parser_metrics import RequestTimings, request_timings, render_metrics, stage_timer
+
+device_list: list = ["r1.xml", "r2.xml", "r3.xml", "r4.xml", "r5.xml"]
+query_delays: dict = {"r1.xml": 0.05, "r2.xml": 0.0, "r3.xml": 0.02, "r4.xml": 0.0, "r5.xml": 0.01}
+
+
+def query_device_sync(delays: dict, device_name: str) -> str:
+    if delays.get(device_name) is None:
+        raise XmlConfigurationLoadError(device_name)
+    time.sleep(delays[device_name])
+    return device_name.upper()
+
+
+def run_stage(stage: str) -> str:
+    with stage_timer(stage):
+        return stage.upper()
+
+
+def get_device_query(executor: BoundedExecutor, delays: dict):
+    async def query_device(device_name: str) -> str:
+        return await executor.run(query_device_sync, delays, device_name)
+    return query_device
+
+
+async def collect_ordered(limiter: DeviceQueryLimiter, device_query, count: int | None = None) -> list:
+    results: list = list()
+    device_results = limiter.run_device_queries(device_query, device_list)
+    try:
+        async for device_result in device_results:
+            results.append(device_result)
+            if len(results) == count:
+                break
+    finally:
+        await device_results.aclose()
+    return results
+
+
+async def collect_unordered(limiter: DeviceQueryLimiter, device_query) -> dict:
+    return {device_name: result
+            async for device_name, result in limiter.run_device_queries_unordered(device_query, device_list)}
+
+
+@pytest.mark.parametrize("max_workers, max_concurrency", [(1, 0), (4, 0), (4, 2)])
+def test_run_device_queries_order(max_workers, max_concurrency):
+    executor = BoundedExecutor(max_workers=max_workers)
+    limiter = DeviceQueryLimiter(max_concurrency=max_concurrency)
+    results: list = asyncio.run(collect_ordered(limiter, get_device_query(executor, query_delays)))
+    assert results == [(device_name, device_name.upper()) for device_name in device_list]
+    executor.shutdown()
+
+
+def test_run_device_queries_exception():
+    executor = BoundedExecutor(max_workers=4)
+    broken_delays: dict = {**query_delays, "r3.xml": None}
+    limiter = DeviceQueryLimiter()
+    assert [device_name for device_name, _ in asyncio.run(
+        collect_ordered(limiter, get_device_query(executor, broken_delays), count=2))] == ["r1.xml", "r2.xml"]
+    with pytest.raises(XmlConfigurationLoadError):
+        asyncio.run(collect_ordered(limiter, get_device_query(executor, broken_delays)))
+    executor.shutdown()
+
+
+def test_run_device_queries_cancel():
+    executor = BoundedExecutor(max_workers=4)
+    broken_delays: dict = {**query_delays, "r3.xml": None, "r4.xml": None, "r5.xml": 1}
+    finished: list = list()
+
+    async def query_device(device_name: str) -> str:
+        try:
+            return await executor.run(query_device_sync, broken_delays, device_name)
+        finally:
+            finished.append(device_name)
+
+    async def collect_broken() -> None:
+        with pytest.raises(XmlConfigurationLoadError):
+            await collect_ordered(DeviceQueryLimiter(), query_device)
+        # Query to r5.xml is cancelled and failed query to r4.xml is awaited before the call is aborted
+        assert sorted(finished) == device_list
+
+    asyncio.run(collect_broken())
+    executor.shutdown()
+
+
+def test_run_device_queries_timeout():
+    executor = BoundedExecutor(max_workers=2)
+    slow_delays: dict = {**query_delays, "r2.xml": 1}
+    with pytest.raises(DeviceQueryTimeoutError):
+        asyncio.run(collect_ordered(DeviceQueryLimiter(device_timeout=0.1), get_device_query(executor, slow_delays)))
+    executor.shutdown()
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_run_device_queries_unordered(max_workers):
+    executor = BoundedExecutor(max_workers=max_workers)
+    broken_delays: dict = {**query_delays, "r3.xml": None}
+    results: dict = asyncio.run(collect_unordered(DeviceQueryLimiter(), get_device_query(executor, broken_delays)))
+    assert isinstance(results.pop("r3.xml"), XmlConfigurationLoadError)
+    assert results == {device_name: device_name.upper() for device_name in device_list if device_name != "r3.xml"}
+    executor.shutdown()
+
+
+def test_run_device_queries_unordered_timeout():
+    executor = BoundedExecutor(max_workers=2)
+    slow_delays: dict = {**query_delays, "r2.xml": 1}
+    results: dict = asyncio.run(collect_unordered(DeviceQueryLimiter(device_timeout=0.1),
+                                                  get_device_query(executor, slow_delays)))
+    assert isinstance(results.pop("r2.xml"), DeviceQueryTimeoutError)
+    assert results == {device_name: device_name.upper() for device_name in device_list if device_name != "r2.xml"}
+    executor.shutdown()
+
+
+def test_bounded_executor_saturation():
+    executor = BoundedExecutor(max_workers=1, max_pending=2)
+    release_event = threading.Event()
+
+    async def run_tasks() -> list:
+        tasks: list = [asyncio.ensure_future(executor.run(release_event.wait, 5)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert executor.stats()["pending"] == 2
+        release_event.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results: list = asyncio.run(run_tasks())
+    assert results[:2] == [True, True]
+    assert isinstance(results[2], ExecutorSaturatedError)
+    assert executor.stats() == {"max_workers": 1, "max_pending": 2, "pending": 0, "rejected": 1}
+    assert asyncio.run(executor.run(partial(query_device_sync, query_delays), "r2.xml")) == "R2.XML"
+    executor.shutdown()
+
+
+def test_bounded_executor_submit_context():
+    executor = BoundedExecutor(max_workers=1)
+    request_id: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
+    request_id.set("r1")
+    assert executor.submit(request_id.get).result() == "r1"
+    # Background tasks do not record anything into the context of the caller
+    assert executor.submit(request_id.get, in_caller_context=False).result() is None
+    executor.shutdown()
+
+
+def test_bounded_executor_process_stage_times():
+    executor = BoundedExecutor(max_workers=1, use_processes=True)
+    timings = RequestTimings()
+
+    async def run_in_process() -> str:
+        request_timings.set(timings)
+        return await executor.run(run_stage, "process_stage")
+
+    # Stage measured in the worker process is recorded by the API server process
+    assert asyncio.run(run_in_process()) == "PROCESS_STAGE"
+    assert list(timings.stages) == ["process_stage"]
+    assert 'xml_parser_stage_seconds_count{stage="process_stage"} 1' in render_metrics()
+    executor.shutdown()
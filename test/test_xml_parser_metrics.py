@@ -0,0 +1,38 @@
+from xml_parser_metrics import Counter, Histogram, RequestTimings, request_timings, stage_timer, render_metrics
+
+
+def test_histogram_render():
+    histogram = Histogram("test_seconds", "Test histogram", (0.1, 1.0), ("stage",))
+    histogram.observe(0.05, "parse")
+    histogram.observe(0.1, "parse")
+    histogram.observe(5, "parse")
+    assert histogram.render() == ['# HELP test_seconds Test histogram', '# TYPE test_seconds histogram',
+                                  'test_seconds_bucket{stage="parse",le="0.1"} 2',
+                                  'test_seconds_bucket{stage="parse",le="1"} 2',
+                                  'test_seconds_bucket{stage="parse",le="+Inf"} 3',
+                                  'test_seconds_sum{stage="parse"} 5.15',
+                                  'test_seconds_count{stage="parse"} 3']
+
+
+def test_counter_render():
+    counter = Counter("test_total", "Test counter")
+    counter.inc(10)
+    counter.inc(5)
+    assert counter.render()[-1] == "test_total 15"
+
+
+def test_stage_timer():
+    timings = RequestTimings()
+    token = request_timings.set(timings)
+    try:
+        with stage_timer("test_stage"):
+            pass
+        with stage_timer("test_stage"):
+            pass
+    finally:
+        request_timings.reset(token)
+    with stage_timer("test_stage"):
+        pass
+    assert list(timings.stages) == ["test_stage"]
+    assert timings.get_header(0.5).endswith("total;dur=500.000")
+    assert 'xml_parser_stage_seconds_count{stage="test_stage"} 3' in render_metrics()
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import shutil
+import pytest
+import watchfiles
+from pathlib import Path
+from xml_parser_cache import config_cache
+from xml_parser_executor import BoundedExecutor
+from xml_parser_warmup import ConfigWarmer
+import xml_parser_settings as settings
+
+current_dir: Path = Path(__file__).resolve().parent
+good_config_1: Path = current_dir / Path("test_configurations/good_xml_config.xml")
+broken_config_1: Path = current_dir / Path("test_configurations/broken_xml_config.xml")
+
+
+@pytest.fixture
+def config_dir(tmp_path) -> Path:
+    shutil.copy(good_config_1, tmp_path / "r1.xml")
+    shutil.copy(good_config_1, tmp_path / "r2.xml")
+    shutil.copy(broken_config_1, tmp_path / "r3.xml")
+    config_cache.clear()
+    return tmp_path
+
+
+async def wait_for(condition, timeout: float = 10) -> None:
+    deadline: float = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.05)
+
+
+def test_preload(config_dir):
+    executor = BoundedExecutor(max_workers=2, max_pending=2)
+    warmer = ConfigWarmer(config_dir, executor)
+    asyncio.run(warmer.preload())
+    status: dict = warmer.status()
+    assert (status["state"], status["files"], status["loaded"], status["failed"], status["warm_set"]) == \
+           ("loading", 3, 2, 1, 2)
+    assert config_cache.lookup_file(config_dir / "r1.xml") is not None
+    assert config_cache.lookup_file(config_dir / "r3.xml") is None
+    executor.shutdown()
+
+
+
+def test_preload_streamed(config_dir, monkeypatch):
+    monkeypatch.setattr(settings, "STREAMING_THRESHOLD_MB", 1)
+    (config_dir / "r4.xml").write_bytes(b"<configure>" + b" " * 1024 * 1024 + b"</configure>")
+    executor = BoundedExecutor(max_workers=2)
+    warmer = ConfigWarmer(config_dir, executor)
+    asyncio.run(warmer.preload())
+    status: dict = warmer.status()
+    # Configuration above the streaming threshold is never parsed into a tree
+    assert (status["files"], status["loaded"], status["failed"], status["skipped"]) == (3, 2, 1, 1)
+    assert config_cache.lookup_file(config_dir / "r4.xml") is None
+    # File which has grown above the threshold is dropped from the cache instead of being parsed again
+    (config_dir / "r1.xml").write_bytes((config_dir / "r4.xml").read_bytes())
+    asyncio.run(warmer.apply_change(config_dir / "r1.xml", watchfiles.Change.modified))
+    assert (warmer.skipped, warmer.reloads, warmer.status()["warm_set"]) == (2, 0, 1)
+    assert os.path.abspath(config_dir / "r1.xml") not in config_cache.entries
+    executor.shutdown()
+
+def test_watch(config_dir):
+    executor = BoundedExecutor(max_workers=2)
+    warmer = ConfigWarmer(config_dir, executor)
+
+    async def run_warmer() -> None:
+        warmer.start()
+        await wait_for(lambda: warmer.state == "watching")
+        old_handler = config_cache.lookup_file(config_dir / "r1.xml")
+        # Give the watcher time to start before changing the files
+        await asyncio.sleep(0.5)
+        (config_dir / "r1.xml").write_bytes(good_config_1.read_bytes().replace(b"SR2", b"SR3"))
+        (config_dir / "r2.xml").unlink()
+        await wait_for(lambda: warmer.reloads and warmer.removals)
+        new_handler = config_cache.lookup_file(config_dir / "r1.xml")
+        assert new_handler is not None and new_handler is not old_handler
+        assert warmer.status()["warm_set"] == 1
+        await warmer.stop()
+
+    asyncio.run(run_warmer())
+    assert warmer.status()["state"] == "stopped"
+    executor.shutdown()
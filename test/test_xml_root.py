@@ -1,6 +1,12 @@
+import gzip
+import lzma
 import pytest
+import lxml.etree as ET
+import xml_parser_settings as settings
 from xml_parser_exceptions import XmlConfigurationLoadError
-from config_handler import XMLRoot
+import config_handler
+from config_handler import XMLRoot, get_content_size
+from xml_parser_cache import ConfigCache, read_config_source
 from pathlib import Path
 from lxml.etree import _ElementTree
 
@@ -21,3 +27,69 @@ def test_get_xml_root_exceptions(input_xml_file):
 def test_get_xml_root(input_xml_file):
     xml_root = XMLRoot(input_xml_file).get_xml_root()
     assert isinstance(xml_root, _ElementTree)
+
+
+@pytest.mark.parametrize("suffix, compress", [(".gz", gzip.compress), (".xz", lzma.compress)])
+def test_compressed_config(tmp_path, suffix, compress):
+    config_file: Path = tmp_path / f"r1.xml{suffix}"
+    config_file.write_bytes(compress(good_config_1.read_bytes()))
+    assert XMLRoot.read_config_file(config_file) == good_config_1.read_bytes()
+    xml_root = XMLRoot(config_file).xml_root
+    assert ET.tostring(xml_root) == ET.tostring(XMLRoot(good_config_1).xml_root)
+    config_file.write_bytes(compress(good_config_1.read_bytes())[:100])
+    with pytest.raises(XmlConfigurationLoadError):
+        XMLRoot(config_file).get_xml_root()
+    with pytest.raises(XmlConfigurationLoadError):
+        XMLRoot.read_config_file(config_file)
+
+
+def test_tuned_parser():
+    xml_root = XMLRoot(good_config_1).xml_root
+    # Indentation between elements is not kept, values of the leaves are
+    assert xml_root.getroot().text is None
+    assert xml_root.xpath("//*[local-name()='system']/*[local-name()='name']/text()") == ["SR2"]
+
+
+def test_read_config_file_mmap(monkeypatch):
+    monkeypatch.setattr(settings, "PARSE_MMAP", True)
+    content = XMLRoot.read_config_file(good_config_1)
+    assert not isinstance(content, bytes)
+    assert content[:] == good_config_1.read_bytes()
+    assert ET.tostring(XMLRoot(good_config_1, content).xml_root) == ET.tostring(XMLRoot(good_config_1).xml_root)
+    content.close()
+
+
+def test_parse_mapped_content(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PARSE_MMAP", True)
+    # Content is fed to the parser by several chunks
+    monkeypatch.setattr(config_handler, "FEED_CHUNK_SIZE", 100)
+    config_file: Path = tmp_path / "r1.xml"
+    config_file.write_bytes(good_config_1.read_bytes())
+    signature, content = read_config_source(config_file)
+    config_cache = ConfigCache(max_entries=2, max_memory=0, memory_factor=1)
+    config_handler_1 = config_cache.load_config_handler(config_file, signature, content)
+    assert content.closed
+    assert ET.tostring(config_handler_1.xml_root) == ET.tostring(XMLRoot(good_config_1).xml_root)
+    # Broken document does not break the parser reused by the thread
+    config_file.write_bytes(rigged_config_2.read_bytes())
+    content = XMLRoot.read_config_file(config_file)
+    with pytest.raises(XmlConfigurationLoadError):
+        XMLRoot(config_file, content)
+    content.close()
+    # Closed memory map and unicode string with encoding declaration are rejected by lxml with ValueError
+    with pytest.raises(XmlConfigurationLoadError):
+        XMLRoot(config_file, content)
+    with pytest.raises(XmlConfigurationLoadError):
+        XMLRoot(config_file, '<?xml version="1.0" encoding="UTF-8"?><configure/>')
+    config_file.write_bytes(good_config_1.read_bytes())
+    signature, content = read_config_source(config_file)
+    assert config_cache.load_config_handler(config_file, signature, content).xml_root.getroot() is not None
+
+
+@pytest.mark.parametrize("suffix, compress", [("", bytes), (".gz", gzip.compress), (".xz", lzma.compress),
+                                              (".xz", lambda data: lzma.compress(data, format=lzma.FORMAT_ALONE))])
+def test_get_content_size(tmp_path, suffix, compress):
+    config_file: Path = tmp_path / f"r1.xml{suffix}"
+    config_file.write_bytes(compress(good_config_1.read_bytes()))
+    assert get_content_size(config_file) == good_config_1.stat().st_size
+    assert XMLRoot(config_file).content_size == good_config_1.stat().st_size
@@ -0,0 +1,127 @@
+import re
+import threading
+from bisect import bisect_left
+from typing import Callable
+
+from lxml.etree import _Element
+from xml_parser_helpers import LRUCache
+
+REGEX_SPECIAL_CHARS: frozenset = frozenset(".^$*+?{}[]\\|()")
+# Maximum number of indexed filters of a single configuration
+VALUE_INDEX_MAX_FILTERS: int = 1024
+
+
+def is_literal(pattern: str) -> bool:
+    """
+    Check if regex matches only the pattern itself
+    :param pattern: Regex
+    :return: True if the regex has no special characters
+    """
+    return not REGEX_SPECIAL_CHARS.intersection(pattern)
+
+
+def get_literal_prefix(pattern: str) -> str:
+    """
+    Get literal prefix of the regex anchored to the start of the string
+    :param pattern: Regex
+    :return: Prefix every matching string starts with, empty if the regex is not anchored
+    """
+    if not pattern.startswith("^") or "|" in pattern:
+        return ""
+    prefix: str = ""
+    for char in pattern[1:]:
+        if char in REGEX_SPECIAL_CHARS:
+            # Quantifier makes the preceding character optional
+            return prefix[:-1] if char in "*?{" else prefix
+        prefix += char
+    return prefix
+
+
+def has_fast_path(pattern: str) -> bool:
+    """
+    Check if values matching the regex are found without testing every distinct value
+    :param pattern: Regex of the filter
+    :return: True for exact match, literal prefix or literal substring
+    """
+    return bool(get_literal_prefix(pattern)) or (is_literal(pattern) and bool(pattern))
+
+
+class PathValues:
+    """
+    Values of a filter of the elements on the same path of the configuration:
+    value (string tested by the re:match filter) -> positions of the elements in document order
+    """
+
+    def __init__(self, elements: list[_Element], values: list[str]):
+        self.elements: list[_Element] = elements
+        self.positions: dict[str, list[int]] = dict()
+        for position, value in enumerate(values):
+            self.positions.setdefault(value, list()).append(position)
+        self.sorted_values: list[str] = sorted(self.positions)
+
+    def get_matching_values(self, pattern: str) -> list[str]:
+        """
+        Get distinct values matching the regex: exact and literal prefix lookups in sorted values,
+        literal substring search, or regex search over all distinct values
+        :param pattern: Regex of the filter
+        :return: List of values
+        """
+        regex: re.Pattern = re.compile(pattern)
+        if pattern.startswith("^") and pattern.endswith("$") and is_literal(pattern[1:-1]):
+            # "$" also matches before the trailing newline
+            return [value for value in (pattern[1:-1], pattern[1:-1] + "\n") if value in self.positions]
+        prefix: str = get_literal_prefix(pattern)
+        if prefix:
+            matching_values: list[str] = list()
+            for value in self.sorted_values[bisect_left(self.sorted_values, prefix):]:
+                if not value.startswith(prefix):
+                    break
+                if regex.search(value):
+                    matching_values.append(value)
+            return matching_values
+        if is_literal(pattern):
+            return [value for value in self.sorted_values if pattern in value]
+        return [value for value in self.sorted_values if regex.search(value)]
+
+    def find(self, pattern: str) -> list[_Element]:
+        """
+        Get elements whose value matches the regex
+        :param pattern: Regex of the filter
+        :return: List of elements in document order
+        """
+        positions: list[int] = sorted(position for value in self.get_matching_values(pattern)
+                                      for position in self.positions[value])
+        return [self.elements[position] for position in positions]
+
+
+class ValueIndex:
+    """
+    Inverted index of the filter values of a parsed configuration, built on the first query to a filter:
+    (path of the elements, filter path) -> PathValues.
+    Index is bounded by the total number of indexed elements (0 means no limit), values of the least recently used
+    filters are dropped first. Filters of more elements than the whole limit are not indexed
+    """
+
+    def __init__(self, max_elements: int = 0):
+        self.paths: LRUCache = LRUCache(max_entries=VALUE_INDEX_MAX_FILTERS, max_weight=max_elements)
+        self.unindexed: set[tuple[str, str]] = set()
+        self.lock: threading.Lock = threading.Lock()
+
+    def get_path_values(self, element_path: str, filter_path: str,
+                        build: Callable[[str, str], PathValues]) -> PathValues | None:
+        """
+        Get values of the filter, build them on the first use
+        :param element_path: Path of the elements the filter is applied to
+        :param filter_path: Path of the filter relative to the elements
+        :param build: Function building values of the filter
+        :return: PathValues object or None if the filter is not indexed
+        """
+        with self.lock:
+            if (element_path, filter_path) in self.unindexed:
+                return None
+            path_values: PathValues | None = self.paths.get((element_path, filter_path))
+            if path_values is None:
+                path_values = build(element_path, filter_path)
+                if not self.paths.put((element_path, filter_path), path_values, weight=len(path_values.elements)):
+                    self.unindexed.add((element_path, filter_path))
+            return path_values
@@ -0,0 +1,396 @@
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Iterator
+
+from config_handler import XMLRoot, ConfigHandler, close_config_content
+from indexed_handler import ConfigIndex, IndexedConfigHandler, open_config_index, save_config_index, get_content_hash
+from xml_parser_exceptions import ExecutorSaturatedError, XmlConfigurationLoadError
+from xml_parser_executor import BoundedExecutor, parse_executor
+from xml_parser_helpers import LRUCache
+import xml_parser_dc as dc
+import xml_parser_settings as settings
+
+
+def get_file_signature(config_file: Path) -> tuple[int, int, int] | None:
+    """
+    Get version of the file on the disk
+    :param config_file: Path to the file
+    :return: Tuple (mtime in ns, size, inode) or None if file does not exist
+    """
+    try:
+        file_stat: os.stat_result = config_file.stat()
+    except OSError:
+        return None
+    return file_stat.st_mtime_ns, file_stat.st_size, file_stat.st_ino
+
+
+def read_config_source(config_file: Path) -> tuple[tuple[int, int, int], bytes]:
+    """
+    Read configuration file without parsing, alongside with its version
+    :param config_file: Path to the configuration file
+    :return: Tuple (version of the file, raw content of the file)
+    """
+    signature: tuple[int, int, int] | None = get_file_signature(config_file)
+    content: bytes = XMLRoot.read_config_file(config_file)
+    return signature, content
+
+
+@dataclass
+class CachedConfig:
+    signature: tuple[int, int, int]
+    config_handler: ConfigHandler
+
+
+class ConfigCache(LRUCache):
+    """
+    Cache of parsed configurations, shared across requests.
+    Entry is invalidated once mtime, size or inode of the configuration file changes.
+    With index_dir every parsed configuration is saved as an index, which is loaded instead of parsing
+    the file again (e.g. after restart) until the content of the file changes. With background_executor
+    the index is written in the background, the loaded index answers the first queries while the configuration
+    is parsed in the background, then the parsed tree replaces the index. Queries the index cannot answer parse
+    the configuration in background_executor as well
+    """
+
+    def __init__(self, max_entries: int, max_memory: int, memory_factor: int, index_dir: Path | None = None,
+                 background_executor: BoundedExecutor | None = None):
+        super().__init__(max_entries, max_memory)
+        self.memory_factor: int = memory_factor
+        self.index_dir: Path | None = index_dir
+        self.background_executor: BoundedExecutor | None = background_executor
+        self.invalidations: int = 0
+        self.index_loads: int = 0
+        self.index_replacements: int = 0
+        # Key -> (loading lock, number of requests holding or waiting for the lock)
+        self.loading_locks: dict[str, tuple[threading.Lock, int]] = dict()
+
+    def get_config_handler(self, config_file: Path) -> ConfigHandler:
+        """
+        Get parsed configuration from the cache, (re)parse the file if it is not cached or changed
+        :param config_file: Path to the configuration file
+        :return: ConfigHandler object of the parsed configuration
+        """
+        key: str = os.path.abspath(config_file)
+        config_handler: ConfigHandler | None = self.lookup(key, config_file)
+        if config_handler:
+            return config_handler
+        with self.loading(key):
+            signature: tuple[int, int, int] | None = get_file_signature(config_file)
+            config_handler = self.get_loaded(key, signature)
+            if config_handler:
+                return config_handler
+            if self.index_dir is None:
+                xml_root: XMLRoot = XMLRoot(config_file)
+                return self.store(key, signature, ConfigHandler(xml_root.xml_root),
+                                  weight=xml_root.content_size * self.memory_factor)
+            config_handler = self.open_index(config_file, signature)
+            if config_handler:
+                return config_handler
+            signature, content = read_config_source(config_file)
+            try:
+                return self.parse_content(config_file, signature, content)
+            finally:
+                close_config_content(content)
+
+    @contextmanager
+    def loading(self, key: str) -> Iterator[None]:
+        """
+        Hold the loading lock of the configuration: concurrent requests to the same configuration wait for a single
+        load instead of parsing it in parallel. Outdated entry is kept until the new version replaces it,
+        it is removed if the new version could not be loaded
+        :param key: Key of the entry
+        """
+        with self.lock:
+            loading_lock, waiters = self.loading_locks.get(key) or (threading.Lock(), 0)
+            self.loading_locks[key] = (loading_lock, waiters + 1)
+        try:
+            with loading_lock:
+                try:
+                    yield
+                except XmlConfigurationLoadError:
+                    with self.lock:
+                        if self.pop(key) is not None:
+                            self.invalidations += 1
+                    raise
+        finally:
+            # Lock is dropped by the last waiter, so later requests cannot load the configuration in parallel
+            # with the ones still waiting
+            with self.lock:
+                loading_lock, waiters = self.loading_locks[key]
+                if waiters > 1:
+                    self.loading_locks[key] = (loading_lock, waiters - 1)
+                else:
+                    del self.loading_locks[key]
+
+    def get_loaded(self, key: str, signature: tuple[int, int, int] | None) -> ConfigHandler | None:
+        """
+        Get configuration loaded by a concurrent request, while the loading lock was awaited
+        :param key: Key of the entry
+        :param signature: Version of the configuration file
+        :return: ConfigHandler object or None if the version is not loaded
+        """
+        with self.lock:
+            entry: CachedConfig | None = self.entries.get(key, (None,))[0]
+        return entry.config_handler if entry and entry.signature == signature else None
+
+    def lookup_file(self, config_file: Path) -> ConfigHandler | None:
+        """
+        Get parsed configuration if it is cached and still matches the file on the disk, without parsing
+        :param config_file: Path to the configuration file
+        :return: ConfigHandler object or None
+        """
+        return self.lookup(os.path.abspath(config_file), config_file)
+
+    def load_config_handler(self, config_file: Path, signature: tuple[int, int, int], content: bytes) -> ConfigHandler:
+        """
+        Parse already read configuration and store it in the cache, unless the same version is loaded meanwhile
+        :param config_file: Path to the configuration file
+        :param signature: Version of the file the content is read from
+        :param content: Raw content of the file, it is closed once parsed
+        :return: ConfigHandler object of the parsed configuration
+        """
+        key: str = os.path.abspath(config_file)
+        try:
+            with self.loading(key):
+                return self.get_loaded(key, signature) or self.parse_content(config_file, signature, content)
+        finally:
+            close_config_content(content)
+
+    def parse_content(self, config_file: Path, signature: tuple[int, int, int], content: bytes) -> ConfigHandler:
+        """
+        Parse already read configuration (or load its index, if it is saved for the same content)
+        and store it in the cache
+        :param config_file: Path to the configuration file
+        :param signature: Version of the file the content is read from
+        :param content: Raw content of the file
+        :return: ConfigHandler object of the parsed configuration
+        """
+        if self.index_dir is not None:
+            config_index: ConfigIndex | None = open_config_index(self.index_dir, config_file, signature, content)
+            if config_index is not None:
+                return self.store_index(config_file, signature, config_index)
+        config_handler = ConfigHandler(XMLRoot(config_file, content).xml_root)
+        if self.index_dir is not None:
+            self.save_index(config_file, signature, get_content_hash(content), config_handler)
+        return self.store(os.path.abspath(config_file), signature, config_handler,
+                          weight=len(content) * self.memory_factor)
+
+    def save_index(self, config_file: Path, signature: tuple[int, int, int], content_hash: str,
+                   config_handler: ConfigHandler) -> None:
+        """
+        Save index of the parsed configuration. With background_executor the index is written in the background,
+        so the query which parsed the configuration does not wait for it
+        :param config_file: Path to the configuration file
+        :param signature: Version of the configuration file
+        :param content_hash: Hash of the raw content of the configuration file
+        :param config_handler: ConfigHandler object of the parsed configuration
+        """
+        if self.background_executor is None:
+            save_config_index(self.index_dir, config_file, signature, content_hash, config_handler.xml_root.getroot())
+            return
+        try:
+            self.background_executor.submit(save_config_index, self.index_dir, config_file, signature, content_hash,
+                                            config_handler.xml_root.getroot(), in_caller_context=False)
+        except ExecutorSaturatedError:
+            # Parse pool is busy with API calls, the index is saved the next time the configuration is parsed
+            pass
+
+    def load_index(self, config_file: Path) -> ConfigHandler | None:
+        """
+        Load index of the configuration file, if it is saved for the current version of the file
+        :param config_file: Path to the configuration file
+        :return: IndexedConfigHandler object (or configuration loaded meanwhile), None if there is no valid index
+        """
+        if self.index_dir is None:
+            return None
+        key: str = os.path.abspath(config_file)
+        with self.loading(key):
+            signature: tuple[int, int, int] | None = get_file_signature(config_file)
+            return self.get_loaded(key, signature) or self.open_index(config_file, signature)
+
+    def open_index(self, config_file: Path, signature: tuple[int, int, int] | None) -> ConfigHandler | None:
+        """
+        Open index of the configuration file and store it in the cache
+        :param config_file: Path to the configuration file
+        :param signature: Version of the configuration file
+        :return: IndexedConfigHandler object or None if there is no valid index
+        """
+        config_index: ConfigIndex | None = open_config_index(self.index_dir, config_file, signature)
+        if config_index is None:
+            return None
+        return self.store_index(config_file, signature, config_index)
+
+    def store_index(self, config_file: Path, signature: tuple[int, int, int],
+                    config_index: ConfigIndex) -> ConfigHandler:
+        """
+        Store configuration answered from the index in the cache, weight of the entry is the size of the index
+        :param config_file: Path to the configuration file
+        :param signature: Version of the configuration file
+        :param config_index: Index of the configuration
+        :return: IndexedConfigHandler object
+        """
+        with self.lock:
+            self.index_loads += 1
+        index_handler: IndexedConfigHandler = IndexedConfigHandler(
+            config_file, config_index, load_tree=partial(self.load_tree_handler, config_file, signature))
+        config_handler: ConfigHandler = self.store(os.path.abspath(config_file), signature, index_handler,
+                                                   weight=config_index.size)
+        if self.background_executor is not None:
+            try:
+                self.background_executor.submit(self.replace_index_handler, config_file, signature, config_handler,
+                                                in_caller_context=False)
+            except ExecutorSaturatedError:
+                # Parse pool is busy with API calls, the index keeps answering the queries
+                pass
+        return config_handler
+
+    def load_tree_handler(self, config_file: Path, signature: tuple[int, int, int],
+                          index_handler: ConfigHandler) -> ConfigHandler:
+        """
+        Parse configuration answered from the index for the queries the index cannot answer. The configuration
+        is parsed in background_executor (ExecutorSaturatedError is raised if it is busy) and the parsed tree
+        replaces the index in the cache, so the memory of the tree is counted in the weight of the entry
+        :param config_file: Path to the configuration file
+        :param signature: Version of the configuration file the index is loaded for
+        :param index_handler: IndexedConfigHandler object the query is run on
+        :return: ConfigHandler object of the parsed configuration
+        """
+        if self.background_executor is None:
+            return self.replace_index_handler(config_file, signature, index_handler)
+        return self.background_executor.submit(self.replace_index_handler, config_file, signature,
+                                               index_handler).result()
+
+    def replace_index_handler(self, config_file: Path, signature: tuple[int, int, int],
+                              index_handler: ConfigHandler) -> ConfigHandler:
+        """
+        Parse configuration answered from the index and replace the index with the parsed tree in a single cache
+        update, queries in flight keep the index they started with. Nothing is replaced if the file or the cached
+        entry is changed meanwhile
+        :param config_file: Path to the configuration file
+        :param signature: Version of the configuration file the index is loaded for
+        :param index_handler: IndexedConfigHandler object stored in the cache
+        :return: ConfigHandler object of the parsed configuration, the cached one if the index is already replaced
+        """
+        key: str = os.path.abspath(config_file)
+        loaded_handler: ConfigHandler | None = self.get_loaded(key, signature)
+        if loaded_handler is not None and loaded_handler is not index_handler:
+            return loaded_handler
+        xml_root: XMLRoot = XMLRoot(config_file)
+        config_handler: ConfigHandler = ConfigHandler(xml_root.xml_root)
+        if get_file_signature(config_file) != signature:
+            return config_handler
+        with self.lock:
+            entry: CachedConfig | None = self.entries.get(key, (None,))[0]
+            if entry is None or entry.config_handler is not index_handler:
+                return config_handler
+            self.store(key, signature, config_handler, weight=xml_root.content_size * self.memory_factor)
+            self.index_replacements += 1
+        return config_handler
+
+    def store(self, key: str, signature: tuple[int, int, int], config_handler: ConfigHandler,
+              weight: int) -> ConfigHandler:
+        """
+        Store parsed configuration in the cache
+        :param key: Key of the entry
+        :param signature: Version of the parsed file
+        :param config_handler: ConfigHandler object of the parsed configuration
+        :param weight: Approximate memory used by the configuration: size of the decompressed document
+        multiplied by memory_factor, or size of the index
+        :return: The same ConfigHandler object
+        """
+        with self.lock:
+            entry: CachedConfig | None = self.entries.get(key, (None,))[0]
+            if entry and entry.signature != signature:
+                self.invalidations += 1
+            # Outdated entry is replaced in a single update, queries in flight keep the configuration they started with
+            self.put(key, CachedConfig(signature, config_handler), weight=weight)
+        return config_handler
+
+    def lookup(self, key: str, config_file: Path) -> ConfigHandler | None:
+        """
+        Get parsed configuration if it is cached and still matches the file on the disk
+        :param key: Key of the entry
+        :param config_file: Path to the configuration file
+        :return: ConfigHandler object or None
+        """
+        entry: CachedConfig | None = self.get(key)
+        if entry is None:
+            return None
+        if entry.signature == get_file_signature(config_file):
+            return entry.config_handler
+        with self.lock:
+            # Lookup is already counted as a hit, file change turns it into a miss.
+            # Outdated entry is kept until the new version is loaded
+            self.hits -= 1
+            self.misses += 1
+        return None
+
+    def clear(self) -> None:
+        with self.lock:
+            super().clear()
+            self.invalidations = 0
+            self.index_loads = 0
+            self.index_replacements = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {**super().stats(), "invalidations": self.invalidations, "index_loads": self.index_loads,
+                    "index_replacements": self.index_replacements}
+
+
+def get_query_key(parsed_xpath: list[dc.PathElement]) -> tuple:
+    """
+    Get canonical form of the parsed query
+    :param parsed_xpath: Parsed representation of XPATH
+    :return: Tuple of element names and filters, equal for the queries with the same elements and filters
+    """
+    return tuple((path_element.name, tuple((fltr.filter_path, fltr.regexp, fltr.is_a_path)
+                                           for fltr in path_element.filters))
+                 for path_element in parsed_xpath)
+
+
+class QueryResultCache(LRUCache):
+    """
+    Cache of query results per device, keyed by the query and version of the configuration file.
+    Weight of the entry is the number of result items
+    """
+
+    def get_result(self, query_key: tuple, config_file: Path,
+                   signature: tuple[int, int, int] | None) -> list[list[dc.ResultItem]] | None:
+        """
+        Get result of the query to the version of the configuration file
+        :param query_key: Canonical form of the query
+        :param config_file: Path to the configuration file
+        :param signature: Version of the configuration file
+        :return: Result of the query or None if it is not cached
+        """
+        if signature is None:
+            return None
+        return self.get((query_key, os.path.abspath(config_file), signature))
+
+    def put_result(self, query_key: tuple, config_file: Path, signature: tuple[int, int, int] | None,
+                   result: list[list[dc.ResultItem]]) -> None:
+        """
+        Store result of the query to the version of the configuration file
+        :param query_key: Canonical form of the query
+        :param config_file: Path to the configuration file
+        :param signature: Version of the configuration file the query is run on
+        :param result: Result of the query
+        """
+        if signature is None:
+            return
+        self.put((query_key, os.path.abspath(config_file), signature), result,
+                 weight=1 + sum(len(result_items) for result_items in result))
+
+
+config_cache: ConfigCache = ConfigCache(max_entries=settings.CONFIG_CACHE_MAX_ENTRIES,
+                                        max_memory=settings.CONFIG_CACHE_MAX_MEMORY_MB * 1024 * 1024,
+                                        memory_factor=settings.CONFIG_CACHE_MEMORY_FACTOR,
+                                        index_dir=Path(settings.INDEX_DIR) if settings.INDEX_DIR else None,
+                                        background_executor=parse_executor)
+result_cache: QueryResultCache = QueryResultCache(max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+                                                  max_weight=settings.RESULT_CACHE_MAX_ITEMS)
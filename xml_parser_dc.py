@@ -1,12 +1,12 @@
 from dataclasses import dataclass, field
-from typing import Any, Optional
-import pydantic
-from pydantic import BaseModel, root_validator, validator
+from typing import Any
+from pydantic import BaseModel, validator
 from xml_parser_exceptions import IncorrectXmlParserApiRequest
 
 
-class FilterElement(BaseModel):
+class FilterModel(BaseModel):
     """
+    Filter of the API request, validated once per request and converted to FilterElement.
     For example:
     1. filter_path: user-profile-parent/user-profile-child
     /profile[re:match(user-profile-parent/user-profile-child, "regex")]
@@ -15,8 +15,6 @@ class FilterElement(BaseModel):
     filter_path: str
     regexp: str
     is_a_path: bool = True
-    indexed_query: str | None
-    unindexed_path: str | None
 
     def __init__(self, **values: dict[str]):
         super().__init__(**values)
@@ -33,22 +31,94 @@ class FilterElement(BaseModel):
     def validate_filter_path(cls, value: str) -> str:
         return value.strip() or "text()"
 
+    def to_element(self) -> "FilterElement":
+        return FilterElement(filter_path=self.filter_path, regexp=self.regexp, is_a_path=self.is_a_path)
 
-class PathElement(BaseModel):
+
+class PathModel(BaseModel):
+    """
+    Element of XPATH of the API request, name is validated once per request and copied to PathElement
+    """
     name: str
-    sibling_id: int | None
-    filters: list[FilterElement] = list()
-    indexed_path: str | None
 
     @validator("name")
     @classmethod
-    def validate_name(cls, value: str | None) -> str:
+    def validate_name(cls, value: str) -> str:
+        value = value.strip()
         if not value:
             raise IncorrectXmlParserApiRequest(f"Name of the element in the XPATH is not provided")
         return value
 
 
-class ResultItem(BaseModel):
+# Internal structures of the query pipeline, created per match without validation
+
+
+@dataclass(slots=True)
+class FilterElement:
+    filter_path: str
+    regexp: str
+    is_a_path: bool = True
+    indexed_query: str | None = None
+    unindexed_path: str | None = None
+
+
+@dataclass(slots=True)
+class PathElement:
+    name: str
+    sibling_id: int | None = None
+    filters: list[FilterElement] = field(default_factory=list)
+    indexed_path: str | None = None
+
+
+@dataclass(slots=True)
+class ResultItem:
     path_attribute: str = ""
     value: Any = None
 
+
+@dataclass(slots=True)
+class ChangedItem:
+    path_attribute: str = ""
+    before: Any = None
+    after: Any = None
+
+
+@dataclass(slots=True)
+class ResultChange:
+    key: list[ResultItem] = field(default_factory=list)
+    changes: list[ChangedItem] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class ResultDiff:
+    added: list[list[ResultItem]] = field(default_factory=list)
+    removed: list[list[ResultItem]] = field(default_factory=list)
+    changed: list[ResultChange] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class PredicatePlan:
+    filter_path: str
+    regexp: str
+    strategy: str
+    expression: str
+    cost: float = 0.0
+    selectivity: float = 1.0
+
+
+@dataclass(slots=True)
+class StepPlan:
+    name: str
+    sibling_id: int | None = None
+    predicates: list[PredicatePlan] = field(default_factory=list)
+    dropped_filters: list[str] = field(default_factory=list)
+    candidates: int | None = None
+    cost: float = 0.0
+
+
+@dataclass(slots=True)
+class QueryPlan:
+    xpath: str
+    steps: list[StepPlan] = field(default_factory=list)
+    engine: str = "xpath"
+    estimated_cost: float = 0.0
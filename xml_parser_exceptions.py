@@ -15,3 +15,17 @@ class IncorrectXmlParserApiRequest(Exception):
     - Wrong attributes in the input request
     """
     pass
+
+
+class DeviceQueryTimeoutError(Exception):
+    """
+    Exception for handling query to a device which is not finished in time
+    """
+    pass
+
+
+class ExecutorSaturatedError(Exception):
+    """
+    Exception for handling a task rejected by a pool of workers, as the queue of the pool is full
+    """
+    pass
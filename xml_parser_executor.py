@@ -0,0 +1,221 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from xml_parser_exceptions import DeviceQueryTimeoutError, ExecutorSaturatedError
+from xml_parser_metrics import record_stage_times, run_with_stage_times
+import xml_parser_settings as settings
+
+
+class BoundedExecutor:
+    """
+    Pool of threads or processes awaited from the event loop:
+    - max_workers: size of the pool
+    - max_pending: maximum number of submitted and not finished tasks, 0 means no limit.
+    Once the limit is reached new tasks are rejected with ExecutorSaturatedError instead of queueing them
+    """
+
+    def __init__(self, max_workers: int, use_processes: bool = False, max_pending: int = 0,
+                 thread_name_prefix: str = "xml_parser"):
+        self.max_workers: int = max_workers
+        self.use_processes: bool = use_processes
+        self.max_pending: int = max_pending
+        self.thread_name_prefix: str = thread_name_prefix
+        self.pending: int = 0
+        self.rejected: int = 0
+        self.executor: Executor | None = None
+        self.lock: threading.Lock = threading.Lock()
+
+    def get_executor(self) -> Executor:
+        """
+        Start the pool on the first use
+        :return: Pool of threads or processes
+        """
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers) if self.use_processes \
+                    else ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.thread_name_prefix)
+            return self.executor
+
+    def release(self, _: Future | None) -> None:
+        """
+        Free the slot of a finished task
+        """
+        with self.lock:
+            self.pending -= 1
+
+    def submit(self, func: Callable, *args: Any, in_caller_context: bool = True) -> Future:
+        """
+        Submit func(*args) to the pool, within the limit of pending tasks
+        :param func: Function to run
+        :param args: Arguments of the function
+        :param in_caller_context: Run the function in the context of the caller, e.g. with timings of the current
+        API call. Background tasks outliving the caller run in an empty context
+        :return: Future of the result
+        """
+        executor: Executor = self.get_executor()
+        with self.lock:
+            if self.max_pending and self.pending >= self.max_pending:
+                self.rejected += 1
+                raise ExecutorSaturatedError(f'All {self.max_pending} slots of the "{self.thread_name_prefix}" pool '
+                                             f'are busy')
+            self.pending += 1
+        try:
+            context: contextvars.Context = contextvars.copy_context() if in_caller_context else contextvars.Context()
+            future: Future = executor.submit(func, *args) if self.use_processes \
+                else executor.submit(context.run, func, *args)
+        except BaseException:
+            self.release(None)
+            raise
+        future.add_done_callback(self.release)
+        return future
+
+    async def run(self, func: Callable, *args: Any) -> Any:
+        """
+        Run func(*args) in the pool without blocking the event loop
+        :param func: Function to run
+        :param args: Arguments of the function
+        :return: Result of the function
+        """
+        if not self.use_processes:
+            return await asyncio.wrap_future(self.submit(func, *args))
+        result, stage_times = await asyncio.wrap_future(self.submit(run_with_stage_times, func, *args))
+        record_stage_times(stage_times)
+        return result
+
+    def stats(self) -> dict:
+        """
+        Get pool counters
+        :return: Dictionary with pool counters
+        """
+        with self.lock:
+            return {"max_workers": self.max_workers, "max_pending": self.max_pending, "pending": self.pending,
+                    "rejected": self.rejected}
+
+    def shutdown(self) -> None:
+        """
+        Stop the pool, it is started again on the next use
+        """
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+
+
+class DeviceQueryLimiter:
+    """
+    Limits of a single API call to several devices:
+    - device_timeout: time (in seconds) given to a single device, 0 means no limit
+    - max_concurrency: maximum number of devices processed at the same time, 0 means no limit
+    """
+
+    def __init__(self, device_timeout: float = 0, max_concurrency: int = 0):
+        self.device_timeout: float = device_timeout
+        self.max_concurrency: int = max_concurrency
+
+    def create_tasks(self, device_query: Callable[[str], Awaitable], device_list: list[str]) -> list[asyncio.Task]:
+        """
+        Start a query to every device, within the limits
+        :param device_query: Coroutine function processing a query to a single device by its name
+        :param device_list: List of devices
+        :return: List of tasks in the order of the device list
+        """
+        semaphore: asyncio.Semaphore | None = asyncio.Semaphore(self.max_concurrency) if self.max_concurrency \
+            else None
+
+        async def run_limited(device_name: str) -> Any:
+            if semaphore is None:
+                return await self.run_with_timeout(device_query, device_name)
+            async with semaphore:
+                return await self.run_with_timeout(device_query, device_name)
+
+        return [asyncio.ensure_future(run_limited(device_name)) for device_name in device_list]
+
+    async def run_with_timeout(self, device_query: Callable[[str], Awaitable], device_name: str) -> Any:
+        """
+        Run query to a single device within the time limit
+        :param device_query: Coroutine function processing a query to a single device by its name
+        :param device_name: Hostname of a device
+        :return: Result of the query
+        """
+        try:
+            return await asyncio.wait_for(device_query(device_name), timeout=self.device_timeout or None)
+        except asyncio.TimeoutError:
+            raise DeviceQueryTimeoutError(f'Query to the device "{device_name}" is timed out')
+
+    async def run_device_queries(self, device_query: Callable[[str], Awaitable],
+                                 device_list: list[str]) -> AsyncIterator[tuple[str, Any]]:
+        """
+        Run query to every device and yield results in the order of the device list.
+        Exception raised by a device query (or DeviceQueryTimeoutError) is re-raised when it is the device's turn,
+        queries to the rest of the devices are cancelled
+        :param device_query: Coroutine function processing a query to a single device by its name
+        :param device_list: List of devices
+        :return: Iterator of tuples (device name, result of the query)
+        """
+        tasks: list[asyncio.Task] = self.create_tasks(device_query, device_list)
+        try:
+            for device_name, task in zip(device_list, tasks):
+                yield device_name, await task
+        finally:
+            await self.cancel_tasks(tasks)
+
+    async def run_device_queries_unordered(self, device_query: Callable[[str], Awaitable],
+                                           device_list: list[str]) -> AsyncIterator[tuple[str, Any]]:
+        """
+        Run query to every device and yield results as soon as they are computed.
+        Exception raised by a device query (or DeviceQueryTimeoutError) is yielded instead of the result,
+        queries to the rest of the devices are not affected
+        :param device_query: Coroutine function processing a query to a single device by its name
+        :param device_list: List of devices
+        :return: Iterator of tuples (device name, result of the query or exception)
+        """
+        tasks: list[asyncio.Task] = self.create_tasks(device_query, device_list)
+        task_devices: dict[asyncio.Task, str] = dict(zip(tasks, device_list))
+        try:
+            pending: set[asyncio.Task] = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error: BaseException | None = task.exception()
+                    yield task_devices[task], error if error is not None else task.result()
+        finally:
+            await self.cancel_tasks(tasks)
+
+    @staticmethod
+    async def cancel_tasks(tasks: list[asyncio.Task]) -> None:
+        """
+        Cancel queries which are not finished and wait for them. Exceptions of the failed queries are retrieved,
+        so asyncio does not report them as never retrieved
+        :param tasks: Tasks of the device queries
+        """
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def get_pool_size(max_workers: int) -> int:
+    """
+    Get size of the pool
+    :param max_workers: Size of the pool from the settings, -1 (or any value below 1) means number of CPUs
+    :return: Size of the pool
+    """
+    return max_workers if max_workers > 0 else os.cpu_count() or 1
+
+
+# Worker processes load configurations themselves, so the device pool gets the parse limits in the process mode
+device_executor: BoundedExecutor = BoundedExecutor(
+    max_workers=get_pool_size(settings.EXECUTOR_MAX_WORKERS),
+    use_processes=settings.EXECUTOR_USE_PROCESSES,
+    max_pending=get_pool_size(settings.EXECUTOR_MAX_WORKERS) + settings.PARSE_QUEUE_SIZE
+    if settings.EXECUTOR_USE_PROCESSES else 0)
+parse_executor: BoundedExecutor = BoundedExecutor(
+    max_workers=get_pool_size(settings.PARSE_MAX_WORKERS),
+    max_pending=get_pool_size(settings.PARSE_MAX_WORKERS) + settings.PARSE_QUEUE_SIZE,
+    thread_name_prefix="xml_parser_parse")
+device_limiter: DeviceQueryLimiter = DeviceQueryLimiter(
+    device_timeout=settings.EXECUTOR_DEVICE_TIMEOUT,
+    max_concurrency=settings.EXECUTOR_MAX_CONCURRENCY or get_pool_size(settings.EXECUTOR_MAX_WORKERS))
@@ -1,5 +1,8 @@
 import sys
+import threading
+from collections import OrderedDict
 from pathlib import Path
+from typing import Any, Hashable
 import logging
 from logging import Logger, StreamHandler, Formatter
 
@@ -27,6 +30,98 @@ def create_file_log(end_file_name: str) -> str:
     return str(file_path)
 
 
+class LRUCache:
+    """
+    Thread-safe LRU cache bounded by the number of entries and (optionally) by the total weight of entries.
+    Weight is an arbitrary non-negative number supplied with every entry, e.g. approximate size in bytes
+    """
+
+    def __init__(self, max_entries: int, max_weight: int = 0):
+        self.max_entries: int = max_entries
+        self.max_weight: int = max_weight
+        self.entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self.total_weight: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.lock: threading.RLock = threading.RLock()
+
+    def get(self, key: Hashable) -> Any | None:
+        """
+        Get cached value and mark it as the most recently used
+        :param key: Key of the entry
+        :return: Cached value or None if there is no such entry
+        """
+        with self.lock:
+            entry: tuple[Any, int] | None = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, weight: int = 1) -> bool:
+        """
+        Store value in the cache and evict the least recently used entries if limits are exceeded
+        :param key: Key of the entry
+        :param value: Value to store
+        :param weight: Weight of the entry
+        :return: True if value is stored, False if it is heavier than the whole cache
+        """
+        with self.lock:
+            self.pop(key)
+            if self.max_entries <= 0 or (self.max_weight and weight > self.max_weight):
+                return False
+            self.entries[key] = (value, weight)
+            self.total_weight += weight
+            while len(self.entries) > self.max_entries or (self.max_weight and self.total_weight > self.max_weight):
+                _, (_, evicted_weight) = self.entries.popitem(last=False)
+                self.total_weight -= evicted_weight
+                self.evictions += 1
+            return True
+
+    def pop(self, key: Hashable) -> Any | None:
+        """
+        Remove entry from the cache
+        :param key: Key of the entry
+        :return: Removed value or None if there is no such entry
+        """
+        with self.lock:
+            entry: tuple[Any, int] | None = self.entries.pop(key, None)
+            if entry is None:
+                return None
+            self.total_weight -= entry[1]
+            return entry[0]
+
+    def clear(self) -> None:
+        """
+        Remove all entries and reset counters
+        """
+        with self.lock:
+            self.entries.clear()
+            self.total_weight = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        """
+        Get cache counters
+        :return: Dictionary with cache counters
+        """
+        with self.lock:
+            lookups: int = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "weight": self.total_weight,
+                "max_weight": self.max_weight,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
 # def substitute_namespaces(self, element_tag: str) -> str:
 #     """
 #     Replace namespaces in a tag value returned by LXML with project NSes
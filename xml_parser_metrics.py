@@ -0,0 +1,225 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator
+
+LATENCY_BUCKETS: tuple[float, ...] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                                      10.0, 30.0)
+THROUGHPUT_BUCKETS: tuple[float, ...] = (1e6, 5e6, 1e7, 2.5e7, 5e7, 1e8, 2.5e8, 5e8, 1e9)
+MATCH_BUCKETS: tuple[float, ...] = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+
+
+def format_labels(label_names: tuple[str, ...], label_values: tuple[str, ...], extra: str = "") -> str:
+    """
+    Format labels of a sample in Prometheus text format
+    :param label_names: Names of the labels
+    :param label_values: Values of the labels
+    :param extra: Already formatted additional label, e.g. le="0.5"
+    :return: Formatted labels including braces, empty string if there are no labels
+    """
+    labels: list[str] = [f'{name}="{value}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        labels.append(extra)
+    return f"{{{','.join(labels)}}}" if labels else ""
+
+
+def format_value(value: float) -> str:
+    """
+    Format value of a sample in Prometheus text format
+    :param value: Value of the sample
+    :return: Formatted value, integers without the fractional part
+    """
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels
+    """
+
+    def __init__(self, name: str, description: str, label_names: tuple[str, ...] = ()):
+        self.name: str = name
+        self.description: str = description
+        self.label_names: tuple[str, ...] = label_names
+        self.values: dict[tuple[str, ...], float] = dict()
+        self.lock: threading.Lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values: str) -> None:
+        """
+        Increase the counter
+        :param amount: Non-negative increment
+        :param label_values: Values of the labels in the order of label names
+        """
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        """
+        Render the counter in Prometheus text format
+        :return: List of lines
+        """
+        lines: list[str] = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.label_names, label_values)} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Histogram with cumulative buckets and optional labels
+    """
+
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...], label_names: tuple[str, ...] = ()):
+        self.name: str = name
+        self.description: str = description
+        self.buckets: tuple[float, ...] = buckets
+        self.label_names: tuple[str, ...] = label_names
+        # Labels -> (count of observations per bucket, the last one is +Inf, sum of observations)
+        self.values: dict[tuple[str, ...], tuple[list[int], float]] = dict()
+        self.lock: threading.Lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """
+        Record an observation
+        :param value: Observed value
+        :param label_values: Values of the labels in the order of label names
+        """
+        with self.lock:
+            bucket_counts, total = self.values.get(label_values) or ([0] * (len(self.buckets) + 1), 0.0)
+            bucket_counts[bisect_left(self.buckets, value)] += 1
+            self.values[label_values] = (bucket_counts, total + value)
+
+    def render(self) -> list[str]:
+        """
+        Render the histogram in Prometheus text format
+        :return: List of lines
+        """
+        lines: list[str] = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for label_values, (bucket_counts, total) in sorted(self.values.items()):
+                cumulative: int = 0
+                for upper_bound, bucket_count in zip((*self.buckets, float("inf")), bucket_counts):
+                    cumulative += bucket_count
+                    bucket_labels: str = format_labels(self.label_names, label_values,
+                                                       f'le="{format_value(upper_bound)}"')
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                labels: str = format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class RequestTimings:
+    """
+    Total time of every stage spent by a single API call, across all its devices and worker threads.
+    Every measured stage is also kept to be sent back from a worker process, see run_with_stage_times
+    """
+
+    def __init__(self):
+        self.stages: dict[str, float] = dict()
+        self.observations: list[tuple[str, float]] = list()
+        self.lock: threading.Lock = threading.Lock()
+
+    def add(self, stage: str, elapsed: float) -> None:
+        """
+        Add time of the stage
+        :param stage: Name of the stage
+        :param elapsed: Elapsed time in seconds
+        """
+        with self.lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + elapsed
+            self.observations.append((stage, elapsed))
+
+    def get_header(self, total: float) -> str:
+        """
+        Get value of the Server-Timing header
+        :param total: Total time of the API call in seconds
+        :return: Stages and their durations in milliseconds
+        """
+        with self.lock:
+            metrics: list[str] = [f"{stage};dur={elapsed * 1000:.3f}" for stage, elapsed in self.stages.items()]
+        return ", ".join([*metrics, f"total;dur={total * 1000:.3f}"])
+
+
+STAGE_SECONDS: Histogram = Histogram("xml_parser_stage_seconds", "Time spent in a stage of the query processing",
+                                     LATENCY_BUCKETS, ("stage",))
+DEVICE_QUERY_SECONDS: Histogram = Histogram("xml_parser_device_query_seconds",
+                                            "Latency of a query to a single device", LATENCY_BUCKETS, ("cache",))
+QUERY_MATCHES: Histogram = Histogram("xml_parser_query_matches", "Number of matches of a query to a single device",
+                                     MATCH_BUCKETS)
+PARSE_BYTES: Counter = Counter("xml_parser_parse_bytes_total", "Size of the parsed configurations")
+PARSE_THROUGHPUT: Histogram = Histogram("xml_parser_parse_bytes_per_second", "Parse speed of a configuration",
+                                        THROUGHPUT_BUCKETS)
+METRICS: tuple[Counter | Histogram, ...] = (STAGE_SECONDS, DEVICE_QUERY_SECONDS, QUERY_MATCHES, PARSE_BYTES,
+                                            PARSE_THROUGHPUT)
+
+request_timings: ContextVar[RequestTimings | None] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """
+    Measure time of a stage: it is recorded into the stage histogram and into timings of the current API call
+    :param stage: Name of the stage
+    """
+    start: float = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed: float = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage)
+        timings: RequestTimings | None = request_timings.get()
+        if timings is not None:
+            timings.add(stage, elapsed)
+
+
+def run_with_stage_times(func: Callable, *args: Any) -> tuple[Any, list[tuple[str, float]]]:
+    """
+    Run function in a worker process: metrics of the worker are not rendered by the API server,
+    so times of the stages are returned alongside with the result and recorded by record_stage_times
+    :param func: Function to run
+    :param args: Arguments of the function
+    :return: Tuple (result of the function, list of tuples (stage, elapsed time in seconds))
+    """
+    timings: RequestTimings = RequestTimings()
+    token = request_timings.set(timings)
+    try:
+        return func(*args), timings.observations
+    finally:
+        request_timings.reset(token)
+
+
+def record_stage_times(stage_times: list[tuple[str, float]]) -> None:
+    """
+    Record times of the stages measured in a worker process, as stage_timer does
+    :param stage_times: List of tuples (stage, elapsed time in seconds)
+    """
+    timings: RequestTimings | None = request_timings.get()
+    for stage, elapsed in stage_times:
+        STAGE_SECONDS.observe(elapsed, stage)
+        if timings is not None:
+            timings.add(stage, elapsed)
+
+
+def observe_parse(size: int, elapsed: float) -> None:
+    """
+    Record size and speed of a parsed configuration
+    :param size: Size of the configuration in bytes
+    :param elapsed: Time of parsing in seconds
+    """
+    PARSE_BYTES.inc(size)
+    if elapsed > 0:
+        PARSE_THROUGHPUT.observe(size / elapsed)
+
+
+def render_metrics() -> str:
+    """
+    Render all metrics in Prometheus text format
+    :return: Content of the metrics endpoint
+    """
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
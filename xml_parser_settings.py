@@ -0,0 +1,112 @@
+import os
+
+
+def get_int_setting(name: str, default: int) -> int:
+    """
+    Read integer setting from the environment
+    :param name: Name of an environment variable
+    :param default: Value to use if variable is absent or empty
+    :return: Integer value of the setting
+    """
+    value: str | None = os.environ.get(name)
+    return int(value) if value else default
+
+
+"""
+Process-wide cache of parsed configurations:
+- maximum number of parsed configurations kept in memory
+- approximate memory budget (in MB) for all parsed configurations
+- ratio between in-memory size of the parsed tree and size of the XML file on the disk
+"""
+CONFIG_CACHE_MAX_ENTRIES: int = get_int_setting("XML_PARSER_CONFIG_CACHE_MAX_ENTRIES", 256)
+CONFIG_CACHE_MAX_MEMORY_MB: int = get_int_setting("XML_PARSER_CONFIG_CACHE_MAX_MEMORY_MB", 4096)
+CONFIG_CACHE_MEMORY_FACTOR: int = get_int_setting("XML_PARSER_CONFIG_CACHE_MEMORY_FACTOR", 6)
+
+"""
+Cache of query results per device and version of the configuration file:
+- maximum number of cached results (0 means no cache)
+- maximum number of result items in all cached results
+"""
+RESULT_CACHE_MAX_ENTRIES: int = get_int_setting("XML_PARSER_RESULT_CACHE_MAX_ENTRIES", 4096)
+RESULT_CACHE_MAX_ITEMS: int = get_int_setting("XML_PARSER_RESULT_CACHE_MAX_ITEMS", 1000000)
+
+"""
+Inverted index of filter values in every parsed configuration, built on the first query to a filter:
+queries with exact match, literal prefix or literal substring filters skip elements of the configuration which
+cannot match. Configurations of all devices are still loaded, the index does not skip devices.
+Index of a configuration is limited by the number of indexed elements over all filters (0 means no limit)
+"""
+VALUE_INDEX: bool = os.environ.get("XML_PARSER_VALUE_INDEX", "") in ("1", "true", "yes")
+VALUE_INDEX_MAX_ELEMENTS: int = get_int_setting("XML_PARSER_VALUE_INDEX_MAX_ELEMENTS", 200000)
+
+"""
+Directory for the persistent index of parsed configurations, loaded instead of parsing the configuration
+after restart (empty means no index)
+"""
+INDEX_DIR: str = os.environ.get("XML_PARSER_INDEX_DIR", "")
+
+"""
+Loading of the configurations:
+- parser limits of libxml2 (maximum depth, size of a text node) are lifted for large configurations
+- plain (not compressed) files are memory-mapped instead of reading them into memory. Configuration files must be
+replaced atomically (written to a temporary file and renamed), a file truncated while it is mapped crashes the process
+"""
+PARSE_HUGE_TREE: bool = os.environ.get("XML_PARSER_HUGE_TREE", "1") in ("1", "true", "yes")
+PARSE_MMAP: bool = os.environ.get("XML_PARSER_MMAP", "") in ("1", "true", "yes")
+
+"""
+Cache of compiled XPATH queries (per thread of the API server)
+"""
+XPATH_CACHE_MAX_ENTRIES: int = get_int_setting("XML_PARSER_XPATH_CACHE_MAX_ENTRIES", 1024)
+
+"""
+Parallel execution of queries to the devices of a single API call:
+- pool type: "thread" or "process"
+- size of the pool (-1 means number of CPUs)
+- time limit (in seconds) for a query to a single device (0 means no limit)
+- maximum number of devices of a single API call processed at the same time (0 means size of the pool)
+"""
+EXECUTOR_USE_PROCESSES: bool = os.environ.get("XML_PARSER_EXECUTOR", "thread") == "process"
+EXECUTOR_MAX_WORKERS: int = get_int_setting("XML_PARSER_MAX_WORKERS", -1)
+EXECUTOR_DEVICE_TIMEOUT: int = get_int_setting("XML_PARSER_DEVICE_TIMEOUT", 60)
+EXECUTOR_MAX_CONCURRENCY: int = get_int_setting("XML_PARSER_REQUEST_CONCURRENCY", 0)
+
+"""
+Configurations of this size (in MB) and above are queried with the streaming engine unless the engine
+is set in the API call (0 means to always use the parsed tree)
+"""
+STREAMING_THRESHOLD_MB: int = get_int_setting("XML_PARSER_STREAMING_THRESHOLD_MB", 0)
+
+"""
+Dedicated pool parsing configurations which are not cached yet:
+- size of the pool (-1 means number of CPUs)
+- number of parse tasks waiting for a free worker, API calls above this limit are rejected with code 429
+- delay (in seconds) suggested to the rejected API calls in the Retry-After header
+"""
+PARSE_MAX_WORKERS: int = get_int_setting("XML_PARSER_PARSE_MAX_WORKERS", -1)
+PARSE_QUEUE_SIZE: int = get_int_setting("XML_PARSER_PARSE_QUEUE_SIZE", 16)
+PARSE_RETRY_AFTER: int = get_int_setting("XML_PARSER_PARSE_RETRY_AFTER", 2)
+
+"""
+Directory with configurations of the devices
+"""
+CONFIG_DIR: str = os.environ.get("XML_PARSER_CONFIG_DIR", "configurations")
+
+"""
+Directory with snapshots of the configurations, a subdirectory per snapshot (e.g. archive/2023-08-01).
+Diff queries compare only the configuration directory and the snapshots
+"""
+SNAPSHOT_DIR: str = os.environ.get("XML_PARSER_SNAPSHOT_DIR", "snapshots")
+
+"""
+Warm mode: configurations of the directory are parsed at startup and re-parsed in the background once changed
+(directory is watched for changes). Applies to the thread pool, worker processes keep their own caches
+"""
+WARM_MODE: bool = os.environ.get("XML_PARSER_WARM_MODE", "") in ("1", "true", "yes")
+
+"""
+Server-Timing header with time of every stage (read, parse, xpath, ...) summed over the devices of the API call.
+Streamed (NDJSON) responses are sent before the devices are queried, they have no header.
+Metrics in Prometheus text format are always available on /metrics
+"""
+SERVER_TIMING: bool = os.environ.get("XML_PARSER_SERVER_TIMING", "") in ("1", "true", "yes")
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+
+import watchfiles
+
+from config_handler import is_above_streaming_threshold
+from xml_parser_cache import config_cache
+from xml_parser_executor import BoundedExecutor, parse_executor
+from xml_parser_exceptions import ExecutorSaturatedError, XmlConfigurationLoadError
+from xml_parser_helpers import xml_audit_logger
+import xml_parser_settings as settings
+
+
+class ConfigWarmer:
+    """
+    Warm mode of the configuration cache:
+    - at startup every file of the configuration directory is parsed in the parse pool
+    - then the directory is watched and changed files are re-parsed in the background.
+    New parsed tree replaces the cached one in a single cache update, queries in flight keep the tree they started with.
+    Files at or above STREAMING_THRESHOLD_MB are skipped, they are streamed by the API calls and never kept as a tree
+    """
+
+    def __init__(self, config_dir: Path, executor: BoundedExecutor):
+        self.config_dir: Path = config_dir
+        self.executor: BoundedExecutor = executor
+        self.state: str = "disabled"
+        self.files: int = 0
+        self.loaded: int = 0
+        self.failed: int = 0
+        self.skipped: int = 0
+        self.reloads: int = 0
+        self.removals: int = 0
+        self.startup_time: float | None = None
+        self.warm_keys: set[str] = set()
+        self.stop_event: asyncio.Event | None = None
+        self.task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """
+        Start preloading and watching in the background, API calls are served while the files are parsed
+        """
+        self.stop_event = asyncio.Event()
+        self.task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        """
+        Stop watching the directory
+        """
+        if self.task is None:
+            return
+        self.stop_event.set()
+        # Watcher exits on the stop event, cancelling it would leave the watching thread behind
+        if self.state == "loading":
+            self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+        self.state = "stopped"
+
+    async def run(self) -> None:
+        await self.preload()
+        try:
+            await self.watch()
+        except OSError as err:
+            xml_audit_logger.error(f'Directory "{self.config_dir}" could not be watched: {err}')
+            self.state = "not watching"
+
+    def list_config_files(self) -> list[Path]:
+        """
+        Get configuration files of the directory, except the ones streamed by the API calls
+        :return: List of paths to the configuration files
+        """
+        if not self.config_dir.is_dir():
+            return list()
+        config_files: list[Path] = sorted(config_file for config_file in self.config_dir.iterdir()
+                                          if config_file.is_file())
+        preloaded_files: list[Path] = [config_file for config_file in config_files
+                                       if not is_above_streaming_threshold(config_file)]
+        self.skipped = len(config_files) - len(preloaded_files)
+        return preloaded_files
+
+    async def load(self, config_file: Path) -> bool:
+        """
+        Parse the configuration file in the parse pool and store it in the cache
+        :param config_file: Path to the configuration file
+        :return: True if the file is parsed
+        """
+        while True:
+            try:
+                await self.executor.run(config_cache.get_config_handler, config_file)
+                self.warm_keys.add(os.path.abspath(config_file))
+                return True
+            except ExecutorSaturatedError:
+                # Parse pool is busy with API calls, warm up is not urgent
+                await asyncio.sleep(settings.PARSE_RETRY_AFTER)
+            except XmlConfigurationLoadError:
+                return False
+
+    async def preload(self) -> None:
+        """
+        Parse every configuration file of the directory, as many at a time as there are workers in the parse pool
+        """
+        self.state = "loading"
+        start: float = time.perf_counter()
+        config_files: list[Path] = await asyncio.to_thread(self.list_config_files)
+        self.files = len(config_files)
+        semaphore: asyncio.Semaphore = asyncio.Semaphore(self.executor.max_workers)
+
+        async def load_limited(config_file: Path) -> None:
+            async with semaphore:
+                if await self.load(config_file):
+                    self.loaded += 1
+                else:
+                    self.failed += 1
+
+        await asyncio.gather(*(load_limited(config_file) for config_file in config_files))
+        self.startup_time = time.perf_counter() - start
+        xml_audit_logger.info(f'Warm up of "{self.config_dir}": {self.loaded} configurations are loaded, '
+                              f'{self.failed} failed in {self.startup_time:.1f} s')
+
+    async def watch(self) -> None:
+        """
+        Re-parse changed files and drop removed files from the cache, until the warmer is stopped
+        """
+        self.state = "watching"
+        config_dir: Path = self.config_dir.resolve()
+        async for changes in watchfiles.awatch(self.config_dir, stop_event=self.stop_event):
+            changed_files: dict[Path, watchfiles.Change] = {
+                self.config_dir / Path(path).name: change for change, path in changes
+                if Path(path).parent.resolve() == config_dir}
+            await asyncio.gather(*(self.apply_change(config_file, change)
+                                   for config_file, change in changed_files.items()))
+
+    async def apply_change(self, config_file: Path, change: watchfiles.Change) -> None:
+        """
+        Apply change of a single file to the cache
+        :param config_file: Path to the configuration file
+        :param change: Type of the change
+        """
+        key: str = os.path.abspath(config_file)
+        if change == watchfiles.Change.deleted or not await asyncio.to_thread(config_file.is_file):
+            config_cache.pop(key)
+            self.warm_keys.discard(key)
+            self.removals += 1
+        elif await asyncio.to_thread(is_above_streaming_threshold, config_file):
+            # File has grown above the threshold, the tree of its previous version is dropped
+            config_cache.pop(key)
+            self.warm_keys.discard(key)
+            self.skipped += 1
+        elif await self.load(config_file):
+            self.reloads += 1
+        else:
+            self.failed += 1
+
+    def status(self) -> dict:
+        """
+        Get progress of the warm up and size of the warm set
+        :return: Dictionary with warm mode counters
+        """
+        with config_cache.lock:
+            warm_set: int = sum(1 for key in self.warm_keys if key in config_cache.entries)
+        return {"state": self.state, "config_dir": str(self.config_dir), "files": self.files, "loaded": self.loaded,
+                "failed": self.failed, "skipped": self.skipped, "reloads": self.reloads, "removals": self.removals,
+                "startup_time": self.startup_time, "warm_set": warm_set}
+
+
+config_warmer: ConfigWarmer = ConfigWarmer(Path(settings.CONFIG_DIR), parse_executor)